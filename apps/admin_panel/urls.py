@@ -9,4 +9,6 @@ urlpatterns = [
     path('users/delete/<int:user_id>/', views.delete_user, name='delete_user'),
     path('vulnerabilities/', views.vulnerability_management, name='vulnerability_management'),
     path('processes/', views.process_management, name='process_management'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    path('performance/', views.performance_stats, name='performance_stats'),
 ]
@@ -1,6 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.conf import settings
+from apps.core.caching import dashboard_cache_stats
+from apps.core.profiling import registry
 from .decorators import admin_required
 
 User = get_user_model()
@@ -38,3 +42,20 @@ def vulnerability_management(request):
 
 def process_management(request):
     return render(request, 'admin_panel/dashboard.html', {'title': 'Процессы (в разработке)'})
+
+@admin_required
+def cache_stats(request):
+    """Счетчики попаданий/промахов кеша дашборда"""
+    return JsonResponse({'dashboard': dashboard_cache_stats()})
+
+@admin_required
+def performance_stats(request):
+    """Статистика SQL-запросов и времени ответа по представлениям (POST - сбросить)"""
+    if request.method == 'POST':
+        registry.reset()
+    return JsonResponse({
+        'enabled': settings.RISKMAP_PROFILING,
+        'query_budget': settings.PROFILING_QUERY_BUDGET,
+        'view_budgets': settings.PROFILING_VIEW_BUDGETS,
+        'views': registry.snapshot(),
+    }, json_dumps_params={'ensure_ascii': False, 'indent': 2})
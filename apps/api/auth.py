@@ -0,0 +1,51 @@
+import functools
+from datetime import timedelta
+
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from apps.core import audit
+from .http import error_response
+from .models import ApiToken
+
+# Схемы заголовка Authorization: "Token <ключ>" или "Bearer <ключ>"
+AUTH_SCHEMES = ('token', 'bearer')
+# Время последнего использования обновляется не чаще раза в минуту
+TOKEN_TOUCH_INTERVAL = timedelta(minutes=1)
+
+
+def authenticate(request):
+    """Токен из заголовка Authorization или None"""
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    key = key.strip()
+    if scheme.lower() not in AUTH_SCHEMES or not key:
+        return None
+    token = ApiToken.objects.select_related('user').filter(key_hash=ApiToken.hash_key(key)).first()
+    if token is None or not token.user.is_active:
+        return None
+
+    now = timezone.now()
+    if token.last_used_at is None or now - token.last_used_at > TOKEN_TOUCH_INTERVAL:
+        ApiToken.objects.filter(pk=token.pk).update(last_used_at=now)
+        token.last_used_at = now
+    return token
+
+
+def token_required(view_func):
+    """
+    Доступ к API по токену вместо сессии (поэтому без проверки CSRF).
+    Изменения записываются в журнал от имени владельца токена.
+    """
+    @csrf_exempt
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        token = authenticate(request)
+        if token is None:
+            response = error_response('Требуется действующий токен доступа', status=401)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.user = token.user
+        request.api_token = token
+        with audit.acting_as(token.user):
+            return view_func(request, *args, **kwargs)
+    return wrapper
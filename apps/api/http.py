@@ -0,0 +1,39 @@
+import hashlib
+import json
+
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags, quote_etag
+
+
+def json_response(data, status=200, etag=None):
+    response = JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+def error_response(message, status=400, details=None):
+    data = {'error': message}
+    if details:
+        data['details'] = details
+    return json_response(data, status=status)
+
+
+def make_etag(*parts):
+    """ETag из версии данных (времена изменения строк, счетчики, параметры ответа)"""
+    raw = json.dumps(parts, default=str, sort_keys=True).encode('utf-8')
+    return quote_etag(hashlib.sha1(raw).hexdigest())
+
+
+def etag_matches(header, etag):
+    """Есть ли etag в If-None-Match / If-Match (сравнение без учета W/)"""
+    if not header:
+        return False
+    etags = [value.removeprefix('W/') for value in parse_etags(header)]
+    return '*' in etags or etag.removeprefix('W/') in etags
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.api.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Выпускает токен доступа к JSON API для пользователя. Ключ выводится один раз.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Имя пользователя')
+        parser.add_argument('--name', default='', help='Название токена (например, имя интеграции)')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['username']} не найден")
+
+        token, key = ApiToken.issue(user, name=options['name'])
+        self.stdout.write(self.style.SUCCESS(f'Токен {token.prefix}… выпущен для {user}'))
+        self.stdout.write(key)
@@ -0,0 +1,43 @@
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.db import models
+
+
+class ApiToken(models.Model):
+    """
+    Токен доступа к JSON API. В базе хранится только хеш ключа:
+    сам ключ показывается один раз - при выпуске.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='api_tokens',
+        verbose_name='Пользователь'
+    )
+    name = models.CharField('Название', max_length=100, blank=True)
+    # Начало ключа - чтобы пользователь узнал свой токен в списке
+    prefix = models.CharField('Начало ключа', max_length=8, editable=False)
+    key_hash = models.CharField('Хеш ключа', max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    last_used_at = models.DateTimeField('Последнее использование', null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name = 'Токен API'
+        verbose_name_plural = 'Токены API'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.prefix}… ({self.user})'
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name=''):
+        """Выпускает токен; возвращает (токен, ключ)"""
+        key = secrets.token_urlsafe(32)
+        token = cls.objects.create(user=user, name=name, prefix=key[:8], key_hash=cls.hash_key(key))
+        return token, key
@@ -0,0 +1,184 @@
+"""
+Ресурсы JSON API: какие поля отдаются, откуда они читаются и чем проверяется запись.
+
+Строки читаются через values() только для запрошенных полей (без создания
+объектов моделей), запись идет через те же формы, что и в веб-интерфейсе,
+поэтому проверки, сигналы и журнал изменений работают одинаково.
+"""
+from collections import namedtuple
+
+from django.forms import modelform_factory
+
+from apps.core.filters import apply_vulnerability_filters, int_param, parse_vulnerability_filters
+from apps.core.forms import BusinessProcessForm, ProcessStepForm, RecommendationForm, VulnerabilityForm
+from apps.core.models import BusinessProcess, ProcessStep, Recommendation, Vulnerability
+
+# Родитель нового объекта: поле в теле запроса, атрибут модели, допустимые родители пользователя
+Parent = namedtuple('Parent', 'field attname queryset')
+
+
+class Resource:
+    """
+    Ресурс API: поля ответа (имя -> путь для values()), запрос объектов
+    пользователя, фильтры списка и форма для записи.
+
+    aggregates - поля из аннотации annotate(queryset): вычисляются только
+    если запрошены и зависят от других строк, поэтому их версия - версия
+    дашборда пользователя, а не updated_at строки.
+    parent - родитель при создании; без него владельцем становится пользователь.
+    """
+
+    def __init__(self, name, model, fields, queryset, form, filter=None, parent=None,
+                 form_kwargs=None, aggregates=(), annotate=None):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.queryset = queryset
+        self.form = form
+        self.filter = filter
+        self.parent = parent
+        self.form_kwargs = form_kwargs or (lambda parent=None, instance=None: {})
+        self.aggregates = set(aggregates)
+        self.annotate = annotate
+
+    @property
+    def default_fields(self):
+        return [name for name in self.fields if name not in self.aggregates]
+
+    @property
+    def writable(self):
+        return list(self.form._meta.fields)
+
+    def rows(self, queryset, names):
+        """values() с запрошенными полями; pk и updated_at нужны курсору и ETag"""
+        if self.aggregates.intersection(names):
+            queryset = self.annotate(queryset)
+        paths = {self.fields[name] for name in names} | {'pk', 'updated_at'}
+        return queryset.values(*paths)
+
+    def serialize(self, row, names):
+        return {name: row[self.fields[name]] for name in names}
+
+
+def _filter_steps(queryset, params):
+    process = int_param(params, 'process')
+    if process:
+        queryset = queryset.filter(business_process_id=process)
+    return queryset
+
+
+def _filter_vulnerabilities(queryset, params):
+    return apply_vulnerability_filters(queryset, parse_vulnerability_filters(params))
+
+
+def _filter_recommendations(queryset, params):
+    queryset = apply_vulnerability_filters(
+        queryset, parse_vulnerability_filters(params), prefix='vulnerability__')
+    vulnerability = int_param(params, 'vulnerability')
+    if vulnerability:
+        queryset = queryset.filter(vulnerability_id=vulnerability)
+    implemented = params.get('is_implemented', '').lower()
+    if implemented in ('true', 'false'):
+        queryset = queryset.filter(is_implemented=implemented == 'true')
+    return queryset
+
+
+def _vulnerability_form_kwargs(parent=None, instance=None):
+    # Шаг выбирается только из шагов процесса уязвимости
+    return {'process_id': parent.pk if parent else instance.business_process_id}
+
+
+# В веб-интерфейсе выполнение отмечается отдельно, в API - тем же запросом
+RecommendationApiForm = modelform_factory(
+    Recommendation, form=RecommendationForm, fields=['title', 'content', 'priority', 'is_implemented'])
+
+RESOURCES = {
+    resource.name: resource
+    for resource in (
+        Resource(
+            'processes', BusinessProcess,
+            fields={
+                'id': 'pk',
+                'name': 'name',
+                'description': 'description',
+                'criticality': 'criticality',
+                'is_active': 'is_active',
+                'created_at': 'created_at',
+                'updated_at': 'updated_at',
+                'vulnerability_count': 'annotated_vulnerability_count',
+                'risk_score': 'annotated_risk_score',
+                'critical_count': 'critical_count',
+                'high_count': 'high_count',
+                'medium_count': 'medium_count',
+                'low_count': 'low_count',
+            },
+            queryset=lambda user: BusinessProcess.objects.filter(owner=user),
+            form=BusinessProcessForm,
+            aggregates=('vulnerability_count', 'risk_score', 'critical_count', 'high_count',
+                        'medium_count', 'low_count'),
+            annotate=lambda queryset: queryset.with_risk(),
+        ),
+        Resource(
+            'steps', ProcessStep,
+            fields={
+                'id': 'pk',
+                'process': 'business_process_id',
+                'name': 'name',
+                'description': 'description',
+                'order': 'order',
+                'color': 'color',
+                'updated_at': 'updated_at',
+            },
+            queryset=lambda user: ProcessStep.objects.filter(business_process__owner=user),
+            form=ProcessStepForm,
+            filter=_filter_steps,
+            parent=Parent('process', 'business_process', lambda user: BusinessProcess.objects.filter(owner=user)),
+        ),
+        Resource(
+            'vulnerabilities', Vulnerability,
+            fields={
+                'id': 'pk',
+                'process': 'business_process_id',
+                'step': 'step_id',
+                'title': 'title',
+                'description': 'description',
+                'severity': 'severity',
+                'status': 'status',
+                'discovered_date': 'discovered_date',
+                'resolved_date': 'resolved_date',
+                'updated_at': 'updated_at',
+            },
+            queryset=lambda user: Vulnerability.objects.filter(business_process__owner=user),
+            form=VulnerabilityForm,
+            filter=_filter_vulnerabilities,
+            parent=Parent('process', 'business_process', lambda user: BusinessProcess.objects.filter(owner=user)),
+            form_kwargs=_vulnerability_form_kwargs,
+        ),
+        Resource(
+            'recommendations', Recommendation,
+            fields={
+                'id': 'pk',
+                'vulnerability': 'vulnerability_id',
+                'title': 'title',
+                'content': 'content',
+                'priority': 'priority',
+                'is_implemented': 'is_implemented',
+                'created_at': 'created_at',
+                'updated_at': 'updated_at',
+            },
+            queryset=lambda user: Recommendation.objects.filter(vulnerability__business_process__owner=user),
+            form=RecommendationApiForm,
+            filter=_filter_recommendations,
+            parent=Parent(
+                'vulnerability', 'vulnerability',
+                lambda user: Vulnerability.objects.filter(business_process__owner=user),
+            ),
+        ),
+    )
+}
+
+# Поля ответа метрик (calculate_risk_metrics)
+METRIC_FIELDS = (
+    'total_vulnerabilities', 'critical_count', 'high_count', 'resolved_count',
+    'open_count', 'in_progress_count', 'avg_resolution_time',
+)
@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.core import routers
+from apps.core.services import calculate_risk_metrics
+from apps.core.synthetic import generate
+from .models import ApiToken
+from .resources import RESOURCES
+
+
+class ReplicaReadsTests(TestCase):
+    """Агрегаты читаются с той же (основной) базы, что и версия в их ETag"""
+
+    def setUp(self):
+        generate(users=1, processes=2, steps=2, vulnerabilities=3, templates=3)
+        user = get_user_model().objects.get(username='synthetic_0')
+        _, key = ApiToken.issue(user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {key}'}
+
+    def _list_reads(self, fields):
+        resource = RESOURCES['processes']
+        reads = []
+
+        def rows(queryset, names):
+            reads.append(routers._read_from_replica.get())
+            return type(resource).rows(resource, queryset, names)
+
+        with mock.patch.object(resource, 'rows', side_effect=rows):
+            response = self.client.get(reverse('api:collection', args=['processes']), {'fields': fields}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return reads
+
+    def test_aggregate_fields_are_read_from_primary(self):
+        self.assertEqual(self._list_reads('id,risk_score'), [False])
+
+    def test_plain_fields_may_use_replica(self):
+        self.assertEqual(self._list_reads('id,name'), [True])
+
+    def test_metrics_are_read_from_primary(self):
+        reads = []
+
+        def metrics(user):
+            reads.append(routers._read_from_replica.get())
+            return calculate_risk_metrics(user)
+
+        with mock.patch('apps.api.views.calculate_risk_metrics', side_effect=metrics):
+            response = self.client.get(reverse('api:metrics'), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(reads, [False])
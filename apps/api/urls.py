@@ -0,0 +1,25 @@
+from django.urls import path, register_converter
+from . import views
+from .resources import RESOURCES
+
+
+class ResourceConverter:
+    """Имя ресурса API (processes, steps, vulnerabilities, recommendations)"""
+    regex = '|'.join(RESOURCES)
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        return value
+
+
+register_converter(ResourceConverter, 'resource')
+
+app_name = 'api'
+
+urlpatterns = [
+    path('metrics/', views.metrics, name='metrics'),
+    path('<resource:resource>/', views.collection, name='collection'),
+    path('<resource:resource>/<int:pk>/', views.item, name='item'),
+]
@@ -0,0 +1,256 @@
+import json
+from contextlib import nullcontext
+
+from django.db.models import Count, Max
+from django.forms.models import model_to_dict
+from django.http import HttpResponse
+from django.urls import reverse
+
+from apps.core.caching import dashboard_version
+from apps.core.pagination import InvalidCursor, KeysetPaginator
+from apps.core.routers import use_primary, use_replica
+from apps.core.services import calculate_risk_metrics
+from .auth import token_required
+from .http import error_response, etag_matches, json_response, make_etag, not_modified
+from .resources import METRIC_FIELDS, RESOURCES
+
+# Размер страницы списков: по умолчанию и наибольший (?limit=)
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+    def response(self):
+        return error_response(str(self), status=self.status, details=self.details)
+
+
+def _requested_fields(request, available, default):
+    """Поля из ?fields=a,b (sparse fieldsets) или поля по умолчанию"""
+    value = request.GET.get('fields', '')
+    if not value:
+        return list(default)
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ApiError('Неизвестные поля', details={'fields': unknown, 'available': list(available)})
+    return names
+
+
+def _page_size(request):
+    value = request.GET.get('limit', '')
+    if not value:
+        return API_PAGE_SIZE
+    if not value.isdecimal() or not 1 <= int(value) <= API_MAX_PAGE_SIZE:
+        raise ApiError(f'limit должен быть от 1 до {API_MAX_PAGE_SIZE}')
+    return int(value)
+
+
+def _payload(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError('Тело запроса должно быть JSON-объектом')
+    if not isinstance(data, dict):
+        raise ApiError('Тело запроса должно быть JSON-объектом')
+    return data
+
+
+def _method_not_allowed(allowed):
+    response = error_response('Метод не поддерживается', status=405)
+    response['Allow'] = ', '.join(allowed)
+    return response
+
+
+def _aggregate_reads(resource, names):
+    """
+    Поля-агрегаты (риск процесса) версионируются счетчиком владельца с основной
+    базы - и читаются с нее же: отставшая реплика не должна отдать старые
+    значения под ETag новой версии. Остальные поля можно читать с реплики.
+    """
+    return use_primary() if resource.aggregates.intersection(names) else nullcontext()
+
+
+def _item_etag(request, resource, pk, version, names):
+    # Поля из других строк (риск процесса) меняются вместе с версией данных владельца
+    extra = dashboard_version(request.user.pk) if resource.aggregates.intersection(names) else None
+    return make_etag(resource.name, pk, version, extra)
+
+
+def _item_response(request, resource, pk, names, status=200):
+    row = resource.rows(resource.queryset(request.user).filter(pk=pk), names).first()
+    if row is None:
+        return error_response('Объект не найден', status=404)
+    etag = _item_etag(request, resource, pk, row['updated_at'], names)
+    response = json_response(resource.serialize(row, names), status=status, etag=etag)
+    if status == 201:
+        response['Location'] = reverse('api:item', args=[resource.name, pk])
+    return response
+
+
+def _check_precondition(request, resource, obj, names):
+    """If-Match: изменение только если объект не менялся с момента чтения клиентом"""
+    header = request.headers.get('If-Match')
+    if header and not etag_matches(header, _item_etag(request, resource, obj.pk, obj.updated_at, names)):
+        raise ApiError('Объект изменился: получите актуальную версию', status=412)
+
+
+def _bound_form(resource, payload, instance=None, parent=None):
+    unknown = [name for name in payload if name not in resource.writable]
+    if unknown:
+        raise ApiError('Поля нельзя изменить', details={name: ['Только для чтения или неизвестно'] for name in unknown})
+    # Частичное изменение: недостающие поля - текущие значения (для нового объекта - по умолчанию)
+    data = {**model_to_dict(instance or resource.model(), fields=resource.writable), **payload}
+    form = resource.form(data=data, instance=instance, **resource.form_kwargs(parent=parent, instance=instance))
+    if not form.is_valid():
+        raise ApiError('Ошибка проверки данных', details={name: list(errors) for name, errors in form.errors.items()})
+    return form
+
+
+@use_replica
+def _list(request, resource):
+    names = _requested_fields(request, resource.fields, resource.default_fields)
+    with _aggregate_reads(resource, names):
+        return _list_response(request, resource, names)
+
+
+def _list_response(request, resource, names):
+    per_page = _page_size(request)
+    queryset = resource.queryset(request.user)
+    if resource.filter:
+        queryset = resource.filter(queryset, request.GET)
+
+    # Версия списка - одним агрегатом: последнее изменение и число строк (ловит удаление)
+    state = queryset.aggregate(version=Max('updated_at'), count=Count('pk'))
+    extra = dashboard_version(request.user.pk) if resource.aggregates.intersection(names) else None
+    etag = make_etag(resource.name, request.user.pk, request.get_full_path(), state['version'], state['count'], extra)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+
+    paginator = KeysetPaginator(resource.rows(queryset, names), ['pk'], per_page=per_page)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise ApiError('Некорректный курсор')
+
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return json_response({
+        'results': [resource.serialize(row, names) for row in page],
+        'next_cursor': page.next_cursor,
+        'next': next_url,
+    }, etag=etag)
+
+
+def _create(request, resource):
+    names = _requested_fields(request, resource.fields, resource.default_fields)
+    payload = _payload(request)
+    parent = None
+    if resource.parent:
+        parent_id = payload.pop(resource.parent.field, None)
+        if isinstance(parent_id, int) and not isinstance(parent_id, bool):
+            parent = resource.parent.queryset(request.user).filter(pk=parent_id).first()
+        if parent is None:
+            raise ApiError('Ошибка проверки данных', details={resource.parent.field: ['Укажите существующий объект']})
+
+    form = _bound_form(resource, payload, parent=parent)
+    obj = form.save(commit=False)
+    if parent is not None:
+        setattr(obj, resource.parent.attname, parent)
+    else:
+        obj.owner = request.user
+    obj.save()
+    return _item_response(request, resource, obj.pk, names, status=201)
+
+
+@use_replica
+def _retrieve(request, resource, pk):
+    names = _requested_fields(request, resource.fields, resource.default_fields)
+    with _aggregate_reads(resource, names):
+        return _retrieve_response(request, resource, pk, names)
+
+
+def _retrieve_response(request, resource, pk, names):
+    header = request.headers.get('If-None-Match')
+    if header:
+        # Быстрая проверка по версии строки, без чтения полей и агрегатов
+        version = resource.queryset(request.user).filter(pk=pk).values_list('updated_at', flat=True).first()
+        if version is None:
+            return error_response('Объект не найден', status=404)
+        etag = _item_etag(request, resource, pk, version, names)
+        if etag_matches(header, etag):
+            return not_modified(etag)
+    return _item_response(request, resource, pk, names)
+
+
+def _update(request, resource, obj):
+    names = _requested_fields(request, resource.fields, resource.default_fields)
+    _check_precondition(request, resource, obj, names)
+    form = _bound_form(resource, _payload(request), instance=obj)
+    form.save()
+    return _item_response(request, resource, obj.pk, names)
+
+
+def _delete(request, resource, obj):
+    _check_precondition(request, resource, obj, resource.default_fields)
+    obj.delete()
+    return HttpResponse(status=204)
+
+
+@token_required
+def collection(request, resource):
+    """GET - список (поля, фильтры, курсор), POST - создание"""
+    resource = RESOURCES[resource]
+    try:
+        if request.method == 'GET':
+            return _list(request, resource)
+        if request.method == 'POST':
+            return _create(request, resource)
+    except ApiError as exc:
+        return exc.response()
+    return _method_not_allowed(['GET', 'POST'])
+
+
+@token_required
+def item(request, resource, pk):
+    """GET - объект, PATCH - частичное изменение, DELETE - удаление"""
+    resource = RESOURCES[resource]
+    try:
+        if request.method == 'GET':
+            return _retrieve(request, resource, pk)
+        if request.method not in ('PATCH', 'DELETE'):
+            return _method_not_allowed(['GET', 'PATCH', 'DELETE'])
+        obj = resource.queryset(request.user).filter(pk=pk).first()
+        if obj is None:
+            return error_response('Объект не найден', status=404)
+        if request.method == 'PATCH':
+            return _update(request, resource, obj)
+        return _delete(request, resource, obj)
+    except ApiError as exc:
+        return exc.response()
+
+
+@token_required
+def metrics(request):
+    """
+    Метрики риска пользователя; версия - счетчик изменений владельца в БД
+    (OwnerVersion). Метрики считаются по основной базе, как и версия.
+    """
+    if request.method != 'GET':
+        return _method_not_allowed(['GET'])
+    try:
+        names = _requested_fields(request, METRIC_FIELDS, METRIC_FIELDS)
+    except ApiError as exc:
+        return exc.response()
+    etag = make_etag('metrics', request.user.pk, dashboard_version(request.user.pk), names)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+    data = calculate_risk_metrics(request.user)
+    return json_response({name: data[name] for name in names}, etag=etag)
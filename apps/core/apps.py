@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.core'
+
+    def ready(self):
+        # Обработчики сигналов: сводные счетчики рисков
+        from . import signals  # noqa: F401
+        # Настройка соединений с SQLite (PRAGMA)
+        from . import db  # noqa: F401
@@ -0,0 +1,635 @@
+"""
+Журнал аудита: отслеживание изменений, буферизованная запись, архивирование
+и чтение истории.
+
+Отслеживание. Для процессов, шагов, уязвимостей и рекомендаций при загрузке
+запоминаются значения отслеживаемых полей (post_init, см. signals.py); при
+сохранении изменения вычисляются по этому снимку - без SELECT перед записью.
+Поля, отложенные при загрузке (.only/.defer), не сравниваются. Массовые
+операции обходят сигналы: для них есть bulk_update() и *_entries().
+
+Запись. record() не пишет в БД сразу: записи откладываются до фиксации
+текущей транзакции (откаченные изменения в журнал не попадают) и копятся
+в буфере запроса (AuditBufferMiddleware, audit_batch()). В конце запроса
+буфер сбрасывается одним bulk_create. Вне буфера (фоновые задачи, команды)
+записи вставляются пачкой сразу после фиксации.
+
+Хранение. Живая таблица содержит записи за AUDIT_LOG_RETENTION_DAYS дней,
+более старые команда archive_audit_logs переносит в сжатые файлы JSON Lines,
+по одному на месяц (audit-ГГГГ-ММ.jsonl.gz), рядом - список уязвимостей
+файла (audit-ГГГГ-ММ.ids.json), чтобы при чтении истории не распаковывать
+лишние месяцы.
+
+Чтение. history() отдает историю объекта страницами по курсору: сначала
+живые записи (keyset по времени), затем архивные месяцы от новых к старым.
+"""
+import base64
+import functools
+import gzip
+import json
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .db import retry_on_locked
+from .models import AuditLog, BusinessProcess, ProcessStep, Recommendation, Vulnerability
+from .pagination import InvalidCursor, KeysetPaginator
+
+FLUSH_BATCH_SIZE = 500
+ARCHIVE_CHUNK_SIZE = 5000
+ARCHIVE_PREFIX = 'audit-'
+
+# Поля записи в архиве (и в истории, независимо от источника)
+ARCHIVE_FIELDS = (
+    'id', 'timestamp', 'object_type', 'object_id', 'object_repr', 'business_process_id',
+    'vulnerability_id', 'user_id', 'user__username', 'action', 'old_value', 'new_value',
+    'changes', 'comment',
+)
+
+ACTION_DISPLAY = dict(AuditLog.ACTION_CHOICES)
+OBJECT_TYPE_DISPLAY = dict(AuditLog.OBJECT_TYPE_CHOICES)
+
+
+class Tracking:
+    """Что отслеживается у модели: тип объекта в журнале, поля и поле с названием"""
+
+    def __init__(self, model, object_type, fields, repr_field):
+        self.model = model
+        self.object_type = object_type
+        # (имя поля, имя атрибута): для внешних ключей сравниваются *_id
+        self.fields = tuple((name, model._meta.get_field(name).attname) for name in fields)
+        self.repr_field = repr_field
+
+
+TRACKED = {
+    tracking.model: tracking
+    for tracking in (
+        Tracking(BusinessProcess, 'process', ('name', 'description', 'criticality', 'is_active'), 'name'),
+        Tracking(ProcessStep, 'step', ('name', 'description', 'order', 'color'), 'name'),
+        Tracking(Vulnerability, 'vulnerability',
+                 ('title', 'description', 'severity', 'status', 'step', 'resolved_date'), 'title'),
+        Tracking(Recommendation, 'recommendation', ('title', 'content', 'priority', 'is_implemented'), 'title'),
+    )
+}
+TRACKED_BY_TYPE = {tracking.object_type: tracking for tracking in TRACKED.values()}
+
+# Буфер записей текущего запроса (None - буфера нет, пишем сразу после фиксации)
+_buffer = ContextVar('audit_buffer', default=None)
+# Кто вносит изменения: пользователь запроса или владелец фоновой задачи
+_actor = ContextVar('audit_actor', default=None)
+_enabled = ContextVar('audit_enabled', default=True)
+
+
+@contextmanager
+def acting_as(user):
+    """Изменения внутри блока записываются в журнал от имени user"""
+    token = _actor.set(user)
+    try:
+        yield
+    finally:
+        _actor.reset(token)
+
+
+@contextmanager
+def disabled():
+    """Изменения внутри блока в журнал не попадают (служебные операции, замеры)"""
+    token = _enabled.set(False)
+    try:
+        yield
+    finally:
+        _enabled.reset(token)
+
+
+def _actor_id():
+    user = _actor.get()
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+# --- Отслеживание изменений ---
+
+def snapshot(instance):
+    """Запоминает загруженные значения отслеживаемых полей (вызывается из post_init)"""
+    if not _enabled.get():
+        return
+    loaded = instance.__dict__
+    loaded['_audit_snapshot'] = {
+        attname: loaded[attname] for _, attname in TRACKED[type(instance)].fields if attname in loaded
+    }
+
+
+def _diff(instance, fields=None):
+    """
+    Изменения относительно снимка: {"поле": [было, стало]}. Снимок
+    обновляется - повторное сохранение без изменений ничего не запишет.
+    fields - только эти поля (update_fields / bulk_update).
+    """
+    loaded = instance.__dict__
+    state = loaded.get('_audit_snapshot')
+    if state is None:
+        return {}
+    changes = {}
+    for name, attname in TRACKED[type(instance)].fields:
+        if fields is not None and name not in fields and attname not in fields:
+            continue
+        if attname not in state or attname not in loaded:
+            continue
+        old, new = state[attname], loaded[attname]
+        if old != new:
+            changes[name] = [old, new]
+            state[attname] = new
+    return changes
+
+
+def _scope(instance):
+    """(процесс, уязвимость) объекта - из загруженных значений, без запросов"""
+    if isinstance(instance, BusinessProcess):
+        return instance.pk, None
+    if isinstance(instance, Vulnerability):
+        return instance.business_process_id, instance.pk
+    if isinstance(instance, Recommendation):
+        # Процесс рекомендации, если уязвимость не загружена, найдем при записи (_fill_processes)
+        vulnerability = (
+            instance.vulnerability if Recommendation.vulnerability.is_cached(instance) else None
+        )
+        return (vulnerability.business_process_id if vulnerability else None), instance.vulnerability_id
+    return instance.business_process_id, None
+
+
+def _entry(instance, action, **values):
+    tracking = TRACKED[type(instance)]
+    process_id, vulnerability_id = _scope(instance)
+    return _make_entry(
+        tracking.object_type, instance.pk, instance.__dict__.get(tracking.repr_field, ''),
+        process_id, vulnerability_id, action, **values,
+    )
+
+
+def _make_entry(object_type, object_id, object_repr, process_id, vulnerability_id, action, **values):
+    return AuditLog(
+        object_type=object_type,
+        object_id=object_id,
+        object_repr=str(object_repr)[:255],
+        business_process_id=process_id,
+        vulnerability_id=vulnerability_id,
+        user_id=_actor_id(),
+        action=action,
+        **values,
+    )
+
+
+def _change_values(object_type, changes):
+    """Действие и поля записи об изменении"""
+    # Смена одного статуса - привычная запись "было/стало" (как в истории до журнала изменений)
+    if object_type == 'vulnerability' and 'status' in changes and changes.keys() <= {'status', 'resolved_date'}:
+        old, new = changes['status']
+        return {'action': 'status_changed', 'old_value': old, 'new_value': new, 'changes': changes}
+    return {'action': 'updated', 'changes': changes}
+
+
+def _change_entry(instance, changes):
+    return _entry(instance, **_change_values(TRACKED[type(instance)].object_type, changes))
+
+
+def created_entries(instances):
+    """Записи о создании объектов (для bulk_create: сигналы не отправляются)"""
+    if not _enabled.get():
+        return []
+    entries = []
+    for instance in instances:
+        snapshot(instance)
+        entries.append(_entry(instance, 'created'))
+    return entries
+
+
+def changed_entries(instances, fields=None):
+    """Записи об изменении объектов относительно снимков (только измененные)"""
+    if not _enabled.get():
+        return []
+    entries = []
+    for instance in instances:
+        changes = _diff(instance, fields)
+        if changes:
+            entries.append(_change_entry(instance, changes))
+    return entries
+
+
+def row_entries(object_type, rows):
+    """
+    Записи об изменении строк, обновленных запросом UPDATE без загрузки объектов.
+    rows - кортежи (id, название, процесс, уязвимость, {"поле": [было, стало]}).
+    """
+    if not _enabled.get():
+        return []
+    return [
+        _make_entry(object_type, pk, title, process_id, vulnerability_id, **_change_values(object_type, changes))
+        for pk, title, process_id, vulnerability_id, changes in rows
+        if changes
+    ]
+
+
+def deleted_entries(instances):
+    """Записи об удалении объектов"""
+    if not _enabled.get():
+        return []
+    return [_entry(instance, 'deleted') for instance in instances]
+
+
+def saved(instance, created, update_fields=None):
+    """Запись об одном сохранении (post_save)"""
+    record(created_entries([instance]) if created else changed_entries([instance], update_fields))
+
+
+def bulk_update(objs, fields, batch_size=None):
+    """bulk_update с записью изменений в журнал одной пачкой"""
+    objs = list(objs)
+    if not objs:
+        return 0
+    model = type(objs[0])
+    # bulk_update не выставляет auto_now-поля (версия строки для ETag в API)
+    auto_now = [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) and field.name not in fields
+    ]
+    if auto_now:
+        now = timezone.now()
+        for obj in objs:
+            for name in auto_now:
+                setattr(obj, name, now)
+    updated = model.objects.bulk_update(objs, [*fields, *auto_now], batch_size=batch_size)
+    record(changed_entries(objs, fields))
+    return updated
+
+
+# --- Запись ---
+
+def log(instance, action, user=None, old_value=None, new_value=None, comment=''):
+    """Добавляет одну запись в журнал вручную (см. record)"""
+    entry = _entry(instance, action, old_value=old_value, new_value=new_value, comment=comment)
+    if user is not None:
+        entry.user_id = user.pk
+    record([entry])
+
+
+def record(entries):
+    """Откладывает записи журнала до фиксации транзакции, затем - в буфер запроса"""
+    entries = list(entries)
+    if entries:
+        transaction.on_commit(functools.partial(_enqueue, entries), using=router.db_for_write(AuditLog))
+
+
+def _enqueue(entries):
+    buffer = _buffer.get()
+    if buffer is None:
+        flush(entries)
+    else:
+        buffer.extend(entries)
+
+
+def _fill_processes(entries):
+    """
+    Процесс для записей о рекомендациях, у которых уязвимость не была загружена:
+    из записей пачки (уязвимость удалена вместе с рекомендациями), иначе одним запросом.
+    """
+    missing = [entry for entry in entries if entry.business_process_id is None and entry.vulnerability_id]
+    if not missing:
+        return
+    processes = {
+        entry.vulnerability_id: entry.business_process_id
+        for entry in entries if entry.object_type == 'vulnerability'
+    }
+    unknown = {entry.vulnerability_id for entry in missing} - processes.keys()
+    if unknown:
+        processes.update(
+            Vulnerability.objects.filter(pk__in=unknown).values_list('pk', 'business_process_id')
+        )
+    for entry in missing:
+        entry.business_process_id = processes.get(entry.vulnerability_id)
+
+
+@retry_on_locked
+def flush(entries):
+    """Вставляет записи журнала одним запросом на FLUSH_BATCH_SIZE строк"""
+    if entries:
+        _fill_processes(entries)
+        AuditLog.objects.bulk_create(entries, batch_size=FLUSH_BATCH_SIZE)
+
+
+@contextmanager
+def audit_batch():
+    """Копит записи журнала и сбрасывает их одной вставкой на выходе (вложенные блоки - в общий буфер)"""
+    if _buffer.get() is not None:
+        yield
+        return
+    token = _buffer.set([])
+    try:
+        yield
+    finally:
+        entries = _buffer.get()
+        _buffer.reset(token)
+        flush(entries)
+
+
+class AuditBufferMiddleware:
+    """Записи журнала, сделанные за запрос, сбрасываются в БД одной вставкой от имени пользователя"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with acting_as(request.user), audit_batch():
+            return self.get_response(request)
+
+
+# --- Архив ---
+
+def archive_root():
+    return settings.AUDIT_ARCHIVE_ROOT
+
+
+def _month_key(timestamp):
+    return timezone.localtime(timestamp).strftime('%Y-%m')
+
+
+def _archive_path(month):
+    return archive_root() / f'{ARCHIVE_PREFIX}{month}.jsonl.gz'
+
+
+def _index_path(month):
+    return archive_root() / f'{ARCHIVE_PREFIX}{month}.ids.json'
+
+
+def archive_months():
+    """Месяцы, за которые есть архив, от новых к старым"""
+    root = archive_root()
+    if not root.exists():
+        return []
+    suffix = '.jsonl.gz'
+    return sorted(
+        (path.name[len(ARCHIVE_PREFIX):-len(suffix)] for path in root.glob(f'{ARCHIVE_PREFIX}*{suffix}')),
+        reverse=True,
+    )
+
+
+def _serialize(row):
+    row = dict(row)
+    row['username'] = row.pop('user__username')
+    row['timestamp'] = row['timestamp'].isoformat()
+    return json.dumps(row, ensure_ascii=False)
+
+
+def _append_month(month, rows):
+    """
+    Дописывает строки в файл месяца. Каждый вызов добавляет отдельный член
+    gzip - такой файл читается как один поток.
+    """
+    root = archive_root()
+    root.mkdir(parents=True, exist_ok=True)
+    with gzip.open(_archive_path(month), 'at', encoding='utf-8') as archive:
+        archive.writelines(_serialize(row) + '\n' for row in rows)
+
+    index_path = _index_path(month)
+    ids = set(json.loads(index_path.read_text())) if index_path.exists() else set()
+    ids.update(row['vulnerability_id'] for row in rows if row['vulnerability_id'] is not None)
+    partial = index_path.with_name(index_path.name + '.part')
+    partial.write_text(json.dumps(sorted(ids)))
+    partial.replace(index_path)
+
+
+def archive_before(cutoff, chunk_size=ARCHIVE_CHUNK_SIZE, progress=None):
+    """
+    Переносит записи старше cutoff в архив. Порция сначала дописывается
+    в файлы и только потом удаляется из таблицы: при сбое запись остается
+    в таблице и будет перенесена повторно (при чтении архива дубли по id
+    отбрасываются), но не потеряется. Возвращает число перенесенных записей.
+    """
+    queryset = AuditLog.objects.filter(timestamp__lt=cutoff).order_by('pk')
+    moved = 0
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).values(*ARCHIVE_FIELDS)[:chunk_size])
+        if not chunk:
+            break
+        by_month = {}
+        for row in chunk:
+            by_month.setdefault(_month_key(row['timestamp']), []).append(row)
+        for month, rows in sorted(by_month.items()):
+            _append_month(month, rows)
+
+        _delete_archived([row['id'] for row in chunk])
+        last_pk = chunk[-1]['id']
+        moved += len(chunk)
+        if progress:
+            progress(moved)
+    return moved
+
+
+@retry_on_locked
+def _delete_archived(pks):
+    with transaction.atomic():
+        AuditLog.objects.filter(pk__in=pks).delete()
+
+
+def purge_archives(before):
+    """Удаляет архивные месяцы целиком раньше даты before; возвращает список месяцев"""
+    limit = before.strftime('%Y-%m')
+    purged = [month for month in archive_months() if month < limit]
+    for month in purged:
+        _archive_path(month).unlink(missing_ok=True)
+        _index_path(month).unlink(missing_ok=True)
+    return purged
+
+
+def _read_month(month, vulnerability_id):
+    """Записи месяца для одной уязвимости, от новых к старым (без дублей)"""
+    index_path = _index_path(month)
+    if index_path.exists() and vulnerability_id not in set(json.loads(index_path.read_text())):
+        return []
+    entries = {}
+    with gzip.open(_archive_path(month), 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            row = json.loads(line)
+            if row['vulnerability_id'] == vulnerability_id:
+                entries[row['id']] = row
+    return sorted(entries.values(), key=lambda row: (row['timestamp'], row['id']), reverse=True)
+
+
+# --- Чтение истории ---
+
+class HistoryEntry:
+    """Запись истории - одинаковая для живой таблицы и архива"""
+
+    def __init__(self, pk, timestamp, username, action, old_value, new_value, comment,
+                 object_type='vulnerability', object_repr='', changes=None, archived=False):
+        self.pk = pk
+        self.timestamp = timestamp
+        self.username = username or ''
+        self.action = action
+        self.old_value = old_value
+        self.new_value = new_value
+        self.comment = comment
+        self.object_type = object_type
+        self.object_repr = object_repr
+        self.changes = changes or {}
+        self.archived = archived
+
+    @classmethod
+    def from_log(cls, entry):
+        return cls(
+            entry.pk, entry.timestamp, entry.user.username if entry.user else '',
+            entry.action, entry.old_value, entry.new_value, entry.comment,
+            entry.object_type, entry.object_repr, entry.changes,
+        )
+
+    @classmethod
+    def from_archive(cls, row):
+        # Архивы до появления журнала изменений содержат только записи об уязвимостях
+        return cls(
+            row['id'], parse_datetime(row['timestamp']), row['username'],
+            row['action'], row['old_value'], row['new_value'], row['comment'],
+            row.get('object_type', 'vulnerability'), row.get('object_repr', ''), row.get('changes'),
+            archived=True,
+        )
+
+    def get_action_display(self):
+        return ACTION_DISPLAY.get(self.action, self.action)
+
+    def get_object_type_display(self):
+        return OBJECT_TYPE_DISPLAY.get(self.object_type, self.object_type)
+
+    def change_list(self):
+        """Изменения для показа: (название поля, было, стало) с подписями вариантов выбора"""
+        tracking = TRACKED_BY_TYPE.get(self.object_type)
+        result = []
+        for name, (old, new) in self.changes.items():
+            try:
+                field = tracking.model._meta.get_field(name)
+            except (AttributeError, FieldDoesNotExist):
+                result.append((name, old, new))
+                continue
+            choices = dict(field.flatchoices)
+            result.append((field.verbose_name, choices.get(old, old), choices.get(new, new)))
+        return result
+
+
+class HistoryPage:
+    def __init__(self, entries, next_cursor):
+        self.entries = entries
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _encode(state):
+    raw = json.dumps(state).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode(cursor):
+    try:
+        state = json.loads(base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(state, dict) or not (_is_live_state(state) or _is_archive_state(state)):
+        raise InvalidCursor(cursor)
+    return state
+
+
+def _is_live_state(state):
+    return state.keys() == {'live'} and isinstance(state['live'], str)
+
+
+def _is_archive_state(state):
+    month, offset = state.get('month'), state.get('offset')
+    return (
+        state.keys() in ({'month', 'offset'}, {'month', 'offset', 'before'})
+        and isinstance(month, str) and re.fullmatch(r'\d{4}-\d{2}', month) is not None
+        and isinstance(offset, int) and not isinstance(offset, bool) and offset >= 0
+        and _is_boundary(state.get('before'))
+    )
+
+
+def _is_boundary(before):
+    if before is None:
+        return True
+    if not (isinstance(before, list) and len(before) == 2):
+        return False
+    timestamp, pk = before
+    return (
+        isinstance(timestamp, str) and _parse_timestamp(timestamp) is not None
+        and isinstance(pk, int) and not isinstance(pk, bool)
+    )
+
+
+def _parse_timestamp(value):
+    try:
+        return parse_datetime(value)
+    except ValueError:
+        return None
+
+
+def history(vulnerability_id, cursor=None, per_page=50):
+    """
+    Страница истории уязвимости (живые записи, затем архив).
+    Курсор: {"live": курсор KeysetPaginator} или
+    {"month": "ГГГГ-ММ", "offset": n, "before": [время, id] | null}.
+    InvalidCursor - курсор поврежден.
+
+    Если archive_audit_logs прервался между записью пачки в архив и ее
+    удалением, записи есть и в таблице, и в архиве. Удаляются они пачками
+    по возрастанию id, поэтому такие дубли - самые старые из живых записей.
+    Граница before - (время, id) самой старой показанной живой записи;
+    архивные записи не старше нее уже были на живых страницах и пропускаются
+    на всех архивных страницах, а не только на первой.
+    """
+    state = _decode(cursor) if cursor else {'live': None}
+    entries = []
+
+    if 'live' in state:
+        queryset = AuditLog.objects.filter(vulnerability_id=vulnerability_id).select_related('user')
+        page = KeysetPaginator(queryset, ['-timestamp'], per_page=per_page).page(state['live'])
+        entries = [HistoryEntry.from_log(entry) for entry in page]
+        if page.has_next:
+            return HistoryPage(entries, _encode({'live': page.next_cursor}))
+        # Живые записи кончились - продолжаем с самого нового архивного месяца
+        before = [entries[-1].timestamp.isoformat(), entries[-1].pk] if entries else None
+        state = {'month': None, 'offset': 0, 'before': before}
+
+    before = state.get('before')
+    boundary = (_parse_timestamp(before[0]), before[1]) if before else None
+    months = archive_months()
+    if state['month'] is not None:
+        months = [month for month in months if month <= state['month']]
+    offset = state['offset']
+
+    for month in months:
+        rows = _read_month(month, vulnerability_id)
+        if boundary is not None:
+            rows = [row for row in rows if (parse_datetime(row['timestamp']), row['id']) < boundary]
+        need = per_page - len(entries)
+        chunk = rows[offset:offset + need]
+        entries.extend(HistoryEntry.from_archive(row) for row in chunk)
+        if offset + need < len(rows):
+            return HistoryPage(entries, _encode({'month': month, 'offset': offset + need, 'before': before}))
+        offset = 0
+        if len(entries) == per_page:
+            # Страница заполнена ровно на границе месяца: следующая начнется с более старого
+            older = [m for m in months if m < month]
+            next_cursor = _encode({'month': older[0], 'offset': 0, 'before': before}) if older else None
+            return HistoryPage(entries, next_cursor)
+    return HistoryPage(entries, None)
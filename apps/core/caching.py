@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import OwnerVersion
+from .routers import use_primary
+
+# Ключи кеша дашборда: версия на пользователя + счетчики эффективности
+CONTEXT_KEY = 'dashboard:context:{user_id}:{version}'
+HITS_KEY = 'dashboard:stats:hits'
+MISSES_KEY = 'dashboard:stats:misses'
+INVALIDATIONS_KEY = 'dashboard:stats:invalidations'
+
+
+def dashboard_version(user_id):
+    """
+    Версия данных пользователя - из БД (OwnerVersion), а не из кеша: кеш по
+    умолчанию в памяти процесса, и изменение в другом воркере, исполнителе
+    задач или команде импорта иначе не было бы видно. Читается с основной
+    базы: отставшая реплика не должна выдать старую версию.
+    """
+    with use_primary():
+        return OwnerVersion.current(user_id)
+
+
+def get_dashboard_context(user, build):
+    """
+    Возвращает вычисленный контекст дашборда из кеша или строит его
+    функцией build() и кладет в кеш под текущей версией пользователя.
+    """
+    key = CONTEXT_KEY.format(user_id=user.pk, version=dashboard_version(user.pk))
+    context = cache.get(key)
+    if context is not None:
+        _incr(HITS_KEY)
+        return context
+
+    _incr(MISSES_KEY)
+    context = build()
+    cache.set(key, context, settings.DASHBOARD_CACHE_TIMEOUT)
+    return context
+
+
+def invalidate_dashboard(user_id):
+    """
+    Сбрасывает кеш дашборда пользователя: увеличивает его версию в БД в той
+    же транзакции, что и изменение (откат изменения откатывает и версию)
+    """
+    if user_id is None:
+        return
+    OwnerVersion.bump(user_id)
+    transaction.on_commit(lambda: _incr(INVALIDATIONS_KEY))
+
+
+def dashboard_cache_stats():
+    """Счетчики попаданий и промахов кеша дашборда"""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'invalidations': cache.get(INVALIDATIONS_KEY, 0),
+        'hit_ratio': round(hits / total, 3) if total else None,
+        'backend': settings.CACHES['default']['BACKEND'],
+    }
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
@@ -0,0 +1,113 @@
+"""
+Условные GET-запросы для страниц (ETag / Last-Modified).
+
+Версия страницы строится до вызова представления - из версии данных
+владельца (счетчик изменений OwnerVersion в БД, см. caching.dashboard_version)
+или из updated_at нужных строк одним запросом. Обе хранятся в базе, поэтому
+изменение в любом воркере сразу меняет ETag во всех. Если браузер прислал ту
+же версию, отдается 304 без выборки данных и рендера шаблона.
+
+Версия и страница под ней читаются с основной базы, даже если представление
+разрешает реплику (use_replica): иначе отставшая реплика отдала бы старые
+строки под ETag новой версии, и браузер получал бы 304 на устаревшую
+страницу до следующего изменения.
+"""
+import functools
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import F, Func, QuerySet, Subquery
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .routers import use_primary
+
+
+def row_versions(queryset, **related):
+    """
+    Версия первой строки queryset и связанных данных - одним запросом.
+    related: имя -> выражение (F('business_process__updated_at')) или
+    queryset связанных строк с OuterRef: для него берутся время последнего
+    изменения и число строк (удаление меняет число).
+    Возвращает словарь значений или None, если строки нет.
+    """
+    annotations = {}
+    for name, value in related.items():
+        if isinstance(value, QuerySet):
+            rows = value.order_by()
+            annotations[f'{name}_changed'] = Subquery(rows.order_by('-updated_at').values('updated_at')[:1])
+            annotations[f'{name}_count'] = Subquery(rows.annotate(count=Func(F('pk'), function='COUNT')).values('count'))
+        else:
+            annotations[name] = value
+    return queryset.annotate(**annotations).values('updated_at', *annotations).first()
+
+
+def _page_version(request, version_func, args, kwargs):
+    # Одна версия на запрос: condition() спрашивает и ETag, и Last-Modified
+    if not hasattr(request, '_page_version'):
+        request._page_version = None
+        # Сообщения (messages) показываются один раз - такую страницу нужно отрендерить
+        if request.method in ('GET', 'HEAD') and not len(get_messages(request)):
+            with use_primary():
+                result = version_func(request, *args, **kwargs)
+            if result is not None:
+                version, modified = result
+                request._page_version = _etag(request, version), modified
+    return request._page_version
+
+
+def _etag(request, version):
+    user = request.user
+    parts = [
+        settings.PAGE_VERSION, request.get_full_path(), user.pk, getattr(user, 'updated_at', None),
+        # Страница содержит CSRF-токен: после смены секрета (вход) ее нужно отрендерить заново
+        request.META.get('CSRF_COOKIE', ''),
+        version,
+    ]
+    raw = json.dumps(parts, default=str, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def last_change(versions):
+    """Самое позднее время изменения среди значений row_versions()"""
+    return max((value for value in versions.values() if isinstance(value, datetime)), default=None)
+
+
+def page_condition(version_func):
+    """
+    ETag и Last-Modified для страницы. version_func(request, *args, **kwargs)
+    возвращает (версия данных, время последнего изменения или None) либо
+    None - тогда страница отдается как обычно. Last-Modified - подсказка для
+    If-Modified-Since; удаление строк его не сдвигает, поэтому решает ETag
+    (при If-None-Match заголовок If-Modified-Since не учитывается).
+    Ответ помечается private, no-cache: браузер каждый раз перепроверяет его.
+    Страница с версией строится по основной базе - по тем же данным, что и версия.
+    """
+    def decorator(view_func):
+        def versioned_view(request, *args, **kwargs):
+            if request._page_version is None:
+                return view_func(request, *args, **kwargs)
+            with use_primary():
+                return view_func(request, *args, **kwargs)
+
+        def etag(request, *args, **kwargs):
+            version = _page_version(request, version_func, args, kwargs)
+            return version and version[0]
+
+        def last_modified(request, *args, **kwargs):
+            version = _page_version(request, version_func, args, kwargs)
+            return version and version[1]
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(versioned_view)
+
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request._page_version is not None:
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
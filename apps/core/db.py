@@ -0,0 +1,79 @@
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_LOCKED_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+_retries = 0
+_retries_lock = threading.Lock()
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Применяет SQLITE_PRAGMAS к каждому новому соединению с SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(exc):
+    return isinstance(exc, OperationalError) and any(
+        message in str(exc).lower() for message in _LOCKED_MESSAGES
+    )
+
+
+def lock_retry_count():
+    """Сколько раз с запуска процесса запись повторялась из-за блокировки БД"""
+    return _retries
+
+
+def retry_on_locked(func=None, *, attempts=None, using='default'):
+    """
+    Повторяет функцию, если SQLite ответила "database is locked".
+
+    busy_timeout не спасает, когда транзакция начала читать, а потом пытается
+    писать при чужой активной записи: SQLite сразу возвращает ошибку, и
+    повторить можно только всю транзакцию целиком. Поэтому внутри внешнего
+    atomic-блока повтор не выполняется - ошибка уходит наверх, к тому, кто
+    открыл транзакцию. Пауза растет экспоненциально (со случайным разбросом)
+    и ограничена DB_LOCK_RETRY_MAX_DELAY.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _retries
+            max_attempts = attempts or settings.DB_LOCK_RETRY_ATTEMPTS
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if (
+                        attempt == max_attempts
+                        or not is_locked_error(exc)
+                        or connections[using].in_atomic_block
+                    ):
+                        raise
+                    delay = min(
+                        settings.DB_LOCK_RETRY_MAX_DELAY,
+                        settings.DB_LOCK_RETRY_BASE_DELAY * 2 ** (attempt - 1),
+                    ) * random.uniform(0.5, 1.0)
+                    with _retries_lock:
+                        _retries += 1
+                    logger.warning(
+                        '%s: БД заблокирована, попытка %d из %d через %.0f мс',
+                        func.__qualname__, attempt + 1, max_attempts, delay * 1000,
+                    )
+                    time.sleep(delay)
+        return wrapper
+
+    return decorator if func is None else decorator(func)
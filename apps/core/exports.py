@@ -0,0 +1,380 @@
+"""
+Выгрузка уязвимостей, рекомендаций и журнала аудита в CSV, JSON и XLSX.
+
+Строки читаются из БД порциями по курсору (values_list, без создания
+объектов моделей) и сразу превращаются в байты, поэтому память не растет с размером выгрузки:
+одни и те же генераторы используются и для потокового ответа
+(StreamingHttpResponse), и для записи файла фоновой задачей.
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .filters import apply_vulnerability_filters
+from .models import AuditLog, Recommendation, Vulnerability
+
+EXPORT_CHUNK_SIZE = 2000
+# Сколько байт накапливать перед отправкой очередной части ответа
+FLUSH_BYTES = 64 * 1024
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class ExportDataset:
+    """
+    Набор данных для выгрузки: колонки (ключ, заголовок), запрос, поля для
+    values_list (первое - pk) и преобразование кортежа значений в строку.
+    extra(chunk, using) - дополнительные данные на порцию (один запрос на порцию).
+    """
+
+    def __init__(self, title, columns, queryset, fields, row, extra=None):
+        self.title = title
+        self.columns = columns
+        self.queryset = queryset
+        self.fields = fields
+        self.row = row
+        self.extra = extra
+
+    @property
+    def keys(self):
+        return [key for key, _ in self.columns]
+
+    @property
+    def headers(self):
+        return [header for _, header in self.columns]
+
+
+SEVERITY_DISPLAY = dict(Vulnerability.SEVERITY_CHOICES)
+STATUS_DISPLAY = dict(Vulnerability.STATUS_CHOICES)
+PRIORITY_DISPLAY = dict(Recommendation.PRIORITY_CHOICES)
+ACTION_DISPLAY = dict(AuditLog.ACTION_CHOICES)
+OBJECT_TYPE_DISPLAY = dict(AuditLog.OBJECT_TYPE_CHOICES)
+
+
+def _vulnerabilities(user, filters):
+    return apply_vulnerability_filters(
+        Vulnerability.objects.filter(business_process__owner=user), filters)
+
+
+def _vulnerability_recommendations(chunk, using):
+    """Заголовки рекомендаций уязвимостей порции"""
+    titles = defaultdict(list)
+    rows = Recommendation.objects.using(using).filter(
+        vulnerability_id__in=[values[0] for values in chunk]
+    ).order_by('pk').values_list('vulnerability_id', 'title')
+    for vulnerability_id, title in rows:
+        titles[vulnerability_id].append(title)
+    return titles
+
+
+def _vulnerability_row(values, recommendations):
+    pk, process, step, title, description, severity, status, discovered, resolved = values
+    titles = recommendations.get(pk, ())
+    return [
+        pk, process, step or '', title, description, severity, SEVERITY_DISPLAY.get(severity, severity),
+        STATUS_DISPLAY.get(status, status), discovered, resolved, len(titles), '; '.join(titles),
+    ]
+
+
+def _recommendations(user, filters):
+    queryset = apply_vulnerability_filters(
+        Recommendation.objects.filter(vulnerability__business_process__owner=user),
+        filters, prefix='vulnerability__')
+    # Как в списке рекомендаций: выполненные - только по запросу
+    if not filters.get('show_implemented'):
+        queryset = queryset.filter(is_implemented=False)
+    return queryset
+
+
+def _recommendation_row(values, extra):
+    values = list(values)
+    values[6] = PRIORITY_DISPLAY.get(values[6], values[6])
+    return values
+
+
+def _audit_log(user, filters):
+    # Фильтры по статусу, серьезности и шагу - к записям об уязвимостях, по процессу - ко всем
+    queryset = apply_vulnerability_filters(
+        AuditLog.objects.filter(business_process__owner=user),
+        {**filters, 'process': None}, prefix='vulnerability__')
+    if filters['process']:
+        queryset = queryset.filter(business_process_id=filters['process'])
+    return queryset
+
+
+def _audit_row(values, extra):
+    (_, timestamp, object_type, object_id, object_repr, vulnerability_id, process, username,
+     action, changes, old, new, comment) = values
+    return [
+        timestamp, OBJECT_TYPE_DISPLAY.get(object_type, object_type), object_id, object_repr,
+        vulnerability_id or '', process or '', username or '', ACTION_DISPLAY.get(action, action),
+        json.dumps(changes, ensure_ascii=False, cls=DjangoJSONEncoder) if changes else '',
+        old, new, comment,
+    ]
+
+
+DATASETS = {
+    'vulnerabilities': ExportDataset(
+        'Уязвимости',
+        [
+            ('id', 'ID'), ('process', 'Процесс'), ('step', 'Шаг'), ('title', 'Название'),
+            ('description', 'Описание'), ('severity', 'Серьезность'), ('severity_display', 'Уровень'),
+            ('status', 'Статус'), ('discovered_date', 'Обнаружена'), ('resolved_date', 'Решена'),
+            ('recommendation_count', 'Рекомендаций'), ('recommendations', 'Рекомендации'),
+        ],
+        _vulnerabilities,
+        ('pk', 'business_process__name', 'step__name', 'title', 'description',
+         'severity', 'status', 'discovered_date', 'resolved_date'),
+        _vulnerability_row,
+        _vulnerability_recommendations,
+    ),
+    'recommendations': ExportDataset(
+        'Рекомендации',
+        [
+            ('id', 'ID'), ('vulnerability_id', 'ID уязвимости'), ('vulnerability', 'Уязвимость'),
+            ('process', 'Процесс'), ('title', 'Заголовок'), ('content', 'Содержание'),
+            ('priority', 'Приоритет'), ('is_implemented', 'Выполнено'), ('created_at', 'Создана'),
+        ],
+        _recommendations,
+        ('pk', 'vulnerability_id', 'vulnerability__title', 'vulnerability__business_process__name',
+         'title', 'content', 'priority', 'is_implemented', 'created_at'),
+        _recommendation_row,
+    ),
+    'audit': ExportDataset(
+        'Журнал аудита',
+        [
+            ('timestamp', 'Время'), ('object_type', 'Тип объекта'), ('object_id', 'ID объекта'),
+            ('object', 'Объект'), ('vulnerability_id', 'ID уязвимости'), ('process', 'Процесс'),
+            ('user', 'Пользователь'), ('action', 'Действие'), ('changes', 'Изменения'),
+            ('old_value', 'Было'), ('new_value', 'Стало'), ('comment', 'Комментарий'),
+        ],
+        _audit_log,
+        ('pk', 'timestamp', 'object_type', 'object_id', 'object_repr', 'vulnerability_id',
+         'business_process__name', 'user__username', 'action', 'changes',
+         'old_value', 'new_value', 'comment'),
+        _audit_row,
+    ),
+}
+
+
+def export_queryset(dataset_name, user, filters, using=None):
+    queryset = DATASETS[dataset_name].queryset(user, filters)
+    return queryset.using(using) if using else queryset
+
+
+def export_rows(dataset_name, user, filters, using=None, progress=None):
+    """
+    Строки выгрузки; progress(done) вызывается после каждой порции.
+    Порции выбираются по курсору (pk > последнего), как в KeysetPaginator:
+    каждый запрос короткий, а объекты моделей не создаются вовсе.
+    """
+    dataset = DATASETS[dataset_name]
+    queryset = export_queryset(dataset_name, user, filters, using).order_by('pk')
+    last_pk, done = None, 0
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page.values_list(*dataset.fields)[:EXPORT_CHUNK_SIZE])
+        if not chunk:
+            break
+        extra = dataset.extra(chunk, queryset.db) if dataset.extra else None
+        for values in chunk:
+            yield dataset.row(values, extra)
+        last_pk = chunk[-1][0]
+        done += len(chunk)
+        if progress:
+            progress(done)
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            break
+
+
+def stream_export(dataset_name, fmt, user, filters, using=None, progress=None):
+    """Генератор байтов файла выгрузки в формате fmt"""
+    dataset = DATASETS[dataset_name]
+    rows = export_rows(dataset_name, user, filters, using, progress)
+    if fmt == 'json':
+        return _write_json(dataset.keys, rows)
+    if fmt == 'xlsx':
+        return _write_xlsx(dataset.headers, rows, dataset.title)
+    return _write_csv(dataset.headers, rows)
+
+
+def export_filename(dataset_name, fmt):
+    return f"{dataset_name}-{timezone.localdate().isoformat()}.{fmt}"
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'да' if value else 'нет'
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat(sep=' ', timespec='seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value):
+    value = _text(value)
+    # Защита от выполнения формул при открытии файла в табличном редакторе
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + value
+    return value
+
+
+def _write_csv(headers, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM: Excel открывает UTF-8 без искажения кириллицы
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow([_csv_cell(value) for value in row])
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Значение {value!r} не сериализуется в JSON')
+
+
+def _write_json(keys, rows):
+    parts = ['[']
+    size = 0
+    separator = '\n'
+    for row in rows:
+        item = json.dumps(dict(zip(keys, row)), ensure_ascii=False, default=_json_default)
+        parts.append(separator + item)
+        separator = ',\n'
+        size += len(item)
+        if size >= FLUSH_BYTES:
+            yield ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+    parts.append('\n]\n')
+    yield ''.join(parts).encode('utf-8')
+
+
+# Минимальный XLSX (Office Open XML): один лист, строки хранятся inline,
+# без таблицы общих строк - иначе ее пришлось бы держать в памяти целиком
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name={name} sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+
+# Управляющие символы недопустимы в XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _ZipStream:
+    """Файлоподобный буфер без seek: zipfile пишет в него, генератор забирает накопленное"""
+
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+        self._pending = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        self._pending += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def flush(self):
+        pass
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._pending = 0
+        return data
+
+
+def _xlsx_cell(value):
+    value = _text(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def _write_xlsx(headers, rows, sheet_name):
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=quoteattr(sheet_name[:31])))
+        archive.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((_XLSX_SHEET_HEAD + _xlsx_row(headers)).encode('utf-8'))
+            for row in rows:
+                sheet.write(_xlsx_row(row).encode('utf-8'))
+                if stream.pending >= FLUSH_BYTES:
+                    yield stream.drain()
+            sheet.write(_XLSX_SHEET_TAIL.encode('utf-8'))
+    yield stream.drain()
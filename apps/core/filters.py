@@ -0,0 +1,42 @@
+from .models import Vulnerability
+
+
+def int_param(params, name):
+    """Неотрицательное целое из GET-параметра или None, если значение некорректно"""
+    value = params.get(name, '')
+    # isdigit() пропускает "²", на котором int() падает
+    if not value.isdecimal():
+        return None
+    number = int(value)
+    # Больше BIGINT таких id нет, а SQLite не примет параметр
+    return number if number < 2 ** 63 else None
+
+
+def parse_vulnerability_filters(params):
+    """
+    Фильтры списков и выгрузок из GET-параметров (некорректные значения
+    игнорируются). Результат сериализуется в JSON - его можно сохранить
+    в параметрах фоновой задачи.
+    """
+    status = params.get('status') or ''
+    if status not in dict(Vulnerability.STATUS_CHOICES):
+        status = ''
+    return {
+        'status': status,
+        'severity': int_param(params, 'severity'),
+        'process': int_param(params, 'process'),
+        'step': int_param(params, 'step'),
+    }
+
+
+def apply_vulnerability_filters(queryset, filters, prefix=''):
+    """prefix - путь до уязвимости, например 'vulnerability__' для рекомендаций"""
+    if filters['status']:
+        queryset = queryset.filter(**{f'{prefix}status': filters['status']})
+    if filters['severity']:
+        queryset = queryset.filter(**{f'{prefix}severity': filters['severity']})
+    if filters['process']:
+        queryset = queryset.filter(**{f'{prefix}business_process_id': filters['process']})
+    if filters['step']:
+        queryset = queryset.filter(**{f'{prefix}step_id': filters['step']})
+    return queryset
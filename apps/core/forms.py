@@ -1,6 +1,9 @@
 from django import forms
+from django.conf import settings
 from .models import BusinessProcess, Vulnerability, Recommendation, AuditLog
 from .models import ProcessStep
+from .importer import detect_format
+from .services import BULK_UPDATE_MAX
 
 
 class BusinessProcessForm(forms.ModelForm):
@@ -58,7 +61,25 @@ class VulnerabilityForm(forms.ModelForm):
             # Если контекст неизвестен, список пуст (или можно показать все, но лучше так)
             self.fields['step'].queryset = ProcessStep.objects.none()
 
+    def clean(self):
+        cleaned_data = super().clean()
+        step = cleaned_data.get('step')
+        title = cleaned_data.get('title')
 
+        # Процесс не входит в поля формы, поэтому уникальность (процесс, шаг, название)
+        # Django сам не проверит - иначе сохранение упадет с IntegrityError
+        if step and title:
+            duplicates = Vulnerability.objects.filter(
+                business_process_id=step.business_process_id,
+                step=step,
+                title=title
+            )
+            if self.instance.pk:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            if duplicates.exists():
+                self.add_error('title', 'На этом шаге уже есть уязвимость с таким названием')
+
+        return cleaned_data
 
 
 class VulnerabilityStatusForm(forms.ModelForm):
@@ -71,6 +92,84 @@ class VulnerabilityStatusForm(forms.ModelForm):
         }
 
 
+class _StepChoiceIterator(forms.models.ModelChoiceIterator):
+    def __iter__(self):
+        choices = super().__iter__()
+        if self.field.empty_label is not None:
+            yield next(choices)
+        yield (StepChoiceField.NO_STEP, 'Без шага')
+        yield from choices
+
+    def __len__(self):
+        return super().__len__() + 1
+
+
+class StepChoiceField(forms.ModelChoiceField):
+    """Шаг процесса или явный выбор "Без шага" (NO_STEP); пустое значение - не выбрано"""
+    NO_STEP = 'none'
+    iterator = _StepChoiceIterator
+
+    def to_python(self, value):
+        if value == self.NO_STEP:
+            return self.NO_STEP
+        return super().to_python(value)
+
+
+class VulnerabilityBulkForm(forms.Form):
+    """Массовое изменение выбранных уязвимостей (или всех, подходящих под фильтр)"""
+    ACTION_CHOICES = [
+        ('status', 'Сменить статус'),
+        ('severity', 'Сменить серьезность'),
+        ('step', 'Перенести на шаг'),
+    ]
+
+    ids = forms.Field(required=False, widget=forms.MultipleHiddenInput)
+    select_all = forms.BooleanField(required=False)
+    action = forms.ChoiceField(choices=ACTION_CHOICES, widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    status = forms.ChoiceField(
+        choices=[('', 'Статус...')] + Vulnerability.STATUS_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    severity = forms.TypedChoiceField(
+        choices=[('', 'Серьезность...')] + Vulnerability.SEVERITY_CHOICES, coerce=int, empty_value=None,
+        required=False, widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    step = StepChoiceField(
+        queryset=ProcessStep.objects.none(), required=False, empty_label='Шаг...',
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['step'].queryset = ProcessStep.objects.filter(business_process__owner=user)
+
+    def clean_ids(self):
+        ids = self.cleaned_data['ids'] or []
+        if not all(str(pk).isdecimal() for pk in ids):
+            raise forms.ValidationError('Некорректный список уязвимостей')
+        if len(ids) > BULK_UPDATE_MAX:
+            raise forms.ValidationError(f'За один раз можно изменить не более {BULK_UPDATE_MAX} уязвимостей')
+        return [int(pk) for pk in ids]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        # Шаг тоже выбирается явно: пустое значение не должно молча отвязать уязвимости от шагов
+        if action in ('status', 'severity', 'step') and not cleaned_data.get(action):
+            self.add_error(action, 'Выберите новое значение')
+        if not cleaned_data.get('ids') and not cleaned_data.get('select_all'):
+            raise forms.ValidationError('Не выбрано ни одной уязвимости')
+        return cleaned_data
+
+    def changes(self):
+        """Изменение для services.bulk_update_vulnerabilities"""
+        action = self.cleaned_data['action']
+        value = self.cleaned_data[action]
+        if action == 'step' and value == StepChoiceField.NO_STEP:
+            value = None
+        return {action: value}
+
+
 class RecommendationForm(forms.ModelForm):
     """Форма для рекомендации"""
     class Meta:
@@ -94,3 +193,25 @@ class ProcessStepForm(forms.ModelForm):
             'order': forms.NumberInput(attrs={'class': 'form-control', 'type': 'number'}),
             'color': forms.Select(attrs={'class': 'form-select'}),
         }
+
+
+class ImportForm(forms.Form):
+    """Загрузка файла для массового импорта процессов, шагов и уязвимостей"""
+    file = forms.FileField(
+        label='Файл (CSV, JSON или JSON Lines)',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.json,.jsonl,.ndjson'}),
+    )
+    autoscan = forms.BooleanField(
+        label='Запустить автоскан импортированных процессов',
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        self.format = detect_format(upload.name)
+        if self.format is None:
+            raise forms.ValidationError('Поддерживаются файлы .csv, .json и .jsonl')
+        if upload.size > settings.IMPORT_MAX_UPLOAD_MB * 1024 * 1024:
+            raise forms.ValidationError(f'Файл больше {settings.IMPORT_MAX_UPLOAD_MB} МБ')
+        return upload
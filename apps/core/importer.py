@@ -0,0 +1,544 @@
+"""
+Массовый импорт процессов, шагов и уязвимостей из CSV, JSON Lines или JSON.
+
+Каждая строка описывает процесс и, при необходимости, шаг и уязвимость:
+
+    process, process_description, criticality,
+    step, step_description, step_order,
+    title, description, severity, status
+
+Процессы сопоставляются по названию (у владельца), шаги - по названию внутри
+процесса: существующие переиспользуются, новые создаются. Уже существующая
+уязвимость (процесс, шаг, название) пропускается, поэтому повторный импорт
+того же файла ничего не дублирует.
+
+JSON может быть массивом таких строк или вложенной структурой
+{"processes": [{"name": ..., "steps": [{"name": ..., "vulnerabilities": [...]}],
+"vulnerabilities": [...]}]}.
+
+Файл читается потоком и обрабатывается порциями: строки порции проверяются,
+ошибочные попадают в отчет с номером строки, остальные записываются через
+bulk_create в отдельной транзакции. Массовая вставка обходит сигналы, поэтому
+сводные счетчики, полнотекстовый индекс и журнал изменений обновляются
+здесь же.
+
+JSON разбирается по элементам массива (во вложенной структуре - по
+процессам), поэтому в памяти одновременно только одна строка или один
+процесс со всеми шагами. Синтаксическая ошибка в JSON прерывает импорт там,
+где она встретилась: порции до нее уже записаны.
+"""
+import csv
+import io
+import json
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import audit, search
+from .caching import invalidate_dashboard
+from .db import retry_on_locked
+from .models import BusinessProcess, ProcessStep, Vulnerability
+from .rollups import apply_rollup_deltas, count_deltas
+
+IMPORT_CHUNK_SIZE = 2000
+# Сколько ошибок хранить в отчете (остальные только считаются)
+MAX_REPORTED_ERRORS = 200
+
+FORMATS = ('csv', 'json', 'jsonl')
+
+# Порция чтения JSON (символов); буфер растет, только пока не прочитан длинный элемент
+JSON_READ_SIZE = 64 * 1024
+
+COLUMNS = (
+    'process', 'process_description', 'criticality',
+    'step', 'step_description', 'step_order',
+    'title', 'description', 'severity', 'status',
+)
+
+
+class ImportFileError(Exception):
+    """Файл нельзя обработать целиком (формат, кодировка, нет обязательных колонок)"""
+
+
+class RowError(ValueError):
+    """Ошибка в отдельной строке: строка пропускается и попадает в отчет"""
+
+
+class ImportReport:
+    """Итоги импорта: сколько строк обработано, что создано, ошибки по строкам"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = Counter()
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.process_ids = set()
+
+    def add_error(self, ref, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': ref, 'error': message})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'processes': self.created['processes'],
+            'steps': self.created['steps'],
+            'vulnerabilities': self.created['vulnerabilities'],
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'process_ids': sorted(self.process_ids),
+        }
+
+
+def detect_format(filename):
+    """Формат по расширению файла; None, если расширение не поддерживается"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'ndjson':
+        return 'jsonl'
+    return extension if extension in FORMATS else None
+
+
+def read_rows(fileobj, fmt):
+    """
+    Строки файла: пары (номер строки или путь в JSON, словарь).
+    Вместо словаря может быть RowError, если строку не удалось разобрать.
+    fileobj - бинарный файл.
+    """
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    try:
+        if fmt == 'csv':
+            yield from _read_csv(text)
+        elif fmt == 'jsonl':
+            yield from _read_jsonl(text)
+        else:
+            yield from _read_json(text)
+    except UnicodeDecodeError:
+        raise ImportFileError('Файл должен быть в кодировке UTF-8')
+    finally:
+        # Файл закрывает вызывающий код
+        text.detach()
+
+
+def _read_csv(text):
+    header = text.readline()
+    # Excel в русской локали сохраняет CSV с разделителем ";"
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    fieldnames = [name.strip().lower() for name in next(csv.reader([header], delimiter=delimiter), [])]
+    if 'process' not in fieldnames:
+        raise ImportFileError('В CSV нет обязательной колонки "process"')
+    reader = csv.DictReader(text, fieldnames=fieldnames, delimiter=delimiter)
+    for row in reader:
+        # +1: заголовок прочитан отдельно
+        yield reader.line_num + 1, row
+
+
+def _read_jsonl(text):
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as exc:
+            yield number, RowError(f'Некорректный JSON: {exc}')
+            continue
+        yield number, item if isinstance(item, dict) else RowError('Ожидался объект JSON')
+
+
+class _JsonStream:
+    """
+    Пошаговый разбор JSON-документа: массивы и объекты верхних уровней читаются
+    по элементам, каждый элемент разбирается json целиком. В памяти - текущий
+    элемент и непрочитанный остаток буфера, а не весь файл.
+    """
+
+    # Сколько последних символов буфера может оказаться началом недочитанного значения
+    # (число "-1.5e" из "-1.5e+10", литерал "fals")
+    TAIL = 16
+
+    def __init__(self, text):
+        self._text = text
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        # Сколько символов файла уже отброшено из буфера (для позиции в ошибках)
+        self._offset = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        # Порция растет вместе с буфером: длинный элемент дочитывается за O(n), а не O(n^2)
+        chunk = self._text.read(max(JSON_READ_SIZE, len(self._buffer) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, message):
+        return ValueError(f'{message} (символ {self._offset + self._pos + 1})')
+
+    def peek(self):
+        """Следующий символ после пробелов; '' - конец файла"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self.peek() != char:
+            raise self._error(f'Ожидался символ "{char}"')
+        self._pos += 1
+
+    def value(self):
+        """Следующее значение целиком"""
+        if not self.peek():
+            raise self._error('Неожиданный конец файла')
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as exc:
+                # Ошибка у конца буфера или незакрытая строка - элемент еще не дочитан;
+                # ошибка раньше - синтаксическая, остаток файла не читаем
+                incomplete = exc.pos >= len(self._buffer) - self.TAIL or exc.msg.startswith('Unterminated string')
+                if incomplete and self._fill():
+                    continue
+                self._pos = exc.pos
+                raise self._error(exc.msg)
+            # Число у границы порции может продолжаться в следующей
+            is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if is_number and end >= len(self._buffer) - self.TAIL and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _separated(self, close):
+        """Разделители элементов до закрывающей скобки close"""
+        if self.peek() == close:
+            self._pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            if char not in (',', close):
+                raise self._error(f'Ожидался символ "," или "{close}"')
+            self._pos += 1
+            if char == close:
+                return
+
+    def items(self):
+        """Элементы массива в текущей позиции"""
+        self._expect('[')
+        for _ in self._separated(']'):
+            yield self.value()
+
+    def keys(self):
+        """
+        Ключи объекта в текущей позиции. Значение ключа вызывающий код
+        читает сам (value() или items()) до перехода к следующему ключу.
+        """
+        self._expect('{')
+        for _ in self._separated('}'):
+            key = self.value()
+            if not isinstance(key, str):
+                raise self._error('Ключ объекта должен быть строкой')
+            self._expect(':')
+            yield key
+
+    def end(self):
+        if self.peek():
+            raise self._error('Лишние данные после JSON')
+
+
+def _read_json(text):
+    stream = _JsonStream(text)
+    try:
+        first = stream.peek()
+        if first == '[':
+            for index, item in enumerate(stream.items(), start=1):
+                yield index, item if isinstance(item, dict) else RowError('Ожидался объект JSON')
+        elif first == '{':
+            found = False
+            for key in stream.keys():
+                if key == 'processes' and stream.peek() == '[':
+                    found = True
+                    yield from _flatten_processes(stream.items())
+                else:
+                    stream.value()
+            if not found:
+                raise ImportFileError('Ожидался массив строк или объект с ключом "processes"')
+        else:
+            stream.value()
+            stream.end()
+            raise ImportFileError('Ожидался массив строк или объект с ключом "processes"')
+        stream.end()
+    except UnicodeDecodeError:
+        raise
+    except ValueError as exc:
+        raise ImportFileError(f'Некорректный JSON: {exc}')
+
+
+def _flatten_processes(processes):
+    """Вложенное описание процессов -> плоские строки того же вида, что и в CSV"""
+    for p_index, process in enumerate(processes):
+        ref = f'processes[{p_index}]'
+        if not isinstance(process, dict):
+            yield ref, RowError('Ожидался объект процесса')
+            continue
+        base = {
+            'process': process.get('name'),
+            'process_description': process.get('description'),
+            'criticality': process.get('criticality'),
+        }
+        yield ref, base
+        for v_index, vuln in enumerate(process.get('vulnerabilities') or []):
+            yield f'{ref}.vulnerabilities[{v_index}]', {**base, **_vulnerability_fields(vuln)}
+        for s_index, step in enumerate(process.get('steps') or []):
+            step_ref = f'{ref}.steps[{s_index}]'
+            if not isinstance(step, dict):
+                yield step_ref, RowError('Ожидался объект шага')
+                continue
+            step_row = {
+                **base,
+                'step': step.get('name'),
+                'step_description': step.get('description'),
+                'step_order': step.get('order'),
+            }
+            yield step_ref, step_row
+            for v_index, vuln in enumerate(step.get('vulnerabilities') or []):
+                yield f'{step_ref}.vulnerabilities[{v_index}]', {**step_row, **_vulnerability_fields(vuln)}
+
+
+def _vulnerability_fields(vuln):
+    if not isinstance(vuln, dict):
+        return {'title': None, '_error': 'Ожидался объект уязвимости'}
+    return {key: vuln.get(key) for key in ('title', 'description', 'severity', 'status')}
+
+
+def _text(row, name, max_length=None):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if max_length and len(value) > max_length:
+        raise RowError(f'{name}: длиннее {max_length} символов')
+    return value
+
+
+def _choice(row, name, choices, default):
+    """Значение из choices по коду или названию (без учета регистра)"""
+    value = _text(row, name)
+    if not value:
+        return default
+    lowered = value.lower()
+    for code, label in choices:
+        if lowered in (str(code).lower(), label.lower()):
+            return code
+    raise RowError(f'{name}: недопустимое значение "{value}"')
+
+
+def clean_row(row):
+    """Проверяет и нормализует строку; RowError - строка некорректна"""
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Ожидался объект')
+    if row.get('_error'):
+        raise RowError(row['_error'])
+    row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+
+    process = _text(row, 'process', 255)
+    if not process:
+        raise RowError('process: не указано название процесса')
+
+    step = _text(row, 'step', 100)
+    order = _text(row, 'step_order')
+    if order and not order.isdecimal():
+        raise RowError('step_order: ожидалось неотрицательное целое число')
+
+    title = _text(row, 'title', 255)
+    if not title and any(_text(row, name) for name in ('description', 'severity', 'status')):
+        raise RowError('title: у уязвимости не указано название')
+
+    return {
+        'process': process,
+        'process_description': _text(row, 'process_description'),
+        'criticality': _choice(row, 'criticality', BusinessProcess.CRITICALITY_CHOICES, 'medium'),
+        'step': step,
+        'step_description': _text(row, 'step_description'),
+        'step_order': int(order) if order else None,
+        'title': title,
+        'description': _text(row, 'description'),
+        'severity': _choice(row, 'severity', Vulnerability.SEVERITY_CHOICES, 3),
+        'status': _choice(row, 'status', Vulnerability.STATUS_CHOICES, 'open'),
+    }
+
+
+class Importer:
+    """
+    Импорт в процессы одного владельца. Процессы, шаги и ключи уже известных
+    уязвимостей кешируются между порциями, поэтому на порцию приходится
+    несколько запросов, а не несколько на строку.
+    """
+
+    def __init__(self, owner, chunk_size=IMPORT_CHUNK_SIZE):
+        self.owner = owner
+        self.chunk_size = chunk_size
+        self.today = timezone.localdate()
+        self.report = ImportReport()
+        # При совпадении названий берем самый старый процесс
+        self.processes = dict(
+            BusinessProcess.objects.filter(owner=owner).order_by('-pk').values_list('name', 'pk')
+        )
+        self.steps = {}
+        self.next_order = {}
+        self.loaded_processes = set()
+        self.vulnerability_keys = set()
+
+    def run(self, rows, progress=None):
+        """Импортирует строки read_rows(); progress(число строк) - после каждой порции"""
+        chunk = []
+        for ref, row in rows:
+            self.report.rows += 1
+            try:
+                chunk.append((ref, clean_row(row)))
+            except RowError as exc:
+                self.report.add_error(ref, str(exc))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+                if progress:
+                    progress(self.report.rows)
+        if chunk:
+            self._import_chunk(chunk)
+        if progress:
+            progress(self.report.rows)
+        if self.report.process_ids:
+            invalidate_dashboard(self.owner.pk)
+        return self.report
+
+    def _load_process_state(self, process_ids):
+        """Шаги и названия уязвимостей процессов, впервые встреченных в файле"""
+        process_ids = set(process_ids) - self.loaded_processes
+        if not process_ids:
+            return
+        for pk, process_id, name, order in ProcessStep.objects.filter(
+                business_process_id__in=process_ids).values_list('pk', 'business_process_id', 'name', 'order'):
+            self.steps.setdefault((process_id, name), pk)
+            self.next_order[process_id] = max(self.next_order.get(process_id, 0), order + 1)
+        self.vulnerability_keys.update(
+            Vulnerability.objects.filter(business_process_id__in=process_ids)
+            .values_list('business_process_id', 'step_id', 'title')
+        )
+        self.loaded_processes |= process_ids
+
+    def _import_chunk(self, chunk):
+        self._load_process_state(
+            self.processes[row['process']] for _, row in chunk if row['process'] in self.processes
+        )
+        processes, steps, vulnerabilities, skipped = self._write_chunk(chunk)
+
+        # Кеши обновляем только после успешной фиксации транзакции
+        for process in processes:
+            self.processes[process.name] = process.pk
+            self.loaded_processes.add(process.pk)
+        for step in steps:
+            self.steps[(step.business_process_id, step.name)] = step.pk
+            self.next_order[step.business_process_id] = max(
+                self.next_order.get(step.business_process_id, 0), step.order + 1)
+        self.vulnerability_keys.update(
+            (vuln.business_process_id, vuln.step_id, vuln.title) for vuln in vulnerabilities
+        )
+
+        self.report.created.update({
+            'processes': len(processes),
+            'steps': len(steps),
+            'vulnerabilities': len(vulnerabilities),
+        })
+        self.report.skipped += skipped
+        self.report.process_ids.update(process.pk for process in processes)
+        self.report.process_ids.update(step.business_process_id for step in steps)
+        self.report.process_ids.update(vuln.business_process_id for vuln in vulnerabilities)
+
+    @retry_on_locked
+    def _write_chunk(self, chunk):
+        """Записывает порцию в одной транзакции; кеши импортера не меняет"""
+        with transaction.atomic():
+            new_processes = {}
+            for _, row in chunk:
+                name = row['process']
+                if name not in self.processes and name not in new_processes:
+                    new_processes[name] = BusinessProcess(
+                        name=name,
+                        description=row['process_description'],
+                        criticality=row['criticality'],
+                        owner=self.owner,
+                    )
+            processes = BusinessProcess.objects.bulk_create(new_processes.values())
+            process_ids = {**self.processes, **{process.name: process.pk for process in processes}}
+
+            new_steps = {}
+            next_order = dict(self.next_order)
+            for _, row in chunk:
+                if not row['step']:
+                    continue
+                key = (process_ids[row['process']], row['step'])
+                if key in self.steps or key in new_steps:
+                    continue
+                order = row['step_order']
+                if order is None:
+                    order = next_order.get(key[0], 0)
+                next_order[key[0]] = max(next_order.get(key[0], 0), order + 1)
+                new_steps[key] = ProcessStep(
+                    business_process_id=key[0],
+                    name=row['step'],
+                    description=row['step_description'],
+                    order=order,
+                )
+            steps = ProcessStep.objects.bulk_create(new_steps.values())
+            step_ids = {**self.steps, **{key: step.pk for key, step in zip(new_steps, steps)}}
+
+            new_vulnerabilities = {}
+            skipped = 0
+            for _, row in chunk:
+                if not row['title']:
+                    continue
+                process_id = process_ids[row['process']]
+                step_id = step_ids[(process_id, row['step'])] if row['step'] else None
+                key = (process_id, step_id, row['title'])
+                if key in self.vulnerability_keys or key in new_vulnerabilities:
+                    skipped += 1
+                    continue
+                new_vulnerabilities[key] = Vulnerability(
+                    business_process_id=process_id,
+                    step_id=step_id,
+                    title=row['title'],
+                    description=row['description'],
+                    severity=row['severity'],
+                    status=row['status'],
+                    # Как в Vulnerability.save: дата решения для метрики времени устранения
+                    resolved_date=self.today if row['status'] == 'resolved' else None,
+                )
+            vulnerabilities = Vulnerability.objects.bulk_create(new_vulnerabilities.values())
+
+            apply_rollup_deltas(count_deltas(vulnerabilities))
+            search.index_objects('vulnerability', [vuln.pk for vuln in vulnerabilities])
+            audit.record(
+                audit.created_entries(processes)
+                + audit.created_entries(steps)
+                + audit.created_entries(vulnerabilities)
+            )
+
+        return processes, steps, vulnerabilities, skipped
+
+
+def import_file(owner, fileobj, fmt, progress=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """Импортирует бинарный файл fileobj в формате fmt; возвращает ImportReport"""
+    return Importer(owner, chunk_size=chunk_size).run(read_rows(fileobj, fmt), progress=progress)
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import audit, exports
+from .importer import import_file
+from .db import retry_on_locked
+from .models import BusinessProcess, Job
+from .services import auto_scan_process
+
+logger = logging.getLogger(__name__)
+
+# Обработчики задач по типу: handler(job, progress) -> dict с результатом
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Регистрирует обработчик для задач указанного типа"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind, owner, business_process=None, params=None, dedupe_key=''):
+    """
+    Ставит задачу в очередь. Если активная задача с тем же ключом
+    дедупликации уже есть, возвращает ее вместо создания новой.
+    Возвращает пару (задача, создана_ли_новая).
+    """
+    if dedupe_key:
+        _fail_stale_jobs(dedupe_key)
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status__in=Job.ACTIVE_STATUSES).first()
+        if existing:
+            return existing, False
+
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(
+                kind=kind,
+                owner=owner,
+                business_process=business_process,
+                params=params or {},
+                dedupe_key=dedupe_key,
+            )
+    except IntegrityError:
+        # Параллельный запрос успел поставить такую же задачу
+        return Job.objects.get(dedupe_key=dedupe_key, status__in=Job.ACTIVE_STATUSES), False
+
+    transaction.on_commit(lambda: _dispatch(job.pk))
+    return job, True
+
+
+def _fail_stale_jobs(dedupe_key):
+    """
+    Зависшие задачи (например, после перезапуска сервера) не блокируют новые:
+    и начатые, и так и не запущенные - встроенный пул потоков теряет очередь
+    вместе с процессом. Задача в работе зависла, если давно не сообщала о ходе
+    работы (heartbeat_at), а не если просто давно начата: долгий скан жив.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.JOBS_STALE_SECONDS)
+    jobs = Job.objects.filter(dedupe_key=dedupe_key)
+    jobs.filter(status='running', heartbeat_at__lt=stale_before).update(
+        status='failed',
+        error='Задача прервана',
+        finished_at=now,
+    )
+    jobs.filter(status='queued', created_at__lt=stale_before).update(
+        status='failed',
+        error='Задача не была запущена',
+        finished_at=now,
+    )
+
+
+def enqueue_autoscan(process, user, full=False):
+    """Ставит автоскан процесса в очередь (не более одного активного на процесс)"""
+    return enqueue_job(
+        'autoscan',
+        owner=user,
+        business_process=process,
+        params={'full': full},
+        dedupe_key=f'autoscan:{process.pk}',
+    )
+
+
+def enqueue_export(user, dataset, fmt, filters):
+    """Ставит выгрузку в файл в очередь (одинаковые активные выгрузки не дублируются)"""
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()[:12]
+    return enqueue_job(
+        'export',
+        owner=user,
+        params={'dataset': dataset, 'format': fmt, 'filters': filters},
+        dedupe_key=f'export:{user.pk}:{dataset}:{fmt}:{digest}',
+    )
+
+
+def enqueue_import(user, path, fmt, autoscan=False):
+    """Ставит импорт загруженного файла в очередь"""
+    return enqueue_job(
+        'import',
+        owner=user,
+        params={'file': str(path), 'format': fmt, 'autoscan': autoscan},
+    )
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.JOBS_WORKER_THREADS,
+                thread_name_prefix='riskmap-jobs',
+            )
+        return _executor
+
+
+def _dispatch(job_id):
+    """
+    Запускает задачу во встроенном пуле потоков. При JOBS_WORKER_THREADS = 0
+    задачи остаются в очереди для отдельного процесса `manage.py run_jobs`.
+    """
+    if settings.JOBS_WORKER_THREADS > 0:
+        _get_executor().submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # У каждого потока свое соединение с БД - закрываем его сами
+        connection.close()
+
+
+@retry_on_locked
+def claim_job(job_id):
+    """Атомарно переводит задачу из очереди в работу; None, если ее уже забрали"""
+    now = timezone.now()
+    claimed = Job.objects.filter(pk=job_id, status='queued').update(
+        status='running',
+        started_at=now,
+        heartbeat_at=now,
+    )
+    if not claimed:
+        return None
+    return Job.objects.select_related('business_process', 'owner').get(pk=job_id)
+
+
+def claim_next_job():
+    """Забирает самую старую задачу из очереди"""
+    for job_id in Job.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)[:10]:
+        job = claim_job(job_id)
+        if job:
+            return job
+    return None
+
+
+def run_job(job_id=None, job=None):
+    """Выполняет задачу и сохраняет результат или ошибку"""
+    if job is None:
+        job = claim_job(job_id)
+        if job is None:
+            return None
+
+    @retry_on_locked
+    def progress(done, total):
+        job.progress_done, job.progress_total = done, total
+        Job.objects.filter(pk=job.pk).update(progress_done=done, progress_total=total, heartbeat_at=timezone.now())
+
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        # Изменения фоновой задачи попадают в журнал от имени ее владельца
+        with audit.acting_as(job.owner):
+            job.result = handler(job, progress) or {}
+        job.status = 'done'
+    except Exception as exc:
+        logger.exception('Фоновая задача %s завершилась с ошибкой', job.pk)
+        job.status = 'failed'
+        job.error = str(exc)
+
+    job.finished_at = timezone.now()
+    if not _save_job_outcome(job):
+        # Задачу сняли как зависшую - ее итог уже записан, не перезаписываем
+        logger.warning('Фоновая задача %s уже снята, результат не сохранен', job.pk)
+        job.refresh_from_db()
+    return job
+
+
+@retry_on_locked
+def _save_job_outcome(job):
+    """Записывает итог задачи, если она все еще в работе; False - уже завершена"""
+    return bool(Job.objects.filter(pk=job.pk, status='running').update(
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        finished_at=job.finished_at,
+    ))
+
+
+def run_pending_jobs(limit=None):
+    """Выполняет задачи из очереди, пока она не опустеет; возвращает их число"""
+    processed = 0
+    while limit is None or processed < limit:
+        close_old_connections()
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job=job)
+        processed += 1
+    return processed
+
+
+@job_handler('autoscan')
+def _autoscan_job(job, progress):
+    new_vulns = auto_scan_process(
+        job.business_process,
+        full=job.params.get('full', False),
+        progress=progress,
+    )
+    return {'created': len(new_vulns)}
+
+
+def export_path(job):
+    """Файл, в который фоновая выгрузка пишет результат"""
+    return settings.EXPORTS_ROOT / f"{job.pk}-{job.params['dataset']}.{job.params['format']}"
+
+
+def _purge_old_exports():
+    """Удаляет файлы выгрузок старше EXPORT_FILE_TTL_HOURS"""
+    expire_before = time.time() - settings.EXPORT_FILE_TTL_HOURS * 3600
+    for path in settings.EXPORTS_ROOT.iterdir():
+        if path.is_file() and path.stat().st_mtime < expire_before:
+            path.unlink(missing_ok=True)
+
+
+@job_handler('export')
+def _export_job(job, progress):
+    dataset, fmt = job.params['dataset'], job.params['format']
+    filters = job.params.get('filters', {})
+    settings.EXPORTS_ROOT.mkdir(parents=True, exist_ok=True)
+    _purge_old_exports()
+
+    total = exports.export_queryset(dataset, job.owner, filters).count()
+    progress(0, total)
+    path = export_path(job)
+    partial = path.with_name(path.name + '.part')
+
+    # Пишем во временный файл: недописанная выгрузка не должна попасть к пользователю
+    with open(partial, 'wb') as output:
+        for data in exports.stream_export(dataset, fmt, job.owner, filters,
+                                          progress=lambda done: progress(done, total)):
+            output.write(data)
+    partial.replace(path)
+    progress(total, total)
+    return {
+        'file': path.name,
+        'filename': exports.export_filename(dataset, fmt),
+        'rows': total,
+        'size': path.stat().st_size,
+    }
+
+
+@job_handler('import')
+def _import_job(job, progress):
+    path = Path(job.params['file'])
+    size = path.stat().st_size
+    try:
+        with open(path, 'rb') as source:
+            # Прогресс - по прочитанной части файла: число строк заранее неизвестно
+            report = import_file(
+                job.owner, source, job.params['format'],
+                progress=lambda rows: progress(min(source.tell(), size), size),
+            )
+    finally:
+        path.unlink(missing_ok=True)
+
+    result = report.as_dict()
+    if job.params.get('autoscan'):
+        result['autoscan_jobs'] = [
+            enqueue_autoscan(process, job.owner)[0].pk
+            for process in BusinessProcess.objects.filter(pk__in=report.process_ids, owner=job.owner)
+        ]
+    return result
@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.core.audit import archive_before, archive_root, purge_archives
+from apps.core.models import AuditLog
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые записи журнала аудита в сжатые архивы по месяцам (JSON Lines + gzip)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.AUDIT_LOG_RETENTION_DAYS,
+            help='Оставить в таблице записи за столько последних дней (по умолчанию AUDIT_LOG_RETENTION_DAYS)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать записи для переноса')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days не может быть отрицательным')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        if options['dry_run']:
+            count = AuditLog.objects.filter(timestamp__lt=cutoff).count()
+            self.stdout.write(f'Будет перенесено в архив: {count} записей старше {cutoff:%d.%m.%Y}')
+            return
+
+        started = time.monotonic()
+        moved = archive_before(
+            cutoff,
+            progress=lambda done: self.stdout.write(f'  перенесено: {done}', ending='\r'),
+        )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'В архив {archive_root()} перенесено {moved} записей за {time.monotonic() - started:.1f} с'
+        ))
+
+        if settings.AUDIT_ARCHIVE_RETENTION_DAYS:
+            purged = purge_archives(timezone.now() - timedelta(days=settings.AUDIT_ARCHIVE_RETENTION_DAYS))
+            if purged:
+                self.stdout.write(f"Удалены архивы за месяцы: {', '.join(purged)}")
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import time
+from datetime import datetime, time as dt_time
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from apps.core.models import BusinessProcess
+from apps.core.services import auto_scan_process
+
+
+def _init_worker(settings_module):
+    """Подготавливает Django в дочернем процессе (нужно при методе запуска spawn)"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    if not apps.ready:
+        django.setup()
+    # Соединения, унаследованные через fork, использовать нельзя
+    connections.close_all()
+
+
+def _scan_one(task):
+    """Сканирует один процесс; возвращает (pk, название, найдено, секунд, ошибка)"""
+    pk, full, dry_run = task
+    started = time.monotonic()
+    try:
+        process = BusinessProcess.objects.get(pk=pk)
+        found = auto_scan_process(process, full=full, dry_run=dry_run)
+        return pk, process.name, len(found), time.monotonic() - started, ''
+    except Exception as exc:
+        return pk, '', 0, time.monotonic() - started, str(exc)
+
+
+class Command(BaseCommand):
+    help = 'Автоскан всех активных бизнес-процессов (например, после загрузки нового банка шаблонов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Число процессов-воркеров')
+        parser.add_argument('--chunk-size', type=int, default=10, help='Сколько процессов выдавать воркеру за раз')
+        parser.add_argument('--owner', help='Только процессы указанного пользователя (username)')
+        parser.add_argument('--since', help='Только процессы, измененные начиная с даты ГГГГ-ММ-ДД')
+        parser.add_argument('--full', action='store_true', help='Пересканировать все шаги, а не только измененные')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать находки, ничего не записывая')
+
+    def handle(self, *args, **options):
+        processes = BusinessProcess.objects.filter(is_active=True)
+
+        if options['owner']:
+            owner = get_user_model().objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f"Пользователь '{options['owner']}' не найден")
+            processes = processes.filter(owner=owner)
+
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('Дата --since должна быть в формате ГГГГ-ММ-ДД')
+            processes = processes.filter(
+                updated_at__gte=timezone.make_aware(datetime.combine(since, dt_time.min))
+            )
+
+        tasks = [
+            (pk, options['full'], options['dry_run'])
+            for pk in processes.order_by('pk').values_list('pk', flat=True)
+        ]
+        if not tasks:
+            self.stdout.write('Нет процессов для сканирования.')
+            return
+
+        workers = max(1, min(options['workers'], len(tasks)))
+        chunk_size = max(1, options['chunk_size'])
+        mode = ' (пробный запуск)' if options['dry_run'] else ''
+        self.stdout.write(f'Процессов: {len(tasks)}, воркеров: {workers}{mode}')
+
+        started = time.monotonic()
+        results = []
+        if workers == 1:
+            for task in tasks:
+                results.append(self._report(_scan_one(task), len(results) + 1, len(tasks)))
+        else:
+            # Дочерние процессы открывают свои соединения с БД
+            connections.close_all()
+            context = multiprocessing.get_context()
+            with context.Pool(
+                workers,
+                initializer=_init_worker,
+                initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+            ) as pool:
+                for result in pool.imap_unordered(_scan_one, tasks, chunksize=chunk_size):
+                    results.append(self._report(result, len(results) + 1, len(tasks)))
+
+        self._summary(results, time.monotonic() - started, options['dry_run'])
+
+    def _report(self, result, done, total):
+        pk, name, found, elapsed, error = result
+        if error:
+            self.stdout.write(self.style.ERROR(f'[{done}/{total}] #{pk}: ошибка - {error}'))
+        else:
+            self.stdout.write(f'[{done}/{total}] #{pk} {name}: найдено {found} ({elapsed:.2f} с)')
+        return result
+
+    def _summary(self, results, elapsed, dry_run):
+        scanned = [r for r in results if not r[4]]
+        failed = len(results) - len(scanned)
+        findings = sum(r[2] for r in scanned)
+        avg_time = sum(r[3] for r in scanned) / len(scanned) if scanned else 0
+        slowest = max(scanned, key=lambda r: r[3], default=None)
+
+        verb = 'будет создано' if dry_run else 'создано'
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.2f} с. Просканировано процессов: {len(scanned)}, '
+            f'уязвимостей {verb}: {findings}, ошибок: {failed}.'
+        ))
+        self.stdout.write(f'Среднее время на процесс: {avg_time:.3f} с')
+        if slowest:
+            self.stdout.write(f'Самый долгий: #{slowest[0]} {slowest[1]} ({slowest[3]:.3f} с)')
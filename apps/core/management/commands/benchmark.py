@@ -0,0 +1,259 @@
+import json
+import platform
+import subprocess
+import time
+from contextlib import ExitStack
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from apps.api.models import ApiToken
+from apps.core import audit
+from apps.core.models import BusinessProcess, Vulnerability
+from apps.core.routers import REPLICA_ALIAS
+from apps.core.search import rebuild_index
+from apps.core.services import auto_scan_process, calculate_risk_metrics
+from apps.core.synthetic import generate
+
+# Объемы данных: процессов на пользователя, шагов и уязвимостей на процесс
+SCALES = {
+    'small': dict(users=2, processes=5, steps=10, vulnerabilities=20, templates=50),
+    'medium': dict(users=5, processes=20, steps=25, vulnerabilities=50, templates=500),
+    'large': dict(users=10, processes=50, steps=50, vulnerabilities=100, templates=2000),
+}
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _toggle(text):
+    """Изменение текста, которое следующий вызов отменяет"""
+    return text[:-1] if text.endswith('.') else text + '.'
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время и число SQL-запросов ключевых операций на синтетических данных '
+        'разного объема. Работает на отдельной тестовой базе, рабочая база не затрагивается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', default='small,medium',
+            help=f"Объемы через запятую: {', '.join(SCALES)}",
+        )
+        parser.add_argument('--repeat', type=int, default=10, help='Повторов каждого замера')
+        parser.add_argument('--seed', type=int, default=42, help='Начальное значение генератора данных')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        scales = [name.strip() for name in options['scales'].split(',') if name.strip()]
+        unknown = [name for name in scales if name not in SCALES]
+        if unknown:
+            raise CommandError(f"Неизвестный объем: {', '.join(unknown)}")
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным')
+
+        report = {
+            'meta': {
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'revision': _git_revision(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+            },
+            'scales': {},
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        if REPLICA_ALIAS in settings.DATABASES:
+            # Представления с use_replica должны читать ту же тестовую базу
+            connections[REPLICA_ALIAS].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            for name in scales:
+                report['scales'][name] = self._run_scale(name, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+    def _run_scale(self, name, options):
+        call_command('flush', interactive=False, verbosity=0)
+        # flush не знает о полнотекстовом индексе - очищаем его отдельно
+        rebuild_index()
+        cache.clear()
+
+        started = time.monotonic()
+        counts = generate(seed=options['seed'], **SCALES[name])
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{name}: {counts['vulnerabilities']} уязвимостей, {counts['templates']} шаблонов "
+            f"(генерация {time.monotonic() - started:.1f} с)"
+        ))
+
+        process = BusinessProcess.objects.select_related('owner').order_by('pk').first()
+        user = process.owner
+        vulnerability = Vulnerability.objects.filter(business_process=process).order_by('pk').first()
+
+        client = Client()
+        client.force_login(user)
+
+        # Накладные расходы журнала изменений: те же операции с отслеживанием и без
+        bulk_ids = list(
+            Vulnerability.objects.filter(business_process__owner=user)
+            .order_by('pk').values_list('pk', flat=True)[:100]
+        )
+
+        def edit(tracked=True, bulk=False):
+            def call():
+                with ExitStack() as stack:
+                    if not tracked:
+                        stack.enter_context(audit.disabled())
+                    if bulk:
+                        objs = list(Vulnerability.objects.filter(pk__in=bulk_ids))
+                        for obj in objs:
+                            obj.description = _toggle(obj.description)
+                        audit.bulk_update(objs, ['description'])
+                    else:
+                        obj = Vulnerability.objects.get(pk=vulnerability.pk)
+                        obj.description = _toggle(obj.description)
+                        obj.save()
+            return call
+
+        def load(tracked=True):
+            def call():
+                with ExitStack() as stack:
+                    if not tracked:
+                        stack.enter_context(audit.disabled())
+                    list(Vulnerability.objects.filter(business_process__owner=user))
+            return call
+
+        def view(url_name, *args, cold_cache=False, query='', not_modified=False):
+            url = reverse(url_name, args=args) + query
+            headers = {}
+
+            def call():
+                if cold_cache:
+                    cache.clear()
+                response = client.get(url, **headers)
+                if response.status_code != (304 if headers else 200):
+                    raise CommandError(f'{url}: HTTP {response.status_code}')
+
+            def prepare():
+                # ETag берется непосредственно перед замером: предыдущие сценарии меняют данные
+                headers['HTTP_IF_NONE_MATCH'] = client.get(url)['ETag']
+
+            if not_modified:
+                call.prepare = prepare
+            return call
+
+        # JSON API: полная страница списка и ответ 304 на неизмененный список
+        _, api_key = ApiToken.issue(user, name='benchmark')
+        api_client = Client(HTTP_AUTHORIZATION=f'Token {api_key}')
+
+        def api(url_name, *args, not_modified=False):
+            url = reverse(url_name, args=args) + '?limit=200'
+            headers = {}
+
+            def call():
+                response = api_client.get(url, **headers)
+                if response.status_code != (304 if headers else 200):
+                    raise CommandError(f'{url}: HTTP {response.status_code}')
+
+            def prepare():
+                # ETag берется непосредственно перед замером: предыдущие сценарии меняют данные
+                headers['HTTP_IF_NONE_MATCH'] = api_client.get(url)['ETag']
+
+            if not_modified:
+                call.prepare = prepare
+            return call
+
+        # Первый проход автоскана создает находки, поэтому замеряется отдельно от повторных
+        scenarios = [
+            ('autoscan_first', lambda: auto_scan_process(process, full=True), 1),
+            ('autoscan_full', lambda: auto_scan_process(process, full=True), None),
+            ('autoscan_unchanged', lambda: auto_scan_process(process), None),
+            ('risk_metrics', lambda: calculate_risk_metrics(user), None),
+            ('dashboard_cold', view('core:dashboard', cold_cache=True), None),
+            ('dashboard_cached', view('core:dashboard'), None),
+            ('process_list', view('core:process_list'), None),
+            ('process_detail', view('core:process_detail', process.pk), None),
+            ('process_decomposition', view('core:process_decomposition', process.pk), None),
+            ('vulnerability_list', view('core:vulnerability_list'), None),
+            ('vulnerability_detail', view('core:vulnerability_detail', vulnerability.pk), None),
+            ('recommendations', view('core:recommendations'), None),
+            ('search', view('core:search', query='?q=загрузка+файлов'), None),
+            ('dashboard_304', view('core:dashboard', not_modified=True), None),
+            ('process_detail_304', view('core:process_detail', process.pk, not_modified=True), None),
+            ('vulnerability_list_304', view('core:vulnerability_list', not_modified=True), None),
+            ('vulnerability_detail_304', view('core:vulnerability_detail', vulnerability.pk, not_modified=True), None),
+            ('api_vulnerability_list', api('api:collection', 'vulnerabilities'), None),
+            ('api_vulnerability_list_304', api('api:collection', 'vulnerabilities', not_modified=True), None),
+            ('api_process_list', api('api:collection', 'processes'), None),
+            ('api_metrics_304', api('api:metrics', not_modified=True), None),
+            ('load_vulnerabilities', load(), None),
+            ('load_vulnerabilities_untracked', load(tracked=False), None),
+            ('vulnerability_save', edit(), None),
+            ('vulnerability_save_untracked', edit(tracked=False), None),
+            ('bulk_update_100', edit(bulk=True), None),
+            ('bulk_update_100_untracked', edit(tracked=False, bulk=True), None),
+        ]
+
+        results = {'data': counts}
+        for label, func, repeat in scenarios:
+            if hasattr(func, 'prepare'):
+                func.prepare()
+            results[label] = self._measure(func, repeat or options['repeat'])
+            stats = results[label]
+            self.stdout.write(
+                f"  {label:<32} p50 {stats['p50_ms']:>9.2f} мс   p95 {stats['p95_ms']:>9.2f} мс   "
+                f"SQL {stats['queries']}"
+            )
+        return results
+
+    @staticmethod
+    def _measure(func, repeat):
+        timings = []
+        queries = []
+        for _ in range(repeat):
+            # Запросы считаем по всем базам (с репликой часть чтений уходит на нее)
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(conn)) for conn in connections.all()]
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(sum(len(ctx.captured_queries) for ctx in captured))
+        return {
+            'runs': repeat,
+            'p50_ms': round(_percentile(timings, 50), 3),
+            'p95_ms': round(_percentile(timings, 95), 3),
+            'mean_ms': round(sum(timings) / repeat, 3),
+            'queries': max(queries),
+        }
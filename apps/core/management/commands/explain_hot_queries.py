@@ -0,0 +1,130 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from apps.core.models import AuditLog, BusinessProcess, ProcessStep, Recommendation, Vulnerability
+from apps.core.synthetic import generate
+
+
+def hot_queries(process):
+    """
+    Запросы горячих путей в том виде, в каком их строят представления и автоскан.
+    Для каждого - таблица, которую нельзя читать полным сканированием.
+    """
+    owner = process.owner
+    vulnerability = Vulnerability.objects.filter(business_process=process).first()
+    steps = list(ProcessStep.objects.filter(business_process=process)[:10])
+    return [
+        (
+            'Уязвимости владельца по статусу',
+            Vulnerability.objects.filter(business_process__owner=owner, status='open')
+            .order_by(*Vulnerability._meta.ordering, '-pk')[:51],
+            Vulnerability._meta.db_table,
+        ),
+        (
+            'Уязвимости владельца по серьезности',
+            Vulnerability.objects.filter(business_process__owner=owner, severity=5)
+            .order_by(*Vulnerability._meta.ordering, '-pk')[:51],
+            Vulnerability._meta.db_table,
+        ),
+        (
+            'Уязвимости процесса (порядок по умолчанию)',
+            Vulnerability.objects.filter(business_process=process)
+            .order_by(*Vulnerability._meta.ordering, '-pk')[:51],
+            Vulnerability._meta.db_table,
+        ),
+        (
+            'Автоскан: уже найденное на шагах',
+            Vulnerability.objects.filter(business_process=process, step__in=steps)
+            .values_list('step_id', 'title'),
+            Vulnerability._meta.db_table,
+        ),
+        (
+            'Невыполненные рекомендации владельца',
+            Recommendation.objects.filter(vulnerability__business_process__owner=owner, is_implemented=False)
+            .order_by(*Recommendation._meta.ordering, '-pk')[:51],
+            Recommendation._meta.db_table,
+        ),
+        (
+            'История уязвимости',
+            AuditLog.objects.filter(vulnerability=vulnerability).order_by('-timestamp')[:50],
+            AuditLog._meta.db_table,
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет по EXPLAIN, что запросы горячих путей (списки, автоскан, история) '
+        'используют индексы. По умолчанию - на тестовой базе с синтетическими данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=500,
+            help='Процессов в синтетической базе (по 200 уязвимостей на процесс)',
+        )
+        parser.add_argument(
+            '--current-db', action='store_true',
+            help='Проверить на текущей базе вместо синтетической',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Разбор плана реализован для SQLite (EXPLAIN QUERY PLAN)')
+
+        if options['current_db']:
+            failures = self._check()
+        else:
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self._seed(options['processes'])
+                failures = self._check()
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        if failures:
+            raise CommandError(f"Полное сканирование таблиц: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы.'))
+
+    def _seed(self, processes):
+        users = max(1, processes // 50)
+        started = time.monotonic()
+        counts = generate(
+            users=users, processes=max(1, processes // users), steps=10,
+            vulnerabilities=200, recommendations=1, audit_logs=1, templates=10,
+        )
+        with connection.cursor() as cursor:
+            # Статистика для планировщика, как на рабочей базе после PRAGMA optimize
+            cursor.execute('ANALYZE')
+        self.stdout.write(
+            f"Синтетическая база: {counts['vulnerabilities']} уязвимостей, "
+            f"{counts['recommendations']} рекомендаций, {counts['audit_logs']} записей аудита "
+            f"({time.monotonic() - started:.1f} с)\n"
+        )
+
+    def _check(self):
+        process = BusinessProcess.objects.select_related('owner').order_by('pk').first()
+        if process is None:
+            raise CommandError('В базе нет ни одного процесса')
+
+        failures = []
+        for label, queryset, table in hot_queries(process):
+            plan = queryset.explain()
+            # "SCAN <таблица>" без индекса - чтение таблицы целиком
+            scans = [
+                line for line in plan.splitlines()
+                if f'SCAN {table}' in line and 'INDEX' not in line
+            ]
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'[FAIL] {label}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'[OK]   {label}'))
+            for line in plan.splitlines():
+                self.stdout.write(f'         {line}')
+        return failures
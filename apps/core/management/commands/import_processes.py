@@ -0,0 +1,56 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core import audit
+from apps.core.importer import IMPORT_CHUNK_SIZE, ImportFileError, detect_format, import_file
+from apps.core.models import BusinessProcess
+from apps.core.services import auto_scan_process
+
+
+class Command(BaseCommand):
+    help = 'Импортирует процессы, шаги и уязвимости из CSV, JSON Lines или JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для импорта')
+        parser.add_argument('--owner', required=True, help='Владелец импортируемых процессов (username)')
+        parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help='Формат (по умолчанию - по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Строк в одной транзакции')
+        parser.add_argument('--autoscan', action='store_true', help='Запустить автоскан затронутых процессов')
+        parser.add_argument('--show-errors', type=int, default=20, help='Сколько ошибок по строкам вывести')
+
+    def handle(self, *args, **options):
+        owner = get_user_model().objects.filter(username=options['owner']).first()
+        if owner is None:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+        fmt = options['format'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError('Не удалось определить формат по расширению, укажите --format')
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as source, audit.acting_as(owner):
+                report = import_file(
+                    owner, source, fmt,
+                    chunk_size=options['chunk_size'],
+                    progress=lambda rows: self.stdout.write(f'  обработано строк: {rows}', ending='\r'),
+                )
+        except (OSError, ImportFileError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write('')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт за {time.monotonic() - started:.1f} с: строк {report.rows}, '
+            f"процессов {report.created['processes']}, шагов {report.created['steps']}, "
+            f"уязвимостей {report.created['vulnerabilities']}, пропущено дубликатов {report.skipped}"
+        ))
+        if report.error_count:
+            self.stdout.write(self.style.WARNING(f'Строк с ошибками: {report.error_count}'))
+            for error in report.errors[:options['show_errors']]:
+                self.stdout.write(f"  {error['row']}: {error['error']}")
+
+        if options['autoscan']:
+            for process in BusinessProcess.objects.filter(pk__in=report.process_ids):
+                found = auto_scan_process(process)
+                self.stdout.write(f'  автоскан "{process.name}": найдено {len(found)}')
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные счетчики рисков (RiskRollup) по таблице уязвимостей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help='Пересчитать только для указанного пользователя (username)')
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['owner']:
+            owner = get_user_model().objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f"Пользователь '{options['owner']}' не найден")
+
+        drifted = rebuild_rollups(owner=owner)
+
+        if drifted:
+            self.stdout.write(self.style.WARNING(f'Исправлено расхождений: {drifted}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Сводные счетчики совпадают с данными.'))
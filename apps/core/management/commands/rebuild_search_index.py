@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс (уязвимости, рекомендации, банк шаблонов)'
+
+    def handle(self, *args, **options):
+        counts = rebuild_index()
+        if not counts:
+            self.stdout.write('Для этой СУБД отдельный индекс не нужен (поиск строится в запросе).')
+            return
+        summary = ', '.join(f'{kind}: {count}' for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Индекс перестроен - {summary}'))
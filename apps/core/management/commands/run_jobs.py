@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди (автоскан и др.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить накопившиеся задачи и выйти')
+        parser.add_argument('--interval', type=float, default=2.0, help='Пауза между опросами очереди, сек.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Обработчик фоновых задач запущен.')
+        while True:
+            processed = run_pending_jobs()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {processed}'))
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетические данные заданного объема (детерминированно по --seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2, help='Число пользователей')
+        parser.add_argument('--processes', type=int, default=5, help='Процессов на пользователя')
+        parser.add_argument('--steps', type=int, default=10, help='Шагов на процесс')
+        parser.add_argument('--vulnerabilities', type=int, default=20, help='Уязвимостей на процесс')
+        parser.add_argument('--recommendations', type=int, default=1, help='Рекомендаций на уязвимость')
+        parser.add_argument('--audit-logs', type=int, default=2, help='Записей аудита на уязвимость')
+        parser.add_argument('--templates', type=int, default=50, help='Шаблонов в банке')
+        parser.add_argument('--seed', type=int, default=42, help='Начальное значение генератора')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = generate(
+            users=options['users'],
+            processes=options['processes'],
+            steps=options['steps'],
+            vulnerabilities=options['vulnerabilities'],
+            recommendations=options['recommendations'],
+            audit_logs=options['audit_logs'],
+            templates=options['templates'],
+            seed=options['seed'],
+        )
+        summary = ', '.join(f'{name}: {count}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано за {time.monotonic() - started:.1f} с - {summary}'
+        ))
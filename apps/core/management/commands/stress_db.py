@@ -0,0 +1,133 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from apps.core.db import is_locked_error, lock_retry_count
+from apps.core.models import BusinessProcess, Vulnerability
+from apps.core.rollups import rebuild_rollups
+from apps.core.services import auto_scan_process
+from apps.core.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка конкурентной записи в SQLite: потоки меняют статусы '
+        'уязвимостей, пока параллельно идет автоскан. Работает на временной файловой '
+        'базе, рабочая база не затрагивается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Потоков, меняющих статусы')
+        parser.add_argument('--writes', type=int, default=200, help='Изменений статуса на поток')
+        parser.add_argument('--scanners', type=int, default=1, help='Потоков с полным автосканом')
+        parser.add_argument('--no-retry', action='store_true', help='Отключить повтор при блокировке')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда предназначена для SQLite')
+
+        fd, path = tempfile.mkstemp(prefix='riskmap-stress-', suffix='.sqlite3')
+        os.close(fd)
+        # Файловая (а не in-memory) тестовая база: блокировки как в рабочем режиме
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            retry_attempts = 1 if options['no_retry'] else None
+            if retry_attempts:
+                with override_settings(DB_LOCK_RETRY_ATTEMPTS=retry_attempts):
+                    self._run(options)
+            else:
+                self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def _run(self, options):
+        generate(users=2, processes=5, steps=10, vulnerabilities=40, templates=200, seed=options['seed'])
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        self.stdout.write(f'journal_mode = {journal_mode}')
+
+        vulnerability_ids = list(Vulnerability.objects.values_list('pk', flat=True))
+        process_ids = list(BusinessProcess.objects.values_list('pk', flat=True))
+        statuses = [status for status, _ in Vulnerability.STATUS_CHOICES]
+
+        lock = threading.Lock()
+        results = {'writes': 0, 'scans': 0, 'locked': 0, 'errors': 0}
+        latencies = []
+        retries_before = lock_retry_count()
+
+        def record(key, latency=None):
+            with lock:
+                results[key] += 1
+                if latency is not None:
+                    latencies.append(latency)
+
+        def writer(index):
+            rng = random.Random(options['seed'] + index)
+            try:
+                for _ in range(options['writes']):
+                    started = time.perf_counter()
+                    try:
+                        vulnerability = Vulnerability.objects.get(pk=rng.choice(vulnerability_ids))
+                        vulnerability.status = rng.choice(statuses)
+                        vulnerability.save()
+                        record('writes', time.perf_counter() - started)
+                    except Exception as exc:
+                        record('locked' if is_locked_error(exc) else 'errors')
+            finally:
+                connections.close_all()
+
+        stop = threading.Event()
+
+        def scanner():
+            try:
+                while not stop.is_set():
+                    for pk in process_ids:
+                        try:
+                            auto_scan_process(BusinessProcess.objects.get(pk=pk), full=True)
+                            record('scans')
+                        except Exception as exc:
+                            record('locked' if is_locked_error(exc) else 'errors')
+            finally:
+                connections.close_all()
+
+        writers = [threading.Thread(target=writer, args=(i,)) for i in range(options['threads'])]
+        scanners = [threading.Thread(target=scanner) for _ in range(options['scanners'])]
+
+        started = time.monotonic()
+        for thread in scanners + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in scanners:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0
+        drifted = rebuild_rollups()
+
+        self.stdout.write(
+            f"Записей: {results['writes']} за {elapsed:.1f} с "
+            f"({results['writes'] / elapsed:.0f}/с, p95 {p95:.1f} мс), сканов: {results['scans']}"
+        )
+        self.stdout.write(f'Повторов из-за блокировки: {lock_retry_count() - retries_before}')
+        self.stdout.write(f"Расхождений сводных счетчиков: {drifted}")
+        if results['locked'] or results['errors'] or drifted:
+            self.stdout.write(self.style.ERROR(
+                f"Ошибок 'database is locked': {results['locked']}, прочих ошибок: {results['errors']}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Ошибок блокировки нет.'))
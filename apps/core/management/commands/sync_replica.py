@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from apps.core.routers import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файл реплики (DATABASE_REPLICA_URL). '
+        'Нужна для локальной проверки чтения с реплики; в production реплику '
+        'поддерживает сама СУБД.'
+    )
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('Реплика не настроена: задайте DATABASE_REPLICA_URL')
+
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        for database in (primary, replica):
+            if database['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('Копирование поддерживается только между файлами SQLite')
+        if str(primary['NAME']) == str(replica['NAME']):
+            raise CommandError('Реплика указывает на тот же файл, что и основная база')
+
+        started = time.monotonic()
+        source = sqlite3.connect(primary['NAME'])
+        target = sqlite3.connect(replica['NAME'])
+        try:
+            # Онлайн-копия: основная база может продолжать работать
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Реплика {replica['NAME']} обновлена за {time.monotonic() - started:.1f} с"
+        ))
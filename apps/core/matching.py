@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+
+from .models import TemplateBank, VulnerabilityTemplate
+
+
+class KeywordAutomaton:
+    """
+    Автомат Ахо-Корасик: ищет все ключевые слова за один проход по тексту.
+    С каждым ключевым словом связано значение (например, индекс шаблона),
+    search() возвращает множество значений всех найденных слов.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        self._built = False
+
+    def add(self, keyword, value):
+        """Добавляет ключевое слово (до вызова build)"""
+        if self._built:
+            raise RuntimeError('Автомат уже собран, добавление слов невозможно')
+
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].add(value)
+
+    def build(self):
+        """Строит суффиксные ссылки обходом в ширину"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # Слова, оканчивающиеся в суффиксной вершине, тоже найдены
+                self._output[next_state] |= self._output[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def search(self, text):
+        """Возвращает значения всех ключевых слов, встречающихся в тексте"""
+        found = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class TemplateMatcher:
+    """Скомпилированный банк шаблонов: текст шага -> подходящие шаблоны"""
+
+    def __init__(self, templates, version=''):
+        self.templates = list(templates)
+        self.version = version
+        self._automaton = KeywordAutomaton()
+        for index, template in enumerate(self.templates):
+            for keyword in split_keywords(template.keywords):
+                self._automaton.add(keyword, index)
+        self._automaton.build()
+
+    def match(self, text):
+        """Шаблоны, у которых хотя бы одно ключевое слово есть в тексте"""
+        indexes = self._automaton.search(text.lower())
+        return [self.templates[i] for i in sorted(indexes)]
+
+
+def split_keywords(keywords):
+    """Разбивает строку ключевых слов через запятую, пустые слова отбрасываются"""
+    return [k.strip().lower() for k in keywords.split(',') if k.strip()]
+
+
+def template_bank_version():
+    """
+    Версия банка шаблонов: растет при добавлении, изменении и удалении
+    шаблонов (TemplateBank). Читается одним запросом по первичному ключу.
+    """
+    return f'v{TemplateBank.current_version()}'
+
+
+_matcher_lock = threading.Lock()
+_matcher_cache = {'version': None, 'matcher': None}
+
+
+def get_template_matcher():
+    """
+    Возвращает скомпилированный матчер банка шаблонов.
+    Автомат собирается заново только если изменилась версия банка.
+    """
+    version = template_bank_version()
+    with _matcher_lock:
+        if _matcher_cache['version'] != version:
+            templates = VulnerabilityTemplate.objects.order_by('pk')
+            _matcher_cache['matcher'] = TemplateMatcher(templates, version)
+            _matcher_cache['version'] = version
+        return _matcher_cache['matcher']
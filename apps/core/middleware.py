@@ -0,0 +1,85 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .profiling import RequestProfile, current_profile, registry
+from .routers import pinned_to_primary
+
+logger = logging.getLogger('apps.core.profiling')
+
+
+class QueryProfilingMiddleware:
+    """
+    Считает для каждого запроса число SQL-запросов, время SQL, время рендера
+    шаблонов и общее время, группируя по имени URL (например, core:dashboard).
+    Включается настройкой RISKMAP_PROFILING.
+    """
+
+    def __init__(self, get_response):
+        if not settings.RISKMAP_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+
+        latency = time.perf_counter() - started
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+
+        budget = settings.PROFILING_VIEW_BUDGETS.get(view_name, settings.PROFILING_QUERY_BUDGET)
+        over_budget = profile.query_count > budget
+        duplicates = profile.duplicates(settings.PROFILING_DUPLICATE_THRESHOLD)
+        registry.record(view_name, profile, latency, over_budget, duplicates)
+
+        if over_budget:
+            logger.warning(
+                '%s: %d SQL-запросов при бюджете %d (%.1f мс, SQL %.1f мс)',
+                view_name, profile.query_count, budget, latency * 1000, profile.sql_time * 1000,
+            )
+        for sql, count in duplicates:
+            logger.warning('%s: возможный N+1 - запрос выполнен %d раз: %s', view_name, count, sql[:300])
+
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    После изменяющего запроса (POST и т.п.) ставит короткоживущую cookie:
+    пока она есть, запросы пользователя читают с основной базы и после
+    редиректа видят собственные изменения, даже если реплика отстает.
+    """
+
+    cookie_name = 'riskmap_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = pinned_to_primary.set(self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            pinned_to_primary.reset(token)
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
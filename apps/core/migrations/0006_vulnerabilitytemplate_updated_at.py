@@ -0,0 +1,20 @@
+# Generated by Django 5.0.13 on 2026-10-18 10:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_vulnerabilitytemplate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vulnerabilitytemplate',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата обновления'),
+            preserve_default=False,
+        ),
+    ]
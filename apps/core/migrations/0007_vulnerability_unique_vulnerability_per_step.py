@@ -0,0 +1,36 @@
+# Generated by Django 5.0.13 on 2026-10-18 10:30
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_vulnerabilities(apps, schema_editor):
+    """Оставляет самую раннюю уязвимость из каждой группы (процесс, шаг, название)"""
+    Vulnerability = apps.get_model('core', 'Vulnerability')
+    duplicates = (
+        Vulnerability.objects.filter(step__isnull=False)
+        .values('business_process', 'step', 'title')
+        .annotate(first_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for group in duplicates:
+        Vulnerability.objects.filter(
+            business_process=group['business_process'],
+            step=group['step'],
+            title=group['title'],
+        ).exclude(id=group['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_vulnerabilitytemplate_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_vulnerabilities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vulnerability',
+            constraint=models.UniqueConstraint(fields=('business_process', 'step', 'title'), name='unique_vulnerability_per_step'),
+        ),
+    ]
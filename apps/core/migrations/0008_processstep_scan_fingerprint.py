@@ -0,0 +1,18 @@
+# Generated by Django 5.0.13 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_vulnerability_unique_vulnerability_per_step'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processstep',
+            name='scan_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Отпечаток автоскана'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.13 on 2026-10-18 19:06
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_rollups(apps, schema_editor):
+    """Первичное заполнение сводных счетчиков по существующим уязвимостям"""
+    Vulnerability = apps.get_model('core', 'Vulnerability')
+    RiskRollup = apps.get_model('core', 'RiskRollup')
+
+    cells = Counter()
+    grouped = (
+        Vulnerability.objects.order_by()
+        .values('business_process__owner', 'business_process', 'severity', 'status')
+        .annotate(total=Count('id'))
+    )
+    for row in grouped:
+        owner_id = row['business_process__owner']
+        cells[(owner_id, row['business_process'], row['severity'], row['status'])] += row['total']
+        cells[(owner_id, None, row['severity'], row['status'])] += row['total']
+
+    RiskRollup.objects.bulk_create([
+        RiskRollup(owner_id=owner_id, business_process_id=process_id, severity=severity, status=status, count=count)
+        for (owner_id, process_id, severity, status), count in cells.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('severity', models.IntegerField(choices=[(1, 'Незначительная'), (2, 'Низкая'), (3, 'Средняя'), (4, 'Высокая'), (5, 'Критическая')], verbose_name='Уровень серьезности')),
+                ('status', models.CharField(choices=[('open', 'Открыта'), ('in_progress', 'В работе'), ('resolved', 'Решена'), ('closed', 'Закрыта')], max_length=20, verbose_name='Статус')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последнее изменение')),
+                ('business_process', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='risk_rollups', to='core.businessprocess', verbose_name='Бизнес-процесс')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Сводка рисков',
+                'verbose_name_plural': 'Сводки рисков',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='riskrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('business_process__isnull', True)), fields=('owner', 'severity', 'status'), name='unique_owner_risk_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='riskrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('business_process__isnull', False)), fields=('business_process', 'severity', 'status'), name='unique_process_risk_rollup'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.13 on 2026-10-18 19:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_riskrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['vulnerability', '-timestamp'], name='auditlog_vuln_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['vulnerability', 'is_implemented'], name='rec_vuln_implemented_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vulnerability',
+            index=models.Index(fields=['business_process', 'status', 'severity'], name='vuln_process_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vulnerability',
+            index=models.Index(fields=['business_process', '-severity', '-discovered_date'], name='vuln_process_severity_idx'),
+        ),
+    ]
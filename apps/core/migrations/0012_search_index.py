@@ -0,0 +1,55 @@
+from django.db import migrations
+
+from apps.core.stemming import stem_text
+
+# Структура должна совпадать с apps.core.search
+CREATE_SEARCH_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_search "
+    "USING fts5(title, body, owner, kind UNINDEXED, tokenize = 'unicode61 remove_diacritics 0')"
+)
+KIND_CODES = {'vulnerability': 1, 'recommendation': 2, 'template': 3}
+
+
+def create_search_index(apps, schema_editor):
+    """Создает FTS5-таблицу (только SQLite) и индексирует существующие данные"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SEARCH_TABLE)
+
+    Vulnerability = apps.get_model('core', 'Vulnerability')
+    Recommendation = apps.get_model('core', 'Recommendation')
+    VulnerabilityTemplate = apps.get_model('core', 'VulnerabilityTemplate')
+
+    def rows():
+        for pk, title, text, owner_id in Vulnerability.objects.values_list(
+                'pk', 'title', 'description', 'business_process__owner_id').iterator():
+            yield pk * 4 + KIND_CODES['vulnerability'], stem_text(title), stem_text(text), f'u{owner_id}', 'vulnerability'
+        for pk, title, text, owner_id in Recommendation.objects.values_list(
+                'pk', 'title', 'content', 'vulnerability__business_process__owner_id').iterator():
+            yield pk * 4 + KIND_CODES['recommendation'], stem_text(title), stem_text(text), f'u{owner_id}', 'recommendation'
+        for pk, title, description, mitigation, keywords in VulnerabilityTemplate.objects.values_list(
+                'pk', 'title', 'description', 'mitigation', 'keywords').iterator():
+            text = ' '.join([description, mitigation, keywords])
+            yield pk * 4 + KIND_CODES['template'], stem_text(title), stem_text(text), 'bank', 'template'
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO core_search (rowid, title, body, owner, kind) VALUES (%s, %s, %s, %s, %s)',
+            list(rows()),
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS core_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.13 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('autoscan', 'Автоскан процесса'), ('export', 'Выгрузка данных')], max_length=30, verbose_name='Тип'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_template_keys(apps, schema_editor):
+    """Ключи существующих шаблонов - из названий (с номером при совпадении)"""
+    VulnerabilityTemplate = apps.get_model('core', 'VulnerabilityTemplate')
+    TemplateBank = apps.get_model('core', 'TemplateBank')
+    used = set()
+    templates = list(VulnerabilityTemplate.objects.order_by('pk'))
+    for template in templates:
+        base = slugify(template.title, allow_unicode=True)[:90] or 'template'
+        key, suffix = base, 2
+        while key in used:
+            key, suffix = f'{base}-{suffix}', suffix + 1
+        used.add(key)
+        template.key = key
+    VulnerabilityTemplate.objects.bulk_update(templates, ['key'], batch_size=500)
+    TemplateBank.objects.create(pk=1, version=1 if templates else 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_job_import_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemplateBank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Версия')),
+                ('source_version', models.CharField(blank=True, max_length=100, verbose_name='Версия файлов банка')),
+                ('loaded_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя загрузка')),
+            ],
+            options={
+                'verbose_name': 'Состояние банка шаблонов',
+                'verbose_name_plural': 'Состояние банка шаблонов',
+            },
+        ),
+        migrations.AddField(
+            model_name='vulnerabilitytemplate',
+            name='key',
+            field=models.CharField(max_length=100, null=True, verbose_name='Ключ'),
+        ),
+        migrations.RunPython(fill_template_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vulnerabilitytemplate',
+            name='key',
+            field=models.SlugField(allow_unicode=True, max_length=100, unique=True, verbose_name='Ключ'),
+        ),
+    ]
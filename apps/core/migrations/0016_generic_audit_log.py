@@ -0,0 +1,73 @@
+# Generated by Django 5.0.13 on 2026-10-18 19:46
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_audit_objects(apps, schema_editor):
+    """Существующие записи - об уязвимостях: объект, его название и процесс"""
+    AuditLog = apps.get_model('core', 'AuditLog')
+    Vulnerability = apps.get_model('core', 'Vulnerability')
+    vulnerability = Vulnerability.objects.filter(pk=OuterRef('vulnerability_id'))
+    AuditLog.objects.update(
+        object_type='vulnerability',
+        object_id=F('vulnerability_id'),
+        object_repr=Coalesce(Subquery(vulnerability.values('title')[:1]), Value('')),
+        business_process_id=Subquery(vulnerability.values('business_process_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_template_bank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='business_process',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='audit_logs', to='core.businessprocess', verbose_name='Бизнес-процесс'),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='changes',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Изменения'),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='object_id',
+            field=models.PositiveIntegerField(default=0, verbose_name='ID объекта'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='object_repr',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Объект'),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='object_type',
+            field=models.CharField(choices=[('process', 'Процесс'), ('step', 'Шаг процесса'), ('vulnerability', 'Уязвимость'), ('recommendation', 'Рекомендация')], default='vulnerability', max_length=20, verbose_name='Тип объекта'),
+        ),
+        migrations.RunPython(fill_audit_objects, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('created', 'Создание'), ('updated', 'Изменение'), ('deleted', 'Удаление'), ('status_changed', 'Изменен статус'), ('assigned', 'Назначена'), ('description_changed', 'Изменено описание'), ('resolved', 'Решена')], max_length=50, verbose_name='Действие'),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='vulnerability',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='audit_logs', to='core.vulnerability', verbose_name='Уязвимость'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['object_type', 'object_id', '-timestamp'], name='auditlog_object_time_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.13 on 2026-10-18 20:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+        ('core', '0017_row_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerVersion',
+            fields=[
+                ('owner', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='data_version', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия данных владельца',
+                'verbose_name_plural': 'Версии данных владельцев',
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.13 on 2026-10-18 20:35
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_started_at(apps, schema_editor):
+    """Задачи в работе до миграции: признак жизни - время начала"""
+    Job = apps.get_model('core', 'Job')
+    Job.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_owner_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний признак жизни'),
+        ),
+        migrations.RunPython(copy_started_at, migrations.RunPython.noop),
+    ]
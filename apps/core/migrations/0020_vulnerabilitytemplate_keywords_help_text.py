@@ -0,0 +1,18 @@
+# Generated by Django 5.0.13 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vulnerabilitytemplate',
+            name='keywords',
+            field=models.TextField(help_text='Слова через запятую для авто-поиска', verbose_name='Ключевые слова'),
+        ),
+    ]
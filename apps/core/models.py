@@ -1,9 +1,45 @@
-from django.db import models
+import time
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, FloatField, Q, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .db import retry_on_locked
 
 User = get_user_model()
 
 
+class BusinessProcessQuerySet(models.QuerySet):
+    """Запросы к процессам с агрегатами по уязвимостям"""
+
+    def with_risk(self):
+        """
+        Считает количество уязвимостей, средний риск и разбивку по серьезности
+        в SQL одним запросом по сводной таблице RiskRollup (не более 20 строк
+        на процесс вместо всех его уязвимостей).
+        """
+        total = Sum('risk_rollups__count')
+        return self.annotate(
+            annotated_vulnerability_count=Coalesce(total, 0),
+            annotated_risk_score=Coalesce(
+                Sum(F('risk_rollups__severity') * F('risk_rollups__count'), output_field=FloatField())
+                * 20 / NullIf(total, 0),
+                Value(0.0),
+            ),
+            critical_count=Coalesce(Sum('risk_rollups__count', filter=Q(risk_rollups__severity=5)), 0),
+            high_count=Coalesce(Sum('risk_rollups__count', filter=Q(risk_rollups__severity=4)), 0),
+            medium_count=Coalesce(Sum('risk_rollups__count', filter=Q(risk_rollups__severity=3)), 0),
+            low_count=Coalesce(Sum('risk_rollups__count', filter=Q(risk_rollups__severity__lte=2)), 0),
+        )
+
+    def order_by_risk(self):
+        """Сначала самые рискованные процессы"""
+        return self.with_risk().order_by('-annotated_risk_score', '-created_at')
+
+
 # 1. СНАЧАЛА БИЗНЕС-ПРОЦЕСС
 class BusinessProcess(models.Model):
     """Модель бизнес-процесса"""
@@ -33,6 +69,8 @@ class BusinessProcess(models.Model):
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
     is_active = models.BooleanField('Активен', default=True)
     
+    objects = BusinessProcessQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Бизнес-процесс'
         verbose_name_plural = 'Бизнес-процессы'
@@ -43,12 +81,16 @@ class BusinessProcess(models.Model):
     
     @property
     def vulnerability_count(self):
-        """Количество уязвимостей"""
+        """Количество уязвимостей (из аннотации with_risk(), если она есть)"""
+        if hasattr(self, 'annotated_vulnerability_count'):
+            return self.annotated_vulnerability_count
         return self.vulnerabilities.count()
     
     @property
     def risk_score(self):
-        """Общий уровень риска"""
+        """Общий уровень риска (из аннотации with_risk(), если она есть)"""
+        if hasattr(self, 'annotated_risk_score'):
+            return self.annotated_risk_score
         vulnerabilities = self.vulnerabilities.all()
         if not vulnerabilities:
             return 0
@@ -74,6 +116,10 @@ class ProcessStep(models.Model):
         ],
         verbose_name="Цвет"
     )
+    # Отпечаток текста шага и версии банка шаблонов на момент последнего автоскана
+    scan_fingerprint = models.CharField(max_length=64, blank=True, editable=False, verbose_name="Отпечаток автоскана")
+    # Версия строки для ETag в API
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
     class Meta:
         ordering = ['order']
@@ -126,15 +172,42 @@ class Vulnerability(models.Model):
     status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='open')
     discovered_date = models.DateField('Дата обнаружения', auto_now_add=True)
     resolved_date = models.DateField('Дата решения', null=True, blank=True)
+    # Версия строки для ETag в API (массовые UPDATE выставляют ее сами)
+    updated_at = models.DateTimeField('Дата обновления', auto_now=True)
     
     class Meta:
         verbose_name = 'Уязвимость'
         verbose_name_plural = 'Уязвимости'
         ordering = ['-severity', '-discovered_date']
+        constraints = [
+            # Автоскан не должен создавать одну и ту же уязвимость на шаге дважды
+            # (этот же индекс обслуживает поиск уже найденного при автоскане)
+            models.UniqueConstraint(
+                fields=['business_process', 'step', 'title'],
+                name='unique_vulnerability_per_step',
+            ),
+        ]
+        indexes = [
+            # Фильтры списков и счетчиков по статусу внутри процессов владельца
+            models.Index(fields=['business_process', 'status', 'severity'], name='vuln_process_status_idx'),
+            # Список уязвимостей в порядке по умолчанию (keyset-пагинация)
+            models.Index(fields=['business_process', '-severity', '-discovered_date'], name='vuln_process_severity_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.get_severity_display()})"
     
+    @retry_on_locked
+    def save(self, *args, **kwargs):
+        # Дата решения нужна для метрики среднего времени устранения
+        if self.status == 'resolved' and self.resolved_date is None:
+            self.resolved_date = timezone.localdate()
+        elif self.status in ('open', 'in_progress'):
+            self.resolved_date = None
+        # Сводные счетчики (RiskRollup) обновляются в post_save - в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
     @property
     def severity_score(self):
         """Оценка серьезности от 0 до 100"""
@@ -162,31 +235,70 @@ class Recommendation(models.Model):
     priority = models.IntegerField('Приоритет', choices=PRIORITY_CHOICES, default=2)
     is_implemented = models.BooleanField('Выполнено', default=False)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата обновления', auto_now=True)
     
     class Meta:
         verbose_name = 'Рекомендация'
         verbose_name_plural = 'Рекомендации'
         ordering = ['-priority', '-created_at']
+        indexes = [
+            # Невыполненные рекомендации по уязвимостям владельца
+            models.Index(fields=['vulnerability', 'is_implemented'], name='rec_vuln_implemented_idx'),
+        ]
     
     def __str__(self):
         return self.title
 
 
-# 5. ПОТОМ ЛОГИ (Знает про Vulnerability)
+# 5. ПОТОМ ЛОГИ (Знает про процессы и уязвимости)
 class AuditLog(models.Model):
-    """Логирование всех изменений уязвимостей"""
+    """
+    Журнал изменений процессов, шагов, уязвимостей и рекомендаций.
+
+    Записи создаются автоматически по разнице загруженных и сохраняемых
+    значений (см. audit.py) и пишутся после фиксации транзакции, поэтому
+    ссылки на объекты - без ограничений внешнего ключа в БД: запись об
+    удалении переживает удаленный объект.
+    """
     
     ACTION_CHOICES = [
-        ('created', 'Создана'),
+        ('created', 'Создание'),
+        ('updated', 'Изменение'),
+        ('deleted', 'Удаление'),
         ('status_changed', 'Изменен статус'),
         ('assigned', 'Назначена'),
         ('description_changed', 'Изменено описание'),
         ('resolved', 'Решена'),
     ]
-    
+
+    OBJECT_TYPE_CHOICES = [
+        ('process', 'Процесс'),
+        ('step', 'Шаг процесса'),
+        ('vulnerability', 'Уязвимость'),
+        ('recommendation', 'Рекомендация'),
+    ]
+
+    object_type = models.CharField('Тип объекта', max_length=20, choices=OBJECT_TYPE_CHOICES, default='vulnerability')
+    object_id = models.PositiveIntegerField('ID объекта')
+    # Название объекта на момент изменения (объект мог быть удален)
+    object_repr = models.CharField('Объект', max_length=255, blank=True)
+    # Процесс объекта: по нему журнал виден владельцу и удаляется вместе с процессом
+    business_process = models.ForeignKey(
+        BusinessProcess,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='audit_logs',
+        verbose_name='Бизнес-процесс'
+    )
+    # Уязвимость объекта (для самой уязвимости и ее рекомендаций) - история на ее странице
     vulnerability = models.ForeignKey(
         Vulnerability,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
         related_name='audit_logs',
         verbose_name='Уязвимость'
     )
@@ -199,6 +311,8 @@ class AuditLog(models.Model):
     action = models.CharField('Действие', max_length=50, choices=ACTION_CHOICES)
     old_value = models.TextField('Старое значение', blank=True, null=True)
     new_value = models.TextField('Новое значение', blank=True, null=True)
+    # Измененные поля: {"поле": [было, стало]}
+    changes = models.JSONField('Изменения', null=True, blank=True, encoder=DjangoJSONEncoder)
     timestamp = models.DateTimeField('Время', auto_now_add=True)
     comment = models.TextField('Комментарий', blank=True)
 
@@ -206,13 +320,21 @@ class AuditLog(models.Model):
         verbose_name = 'Лог аудита'
         verbose_name_plural = 'Логи аудита'
         ordering = ['-timestamp']
+        indexes = [
+            # История уязвимости, новые записи первыми
+            models.Index(fields=['vulnerability', '-timestamp'], name='auditlog_vuln_time_idx'),
+            # История любого объекта (шага, процесса)
+            models.Index(fields=['object_type', 'object_id', '-timestamp'], name='auditlog_object_time_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.vulnerability.title} - {self.get_action_display()} ({self.timestamp})"
+        return f"{self.object_repr} - {self.get_action_display()} ({self.timestamp})"
     
     # 6. БАНК УЯЗВИМОСТЕЙ (Новая модель для авто-подбора)
 class VulnerabilityTemplate(models.Model):
     """Шаблон уязвимости для базы знаний"""
+    # Постоянный идентификатор шаблона в файлах банка (по нему загрузчик обновляет записи)
+    key = models.SlugField('Ключ', max_length=100, unique=True, allow_unicode=True)
     title = models.CharField('Название', max_length=255)
     description = models.TextField('Описание')
     severity = models.IntegerField(
@@ -226,6 +348,7 @@ class VulnerabilityTemplate(models.Model):
     
     # Рекомендация по умолчанию
     mitigation = models.TextField('Рекомендация по устранению', blank=True, help_text="Шаблон решения проблемы")
+    updated_at = models.DateTimeField('Дата обновления', auto_now=True)
 
     class Meta:
         verbose_name = 'Шаблон уязвимости'
@@ -235,3 +358,204 @@ class VulnerabilityTemplate(models.Model):
         return self.title
 
 
+class TemplateBank(models.Model):
+    """
+    Состояние банка шаблонов (единственная строка). Версия растет при каждом
+    изменении шаблонов - по ней автоскан и кеши понимают, что банк обновился.
+    """
+    version = models.PositiveIntegerField('Версия', default=0)
+    source_version = models.CharField('Версия файлов банка', max_length=100, blank=True)
+    loaded_at = models.DateTimeField('Последняя загрузка', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Состояние банка шаблонов'
+        verbose_name_plural = 'Состояние банка шаблонов'
+
+    def __str__(self):
+        return f"Банк шаблонов v{self.version}"
+
+    @classmethod
+    def current_version(cls):
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, **fields):
+        """Увеличивает версию банка (атомарно, без чтения текущего значения)"""
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1, **fields):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(pk=1, version=1, **fields)
+            except IntegrityError:
+                cls.objects.filter(pk=1).update(version=F('version') + 1, **fields)
+
+
+class OwnerVersion(models.Model):
+    """
+    Счетчик изменений данных владельца (процессы, уязвимости, рекомендации).
+    Хранится в БД, а не в кеше: увеличивается в той же транзакции, что и
+    изменение, и одинаково виден всем процессам - веб-воркерам, исполнителю
+    задач, командам импорта. По нему строятся ключи кеша дашборда и ETag страниц.
+    """
+    # Без ограничения в БД: при удалении пользователя сигналы удаления его
+    # процессов увеличивают версию и могут создать строку уже после сбора каскада
+    owner = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,
+        related_name='data_version',
+        verbose_name='Владелец'
+    )
+    version = models.PositiveBigIntegerField('Версия', default=0)
+
+    class Meta:
+        verbose_name = 'Версия данных владельца'
+        verbose_name_plural = 'Версии данных владельцев'
+
+    def __str__(self):
+        return f"{self.owner_id}: v{self.version}"
+
+    @classmethod
+    def current(cls, owner_id):
+        return cls.objects.filter(owner_id=owner_id).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, owner_id):
+        """Увеличивает версию владельца (атомарно, без чтения текущего значения)"""
+        if not cls.objects.filter(owner_id=owner_id).update(version=F('version') + 1):
+            try:
+                # Начальное значение от времени: после очистки или восстановления БД
+                # версии не совпадут со старыми записями в общем кеше
+                with transaction.atomic():
+                    cls.objects.create(owner_id=owner_id, version=int(time.time() * 1000))
+            except IntegrityError:
+                cls.objects.filter(owner_id=owner_id).update(version=F('version') + 1)
+
+
+
+
+# 7. ФОНОВЫЕ ЗАДАЧИ (автоскан и другие долгие операции)
+class Job(models.Model):
+    """Фоновая задача, которая хранится в БД и выполняется без внешнего брокера"""
+
+    KIND_CHOICES = [
+        ('autoscan', 'Автоскан процесса'),
+        ('export', 'Выгрузка данных'),
+        ('import', 'Импорт данных'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    kind = models.CharField('Тип', max_length=30, choices=KIND_CHOICES)
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name='Владелец'
+    )
+    business_process = models.ForeignKey(
+        BusinessProcess,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        verbose_name='Бизнес-процесс'
+    )
+    params = models.JSONField('Параметры', default=dict, blank=True)
+    # Одинаковые активные задачи (например, автоскан одного процесса) не дублируются
+    dedupe_key = models.CharField('Ключ дедупликации', max_length=100, blank=True)
+    status = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress_done = models.PositiveIntegerField('Выполнено', default=0)
+    progress_total = models.PositiveIntegerField('Всего', default=0)
+    result = models.JSONField('Результат', default=dict, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    started_at = models.DateTimeField('Начало', null=True, blank=True)
+    # Обновляется при каждом отчете о ходе работы: по нему видно, что задача жива
+    heartbeat_at = models.DateTimeField('Последний признак жизни', null=True, blank=True)
+    finished_at = models.DateTimeField('Окончание', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status__in=['queued', 'running']) & ~models.Q(dedupe_key=''),
+                name='unique_active_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def progress_percent(self):
+        """Прогресс выполнения в процентах"""
+        if self.status == 'done':
+            return 100
+        if not self.progress_total:
+            return 0
+        return int(self.progress_done * 100 / self.progress_total)
+
+
+# 8. СВОДНЫЕ СЧЕТЧИКИ РИСКОВ (поддерживаются при каждом изменении уязвимостей)
+class RiskRollup(models.Model):
+    """
+    Количество уязвимостей в разрезе серьезность × статус.
+    Строки с business_process = NULL - сводка по всем процессам владельца.
+    """
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='risk_rollups',
+        verbose_name='Владелец'
+    )
+    business_process = models.ForeignKey(
+        BusinessProcess,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='risk_rollups',
+        verbose_name='Бизнес-процесс'
+    )
+    severity = models.IntegerField('Уровень серьезности', choices=Vulnerability.SEVERITY_CHOICES)
+    status = models.CharField('Статус', max_length=20, choices=Vulnerability.STATUS_CHOICES)
+    count = models.IntegerField('Количество', default=0)
+    updated_at = models.DateTimeField('Последнее изменение', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Сводка рисков'
+        verbose_name_plural = 'Сводки рисков'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner', 'severity', 'status'],
+                condition=models.Q(business_process__isnull=True),
+                name='unique_owner_risk_rollup',
+            ),
+            models.UniqueConstraint(
+                fields=['business_process', 'severity', 'status'],
+                condition=models.Q(business_process__isnull=False),
+                name='unique_process_risk_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        scope = self.business_process or self.owner
+        return f"{scope}: {self.get_severity_display()} / {self.get_status_display()} = {self.count}"
+
+    @property
+    def severity_sum(self):
+        return self.severity * self.count
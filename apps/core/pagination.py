@@ -0,0 +1,103 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    """Страница keyset-пагинации"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """
+    Пагинация по курсору (keyset): следующая страница выбирается условием
+    "строго после последней строки" в порядке сортировки, без OFFSET.
+    Время выдачи страницы не зависит от ее номера.
+
+    ordering - поля сортировки вида ['-severity', '-discovered_date'];
+    pk добавляется в конец автоматически, чтобы порядок был однозначным.
+    Поля сортировки не должны допускать NULL.
+    """
+
+    def __init__(self, queryset, ordering, per_page=50):
+        self.ordering = list(ordering)
+        if self.ordering[-1].lstrip('-') not in ('pk', 'id'):
+            self.ordering.append('-pk' if self.ordering[-1].startswith('-') else 'pk')
+        self.queryset = queryset.order_by(*self.ordering)
+        self.per_page = per_page
+        self._fields = [
+            (name.lstrip('-'), name.startswith('-'))
+            for name in self.ordering
+        ]
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode(cursor)))
+
+        items = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode(items[-1])
+        return KeysetPage(items, next_cursor)
+
+    def _after(self, values):
+        # (a, b, c) "после" (x, y, z): a<x OR (a=x AND b<y) OR (a=x AND b=y AND c<z)
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self._fields, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode(self, obj):
+        values = [self._field_value(obj, name) for name, _ in self._fields]
+        raw = json.dumps(values, default=str).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (ValueError, UnicodeError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self._fields):
+            raise InvalidCursor(cursor)
+
+        model = self.queryset.model
+        try:
+            return [
+                model._meta.pk.to_python(value) if name == 'pk' else model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self._fields, values)
+            ]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    @staticmethod
+    def _field_value(obj, name):
+        # Строки queryset.values() - словари (поля сортировки должны быть среди выбранных)
+        if isinstance(obj, dict):
+            value = obj[name]
+        else:
+            value = obj.pk if name == 'pk' else getattr(obj, name)
+        return value.isoformat() if hasattr(value, 'isoformat') else value
@@ -0,0 +1,181 @@
+import bisect
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates
+
+# Профиль текущего запроса (заполняется middleware QueryProfilingMiddleware)
+current_profile = ContextVar('current_profile', default=None)
+
+# Границы корзин гистограмм: время в мс и число запросов
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Шаблон запроса без литералов: одинаковые запросы с разными параметрами совпадают"""
+    sql = _LITERALS.sub('?', sql)
+    return _IN_LISTS.sub('IN (...)', sql)
+
+
+class RequestProfile:
+    """Запросы к БД и время одного HTTP-запроса; используется как execute_wrapper"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.query_count += 1
+            self.statements[normalize_sql(sql)] += 1
+
+    def duplicates(self, threshold):
+        """Запросы, повторившиеся не меньше threshold раз (признак N+1)"""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами; перцентили оцениваются по границам корзин"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for index, in_bucket in enumerate(self.buckets):
+            seen += in_bucket
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 2) if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': round(self.max, 2),
+            'buckets': {
+                (f'<={bound}' if index < len(self.bounds) else f'>{self.bounds[-1]}'): hits
+                for index, (bound, hits) in enumerate(zip(self.bounds + (None,), self.buckets))
+            },
+        }
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.sql_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.template_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.over_budget = 0
+        self.n_plus_one = 0
+        self.duplicate_samples = Counter()
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'latency_ms': self.latency_ms.as_dict(),
+            'sql_ms': self.sql_ms.as_dict(),
+            'template_ms': self.template_ms.as_dict(),
+            'queries': self.queries.as_dict(),
+            'over_budget': self.over_budget,
+            'n_plus_one_requests': self.n_plus_one,
+            'top_duplicates': [
+                {'sql': sql, 'max_repeats': count}
+                for sql, count in self.duplicate_samples.most_common(5)
+            ],
+        }
+
+
+class StatsRegistry:
+    """Статистика по именам URL в памяти процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, profile, latency, over_budget, duplicates):
+        with self._lock:
+            stats = self._views.setdefault(view_name, ViewStats())
+            stats.requests += 1
+            stats.latency_ms.add(latency * 1000)
+            stats.sql_ms.add(profile.sql_time * 1000)
+            stats.template_ms.add(profile.template_time * 1000)
+            stats.queries.add(profile.query_count)
+            if over_budget:
+                stats.over_budget += 1
+            if duplicates:
+                stats.n_plus_one += 1
+                for sql, count in duplicates:
+                    stats.duplicate_samples[sql] = max(stats.duplicate_samples[sql], count)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._views.items())}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = StatsRegistry()
+
+
+class ProfiledTemplate:
+    """Обертка шаблона: время рендера добавляется в профиль текущего запроса"""
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        profile = current_profile.get()
+        if profile is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - started
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """Стандартный движок шаблонов Django с замером времени рендера"""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name))
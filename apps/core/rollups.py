@@ -0,0 +1,211 @@
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import BusinessProcess, RiskRollup, Vulnerability
+
+# Процессы, которые сейчас удаляются целиком: их вклад уже вычтен одним запросом.
+# Отметка - (id процесса, соединение, блок транзакции удаления) - действует, пока
+# этот блок открыт: если удаление упало или откатилось, отметка снимается сама
+# и не отключает обработку процесса до конца жизни воркера.
+_deleting = ContextVar('deleting_processes', default=())
+
+
+def _active_marks():
+    return tuple(
+        mark for mark in _deleting.get()
+        if mark[2] is None or any(block is mark[2] for block in mark[1].atomic_blocks)
+    )
+
+
+def mark_deleting(process):
+    connection = connections[router.db_for_write(BusinessProcess, instance=process)]
+    block = connection.atomic_blocks[-1] if connection.atomic_blocks else None
+    _deleting.set((*_active_marks(), (process.pk, connection, block)))
+
+
+def unmark_deleting(process):
+    _deleting.set(tuple(mark for mark in _active_marks() if mark[0] != process.pk))
+
+
+def deleting_processes():
+    """id процессов, которые удаляются в текущей транзакции"""
+    return {mark[0] for mark in _active_marks()}
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Применяет изменения счетчиков: {(process_id, severity, status): +/-n}.
+    Каждое изменение попадает и в строку процесса, и в сводку владельца.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    process_ids = {process_id for process_id, _, _ in deltas}
+    owners = dict(
+        BusinessProcess.objects.filter(pk__in=process_ids).values_list('pk', 'owner_id')
+    )
+
+    cells = Counter()
+    for (process_id, severity, status), delta in deltas.items():
+        owner_id = owners.get(process_id)
+        if owner_id is None:
+            continue
+        cells[(owner_id, process_id, severity, status)] += delta
+        cells[(owner_id, None, severity, status)] += delta
+
+    with transaction.atomic():
+        for (owner_id, process_id, severity, status), delta in sorted(cells.items(), key=_cell_order):
+            if delta:
+                _add_to_cell(owner_id, process_id, severity, status, delta)
+
+
+def _cell_order(item):
+    # Единый порядок обновления строк снижает риск взаимных блокировок
+    (owner_id, process_id, severity, status), _ = item
+    return owner_id, process_id or 0, severity, status
+
+
+def _add_to_cell(owner_id, process_id, severity, status, delta):
+    cell = RiskRollup.objects.filter(
+        owner_id=owner_id,
+        business_process_id=process_id,
+        severity=severity,
+        status=status,
+    )
+    if cell.update(count=F('count') + delta, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            RiskRollup.objects.create(
+                owner_id=owner_id,
+                business_process_id=process_id,
+                severity=severity,
+                status=status,
+                count=delta,
+            )
+    except IntegrityError:
+        # Строку параллельно создал другой запрос
+        cell.update(count=F('count') + delta, updated_at=timezone.now())
+
+
+def count_deltas(vulnerabilities, sign=1):
+    """Изменения счетчиков для набора уязвимостей (sign=-1 - при удалении)"""
+    return Counter({
+        key: sign * count
+        for key, count in Counter(
+            (v.business_process_id, v.severity, v.status) for v in vulnerabilities
+        ).items()
+    })
+
+
+def subtract_process(process):
+    """
+    Вычитает вклад процесса из сводки владельца одним групповым запросом
+    (перед каскадным удалением процесса вместе с уязвимостями).
+    """
+    grouped = (
+        Vulnerability.objects.filter(business_process=process)
+        .order_by()
+        .values('severity', 'status')
+        .annotate(total=Count('id'))
+    )
+    with transaction.atomic():
+        for row in grouped:
+            _add_to_cell(process.owner_id, None, row['severity'], row['status'], -row['total'])
+    mark_deleting(process)
+
+
+def rebuild_rollups(owner=None):
+    """
+    Пересчитывает сводные счетчики с нуля по таблице уязвимостей.
+    Возвращает число ячеек, которые расходились с фактическими данными.
+    """
+    vulnerabilities = Vulnerability.objects.all()
+    rollups = RiskRollup.objects.all()
+    if owner is not None:
+        vulnerabilities = vulnerabilities.filter(business_process__owner=owner)
+        rollups = rollups.filter(owner=owner)
+
+    actual = Counter()
+    grouped = (
+        vulnerabilities.order_by()
+        .values('business_process__owner', 'business_process', 'severity', 'status')
+        .annotate(total=Count('id'))
+    )
+    for row in grouped:
+        owner_id = row['business_process__owner']
+        actual[(owner_id, row['business_process'], row['severity'], row['status'])] += row['total']
+        actual[(owner_id, None, row['severity'], row['status'])] += row['total']
+
+    with transaction.atomic():
+        stored = Counter({
+            (r.owner_id, r.business_process_id, r.severity, r.status): r.count
+            for r in rollups.select_for_update()
+        })
+        drifted = sum(1 for key in set(actual) | set(stored) if actual[key] != stored[key])
+
+        rollups.delete()
+        RiskRollup.objects.bulk_create([
+            RiskRollup(
+                owner_id=owner_id,
+                business_process_id=process_id,
+                severity=severity,
+                status=status,
+                count=count,
+            )
+            for (owner_id, process_id, severity, status), count in actual.items()
+        ])
+    return drifted
+
+
+def rollup_stats(owner=None, process=None):
+    """
+    Счетчики из сводной таблицы в том же виде, что и services.vulnerability_stats
+    (без среднего времени устранения). Читает не более 20 строк.
+    """
+    if process is not None:
+        cells = RiskRollup.objects.filter(business_process=process)
+    else:
+        cells = RiskRollup.objects.filter(owner=owner, business_process__isnull=True)
+
+    severity_buckets = {5: 'critical', 4: 'high', 3: 'medium', 2: 'low', 1: 'low'}
+    stats = defaultdict(int)
+    for severity, status, count in cells.values_list('severity', 'status', 'count'):
+        stats['total'] += count
+        stats[severity_buckets[severity]] += count
+        stats[status] += count
+
+    return {
+        key: stats[key]
+        for key in ('total', 'critical', 'high', 'medium', 'low', 'open', 'in_progress', 'resolved', 'closed')
+    }
+
+
+def top_risk_processes(owner, limit=5):
+    """Процессы владельца с наибольшим средним риском (по сводной таблице)"""
+    ranked = list(
+        RiskRollup.objects.filter(owner=owner, business_process__isnull=False)
+        .order_by()
+        .values('business_process', 'business_process__name')
+        .annotate(total=Sum('count'), severity_sum=Sum(F('severity') * F('count')))
+        .filter(total__gt=0)
+        .annotate(risk=F('severity_sum') * 20.0 / F('total'))
+        .order_by('-risk', '-business_process__created_at')[:limit]
+    )
+    top = [(row['business_process__name'], row['risk']) for row in ranked]
+
+    # Если процессов с уязвимостями меньше limit, добираем процессы с нулевым риском
+    if len(top) < limit:
+        ranked_ids = [row['business_process'] for row in ranked]
+        rest = (
+            BusinessProcess.objects.filter(owner=owner)
+            .exclude(pk__in=ranked_ids)
+            .values_list('name', flat=True)[:limit - len(top)]
+        )
+        top += [(name, 0) for name in rest]
+    return top
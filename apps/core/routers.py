@@ -0,0 +1,65 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+# Представление разрешило читать с реплики (декоратор use_replica)
+_read_from_replica = ContextVar('read_from_replica', default=False)
+# Пользователь только что что-то изменил - читаем с основной базы (ReplicaPinningMiddleware)
+pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+class ReplicaRouter:
+    """
+    Чтение моделей core внутри представлений с use_replica уходит на реплику,
+    все остальное - на основную базу. Пользователи, сессии и права всегда
+    читаются с основной базы: задержка реплики не должна разлогинивать.
+    """
+
+    route_app_labels = {'core'}
+
+    def db_for_read(self, model, **hints):
+        if (
+            model._meta.app_label in self.route_app_labels
+            and _read_from_replica.get()
+            and not pinned_to_primary.get()
+            # Внутри транзакции читаем то, что сами только что записали
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def use_replica(view_func):
+    """Разрешает представлению читать с реплики (если она настроена)"""
+    @functools.wraps(view_func)
+    def wrapper(*args, **kwargs):
+        token = _read_from_replica.set(True)
+        try:
+            return view_func(*args, **kwargs)
+        finally:
+            _read_from_replica.reset(token)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    """Чтение с основной базы внутри представления с use_replica"""
+    token = _read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
@@ -0,0 +1,256 @@
+"""
+Полнотекстовый поиск по уязвимостям, рекомендациям и банку шаблонов.
+
+SQLite: виртуальная таблица FTS5 core_search (миграция 0012). В нее пишутся
+основы слов (apps.core.stemming), поэтому поиск не зависит от падежа и числа.
+Владелец документа - тоже индексируемая колонка: ограничение по владельцу
+выполняется внутри FTS, без перебора чужих совпадений.
+rowid документа = pk * 4 + код типа - строку можно обновить или удалить
+без поиска по таблице.
+
+PostgreSQL: tsvector с конфигурацией 'russian' строится в запросе.
+
+Индекс поддерживается сигналами (signals.py) и явными вызовами там, где
+объекты создаются массово (автоскан, загрузка шаблонов).
+"""
+from django.db import connections, router
+
+from .models import Recommendation, Vulnerability, VulnerabilityTemplate
+from .stemming import stem, stem_text, tokenize
+
+SEARCH_TABLE = 'core_search'
+
+KIND_CODES = {'vulnerability': 1, 'recommendation': 2, 'template': 3}
+KIND_MODELS = {
+    'vulnerability': Vulnerability,
+    'recommendation': Recommendation,
+    'template': VulnerabilityTemplate,
+}
+# Шаблоны - общий банк, видны всем пользователям
+BANK_OWNER = 'bank'
+
+# Вес совпадения в заголовке относительно основного текста (bm25)
+TITLE_WEIGHT = 10.0
+CHUNK_SIZE = 500
+
+
+def _owner_token(owner_id):
+    return f'u{owner_id}'
+
+
+def _rowid(kind, pk):
+    return pk * 4 + KIND_CODES[kind]
+
+
+def _split_rowid(rowid):
+    code = rowid % 4
+    kind = next(name for name, value in KIND_CODES.items() if value == code)
+    return kind, rowid // 4
+
+
+def _documents(kind, pks):
+    """Строки индекса (rowid, заголовок, текст, владелец, тип) для объектов kind"""
+    if kind == 'vulnerability':
+        rows = Vulnerability.objects.filter(pk__in=pks).values_list(
+            'pk', 'title', 'description', 'business_process__owner_id')
+    elif kind == 'recommendation':
+        rows = Recommendation.objects.filter(pk__in=pks).values_list(
+            'pk', 'title', 'content', 'vulnerability__business_process__owner_id')
+    else:
+        rows = (
+            (pk, title, ' '.join([description, mitigation, keywords]), None)
+            for pk, title, description, mitigation, keywords in VulnerabilityTemplate.objects.filter(
+                pk__in=pks).values_list('pk', 'title', 'description', 'mitigation', 'keywords')
+        )
+    for pk, title, text, owner_id in rows:
+        owner = BANK_OWNER if owner_id is None else _owner_token(owner_id)
+        yield _rowid(kind, pk), stem_text(title), stem_text(text), owner, kind
+
+
+def _fts_connection(kind):
+    connection = connections[router.db_for_write(KIND_MODELS[kind])]
+    return connection if connection.vendor == 'sqlite' else None
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def index_objects(kind, pks):
+    """Добавляет или обновляет документы в индексе"""
+    connection = _fts_connection(kind)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(pks):
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, title, body, owner, kind) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                list(_documents(kind, chunk)),
+            )
+
+
+def remove_objects(kind, pks):
+    """Удаляет документы из индекса"""
+    connection = _fts_connection(kind)
+    if connection is None:
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(pks):
+            rowids = [_rowid(kind, pk) for pk in chunk]
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(rowids))})",
+                rowids,
+            )
+
+
+def remove_process(process):
+    """Удаляет из индекса уязвимости и рекомендации процесса (перед каскадным удалением)"""
+    vulnerability_ids = list(
+        Vulnerability.objects.filter(business_process=process).values_list('pk', flat=True))
+    recommendation_ids = list(
+        Recommendation.objects.filter(vulnerability__business_process=process).values_list('pk', flat=True))
+    remove_objects('vulnerability', vulnerability_ids)
+    remove_objects('recommendation', recommendation_ids)
+
+
+def rebuild_index():
+    """Полностью перестраивает индекс; возвращает число документов по типам"""
+    connection = _fts_connection('vulnerability')
+    if connection is None:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    counts = {}
+    for kind, model in KIND_MODELS.items():
+        pks = model.objects.values_list('pk', flat=True).iterator(chunk_size=CHUNK_SIZE)
+        counts[kind] = 0
+        for chunk in _chunks(pks):
+            index_objects(kind, chunk)
+            counts[kind] += len(chunk)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return counts
+
+
+class SearchResult:
+    def __init__(self, kind, obj, score):
+        self.kind = kind
+        self.obj = obj
+        self.score = score
+
+
+class SearchPage:
+    def __init__(self, results, number, has_next):
+        self.results = results
+        self.number = number
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def build_match(query, owner_id):
+    """
+    Выражение MATCH для FTS5: все слова запроса (основы) в заголовке или тексте,
+    только документы владельца и общего банка. None, если в запросе нет слов.
+
+    Префиксный поиск ("слово*") не используется: короткий префикс раскрывается
+    в сотни терминов и на миллионе документов выполняется в сотни раз дольше.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    terms = ' AND '.join(f'"{stem(token)}"' for token in tokens)
+    return f'{{title body}} : ({terms}) AND owner : ("{_owner_token(owner_id)}" OR "{BANK_OWNER}")'
+
+
+def search(user, query, kinds=None, page=1, per_page=20):
+    """Поиск с ранжированием; возвращает страницу SearchPage"""
+    kinds = [kind for kind in (kinds or KIND_CODES) if kind in KIND_CODES]
+    offset = (page - 1) * per_page
+    connection = connections[router.db_for_read(Vulnerability)]
+
+    if connection.vendor == 'sqlite':
+        hits = _search_sqlite(connection, user, query, kinds, per_page + 1, offset)
+    elif connection.vendor == 'postgresql':
+        hits = _search_postgresql(user, query, kinds, per_page + 1, offset)
+    else:
+        hits = []
+
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+
+    # Объекты подгружаем одним запросом на тип
+    objects = {}
+    for kind in {kind for kind, _, _ in hits}:
+        queryset = KIND_MODELS[kind].objects.all()
+        if kind == 'vulnerability':
+            queryset = queryset.select_related('business_process')
+        elif kind == 'recommendation':
+            queryset = queryset.select_related('vulnerability')
+        objects[kind] = queryset.in_bulk([pk for hit_kind, pk, _ in hits if hit_kind == kind])
+
+    results = [
+        SearchResult(kind, objects[kind][pk], score)
+        for kind, pk, score in hits
+        if pk in objects[kind]
+    ]
+    return SearchPage(results, page, has_next)
+
+
+def _search_sqlite(connection, user, query, kinds, limit, offset):
+    match = build_match(query, user.pk)
+    if match is None:
+        return []
+    # Тип фильтруем по rowid среди уже найденного: индексируемая колонка "kind"
+    # совпадала бы почти со всеми документами и замедляла пересечение списков
+    codes = [KIND_CODES[kind] for kind in kinds]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, bm25({SEARCH_TABLE}, %s, 1.0, 0.0) AS score FROM {SEARCH_TABLE} '
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid %% 4 IN ({', '.join(['%s'] * len(codes))}) "
+            'ORDER BY score LIMIT %s OFFSET %s',
+            [TITLE_WEIGHT, match, *codes, limit, offset],
+        )
+        # bm25 тем меньше, чем лучше совпадение
+        return [(*_split_rowid(rowid), -score) for rowid, score in cursor.fetchall()]
+
+
+def _search_postgresql(user, query, kinds, limit, offset):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    search_query = SearchQuery(query, config='russian', search_type='websearch')
+    sources = {
+        'vulnerability': (
+            Vulnerability.objects.filter(business_process__owner=user),
+            SearchVector('title', weight='A', config='russian')
+            + SearchVector('description', weight='B', config='russian'),
+        ),
+        'recommendation': (
+            Recommendation.objects.filter(vulnerability__business_process__owner=user),
+            SearchVector('title', weight='A', config='russian')
+            + SearchVector('content', weight='B', config='russian'),
+        ),
+        'template': (
+            VulnerabilityTemplate.objects.all(),
+            SearchVector('title', weight='A', config='russian')
+            + SearchVector('description', 'mitigation', 'keywords', weight='B', config='russian'),
+        ),
+    }
+    # Лучшие совпадения каждого типа сливаем по рангу
+    hits = []
+    for kind in kinds:
+        queryset, vector = sources[kind]
+        hits.extend(
+            (kind, pk, score)
+            for pk, score in queryset.annotate(score=SearchRank(vector, search_query))
+            .filter(score__gt=0).order_by('-score').values_list('pk', 'score')[:offset + limit]
+        )
+    hits.sort(key=lambda hit: hit[2], reverse=True)
+    return hits[offset:offset + limit]
@@ -1,71 +1,294 @@
-from .models import BusinessProcess, Vulnerability, Recommendation, VulnerabilityTemplate
+import hashlib
+from collections import Counter
 
-def auto_scan_process(process):
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BusinessProcess, ProcessStep, Vulnerability, Recommendation
+from .matching import get_template_matcher
+from .rollups import apply_rollup_deltas, count_deltas
+from .caching import invalidate_dashboard
+from .db import retry_on_locked
+from . import audit, search
+
+# Как часто (в шагах) сообщать о прогрессе фонового скана
+SCAN_PROGRESS_EVERY = 25
+
+# Массовое изменение уязвимостей: какие поля и сколько строк за раз
+BULK_UPDATE_FIELDS = ('status', 'severity', 'step')
+BULK_UPDATE_MAX = 5000
+
+
+def auto_scan_process(process, full=False, progress=None, dry_run=False):
     """
     Анализирует шаги процесса (и описание процесса) и создает уязвимости
     на основе шаблонов из базы данных.
+
+    По умолчанию сканируются только шаги, у которых изменился текст или
+    банк шаблонов с прошлого скана; full=True пересканирует все шаги.
+    progress(done, total) - необязательный колбэк для отчета о ходе скана.
+    dry_run=True - только найти новые уязвимости, ничего не записывая в БД.
     """
-    found_vulns = []
-    
-    # 1. Получаем все шаблоны из БД
-    templates = VulnerabilityTemplate.objects.all()
-    
-    # 2. Собираем тексты для анализа: Название процесса + Описание процесса
+    # 1. Получаем скомпилированный банк шаблонов (собирается один раз на версию банка)
+    matcher = get_template_matcher()
 
+    # 2. Отбираем шаги, отпечаток которых отличается от сохраненного
+    steps = []
     for step in process.steps.all():
+        fingerprint = step_fingerprint(step, matcher.version)
+        if full or step.scan_fingerprint != fingerprint:
+            step.scan_fingerprint = fingerprint
+            steps.append(step)
+    if progress:
+        progress(0, len(steps))
+    if not steps:
+        return []
+
+    if dry_run:
+        return [vuln for vuln, _ in _collect_findings(process, steps, matcher)]
+
+    # 3. Если параллельный скан успел вставить те же строки, пересчитываем один раз
+    for attempt in range(2):
+        findings = _collect_findings(process, steps, matcher, progress)
+        try:
+            vulns = _save_findings(findings, steps)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+
+    if progress:
+        progress(len(steps), len(steps))
+    return vulns
+
+
+def step_fingerprint(step, bank_version):
+    """Отпечаток шага: хеш названия и описания плюс версия банка шаблонов"""
+    payload = '\0'.join([step.name, step.description, bank_version])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _collect_findings(process, steps, matcher, progress=None):
+    """
+    Вычисляет новые находки в памяти: пары (уязвимость, шаблон).
+    Уже существующие пары (шаг, название) загружаются одним запросом.
+    """
+    existing = set(
+        Vulnerability.objects.filter(business_process=process, step__in=steps)
+        .values_list('step_id', 'title')
+    )
+
+    findings = []
+    for done, step in enumerate(steps):
+        if progress and done and done % SCAN_PROGRESS_EVERY == 0:
+            progress(done, len(steps))
+
         step_text = step.name.lower() + " " + step.description.lower()
-        
-        for template in templates:
-            # Разбиваем ключевые слова
-            keywords = [k.strip().lower() for k in template.keywords.split(',')]
-            
-            # Если ключевое слово найдено в названии/описании ШАГА
-            if any(keyword in step_text for keyword in keywords):
-                
-                # Проверяем дубликаты на этом шаге
-                exists = Vulnerability.objects.filter(
-                    business_process=process,
-                    step=step,
-                    title=template.title
-                ).exists()
-                
-                if not exists:
-                    # Создаем уязвимость
-                    vuln = Vulnerability.objects.create(
-                        business_process=process,
-                        step=step,
-                        title=template.title,
-                        description=template.description,
-                        severity=template.severity,
-                        status='open'
-                    )
-                    
-                    # Создаем рекомендацию
-                    if template.mitigation:
-                        Recommendation.objects.create(
-                            vulnerability=vuln,
-                            title=f"Решение: {template.title}",
-                            content=template.mitigation,
-                            priority=3
-                        )
-                    
-                    found_vulns.append(vuln)
-
-    return found_vulns
+
+        for template in matcher.match(step_text):
+            key = (step.pk, template.title)
+            # Проверяем дубликаты на этом шаге (в том числе среди новых находок)
+            if key in existing:
+                continue
+            existing.add(key)
+
+            vuln = Vulnerability(
+                business_process=process,
+                step=step,
+                title=template.title,
+                description=template.description,
+                severity=template.severity,
+                status='open'
+            )
+            findings.append((vuln, template))
+
+    return findings
+
+
+@retry_on_locked
+def _save_findings(findings, steps):
+    """Пакетно записывает уязвимости, рекомендации и отпечатки шагов в одной транзакции"""
+    with transaction.atomic():
+        ProcessStep.objects.bulk_update(steps, ['scan_fingerprint'])
+
+        vulns = Vulnerability.objects.bulk_create([vuln for vuln, _ in findings])
+
+        recommendations = Recommendation.objects.bulk_create([
+            Recommendation(
+                vulnerability=vuln,
+                title=f"Решение: {template.title}",
+                content=template.mitigation,
+                priority=3
+            )
+            for vuln, template in findings
+            if template.mitigation
+        ])
+
+        apply_rollup_deltas(count_deltas(vulns))
+        # bulk_create не отправляет сигналы - полнотекстовый индекс и журнал обновляем сами
+        search.index_objects('vulnerability', [vuln.pk for vuln in vulns])
+        search.index_objects('recommendation', [rec.pk for rec in recommendations])
+        audit.record(audit.created_entries(vulns) + audit.created_entries(recommendations))
+
+    if vulns:
+        invalidate_dashboard(vulns[0].business_process.owner_id)
+    return vulns
+
+
+class BulkActionError(Exception):
+    """Массовое изменение невозможно - ничего не изменено"""
+
+
+@retry_on_locked
+def bulk_update_vulnerabilities(owner, ids, changes):
+    """
+    Меняет статус, серьезность и/или шаг у выбранных уязвимостей владельца
+    одним UPDATE ... WHERE id IN (...) - только у строк, где что-то меняется.
+    changes - {'status': ..., 'severity': ..., 'step': шаг или None}.
+    Дата решения выставляется как в Vulnerability.save(). Сводные счетчики
+    и журнал изменений пишутся пакетно в той же транзакции.
+    Возвращает число измененных уязвимостей.
+    """
+    unknown = set(changes) - set(BULK_UPDATE_FIELDS)
+    if unknown:
+        raise ValueError(f"Массово не меняются поля: {', '.join(sorted(unknown))}")
+    ids = sorted(set(ids))
+    if len(ids) > BULK_UPDATE_MAX:
+        raise BulkActionError(f'За один раз можно изменить не более {BULK_UPDATE_MAX} уязвимостей')
+    if not ids or not changes:
+        return 0
+
+    step = changes.get('step')
+    today = timezone.localdate()
+    with transaction.atomic():
+        queryset = Vulnerability.objects.filter(pk__in=ids, business_process__owner=owner)
+        if not connections[router.db_for_write(Vulnerability)].features.has_select_for_update:
+            # SQLite: пустой UPDATE сразу берет блокировку записи - строки не изменятся до конца транзакции
+            Vulnerability.objects.filter(pk=ids[0]).update(status=F('status'))
+        rows = list(queryset.select_for_update().values_list(
+            'pk', 'business_process_id', 'title', 'severity', 'status', 'step_id', 'resolved_date'))
+
+        if step is not None:
+            _check_step_move(step, rows)
+
+        updates = []
+        deltas = Counter()
+        for pk, process_id, title, severity, status, step_id, resolved_date in rows:
+            new_status = changes.get('status', status)
+            new_severity = changes.get('severity', severity)
+            new_step_id = step.pk if step is not None else (None if 'step' in changes else step_id)
+            if new_status == 'resolved':
+                new_resolved = resolved_date or today
+            elif new_status in ('open', 'in_progress'):
+                new_resolved = None
+            else:
+                new_resolved = resolved_date
+            diff = {
+                name: [old, new]
+                for name, old, new in (
+                    ('status', status, new_status),
+                    ('severity', severity, new_severity),
+                    ('step', step_id, new_step_id),
+                    ('resolved_date', resolved_date, new_resolved),
+                )
+                if old != new
+            }
+            if diff:
+                updates.append((pk, title, process_id, diff))
+                deltas[(process_id, severity, status)] -= 1
+                deltas[(process_id, new_severity, new_status)] += 1
+        if not updates:
+            return 0
+
+        # UPDATE не выставляет auto_now - версию строки (для ETag в API) обновляем сами
+        values = {'updated_at': timezone.now()}
+        if 'severity' in changes:
+            values['severity'] = changes['severity']
+        if 'step' in changes:
+            values['step'] = step
+        if 'status' in changes:
+            values['status'] = changes['status']
+            if changes['status'] == 'resolved':
+                values['resolved_date'] = Coalesce(F('resolved_date'), Value(today))
+            elif changes['status'] in ('open', 'in_progress'):
+                values['resolved_date'] = None
+        Vulnerability.objects.filter(pk__in=[pk for pk, *_ in updates]).update(**values)
+
+        # apply_rollup_deltas пропускает нулевые изменения (серьезность и статус те же)
+        apply_rollup_deltas(deltas)
+        # Журнал - одной вставкой в этой же транзакции (текст уязвимостей не меняется - поиск не трогаем)
+        audit.flush(audit.row_entries('vulnerability', [
+            (pk, title, process_id, pk, diff) for pk, title, process_id, diff in updates
+        ]))
+
+    invalidate_dashboard(owner.pk)
+    return len(updates)
+
+
+def _check_step_move(step, rows):
+    """Шаг должен быть из процесса уязвимостей, а названия на нем - не повторяться"""
+    if any(process_id != step.business_process_id for _, process_id, *_ in rows):
+        raise BulkActionError(f'Шаг "{step.name}" относится к другому процессу, чем часть выбранных уязвимостей')
+    moving = [(pk, title) for pk, _, title, _, _, step_id, _ in rows if step_id != step.pk]
+    titles = Counter(title for _, title in moving)
+    titles.update(set(
+        Vulnerability.objects.filter(business_process_id=step.business_process_id, step=step)
+        .exclude(pk__in=[pk for pk, _ in moving])
+        .filter(title__in=list(titles))
+        .values_list('title', flat=True)
+    ))
+    duplicates = sorted(title for title, count in titles.items() if count > 1)
+    if duplicates:
+        raise BulkActionError(
+            f'На шаге "{step.name}" окажутся уязвимости с одинаковым названием: {", ".join(duplicates[:5])}'
+        )
+
+
+def vulnerability_stats(vulnerabilities):
+    """
+    Все счетчики по серьезности и статусу одним запросом (условная агрегация).
+    Общий источник для дашборда, карточки процесса и calculate_risk_metrics.
+    """
+    resolution_time = ExpressionWrapper(
+        F('resolved_date') - F('discovered_date'),
+        output_field=DurationField()
+    )
+    stats = vulnerabilities.order_by().aggregate(
+        total=Count('id'),
+        critical=Count('id', filter=Q(severity=5)),
+        high=Count('id', filter=Q(severity=4)),
+        medium=Count('id', filter=Q(severity=3)),
+        low=Count('id', filter=Q(severity__lte=2)),
+        open=Count('id', filter=Q(status='open')),
+        in_progress=Count('id', filter=Q(status='in_progress')),
+        resolved=Count('id', filter=Q(status='resolved')),
+        closed=Count('id', filter=Q(status='closed')),
+        avg_resolution_time=Avg(resolution_time, filter=Q(resolved_date__isnull=False)),
+    )
+
+    # Среднее время устранения - в днях
+    avg_resolution_time = stats['avg_resolution_time']
+    stats['avg_resolution_days'] = (
+        round(avg_resolution_time.total_seconds() / 86400, 1) if avg_resolution_time else 0
+    )
+    del stats['avg_resolution_time']
+    return stats
 
 
 def calculate_risk_metrics(user):
     """
     Вычисляет основные метрики риска для пользователя.
     """
-    vulnerabilities = Vulnerability.objects.filter(business_process__owner=user)
+    stats = vulnerability_stats(Vulnerability.objects.filter(business_process__owner=user))
     
     return {
-        'total_vulnerabilities': vulnerabilities.count(),
-        'critical_count': vulnerabilities.filter(severity=5).count(),
-        'high_count': vulnerabilities.filter(severity__in=[3, 4]).count(),
-        'resolved_count': vulnerabilities.filter(status='resolved').count(),
-        'open_count': vulnerabilities.filter(status='open').count(),
-        'in_progress_count': vulnerabilities.filter(status='in_progress').count(),
-        'avg_resolution_time': 0, 
+        'total_vulnerabilities': stats['total'],
+        'critical_count': stats['critical'],
+        'high_count': stats['high'] + stats['medium'],
+        'resolved_count': stats['resolved'],
+        'open_count': stats['open'],
+        'in_progress_count': stats['in_progress'],
+        'avg_resolution_time': stats['avg_resolution_days'],
     }
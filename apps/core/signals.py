@@ -0,0 +1,220 @@
+from django.db import connections, router
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import BusinessProcess, ProcessStep, Recommendation, TemplateBank, Vulnerability, VulnerabilityTemplate
+from . import audit, rollups, search
+from .caching import invalidate_dashboard
+from .template_bank import bank_loading
+
+
+_ROLLUP_FIELDS = ('business_process_id', 'severity', 'status')
+
+
+def _rollup_key(vulnerability):
+    return vulnerability.business_process_id, vulnerability.severity, vulnerability.status
+
+
+def _process_owner_id(process_id):
+    return BusinessProcess.objects.filter(pk=process_id).values_list('owner_id', flat=True).first()
+
+
+def _vulnerability_owner_id(vulnerability):
+    if Vulnerability.business_process.is_cached(vulnerability):
+        return vulnerability.business_process.owner_id
+    return _process_owner_id(vulnerability.business_process_id)
+
+
+@receiver(post_init, sender=Vulnerability)
+def remember_rollup_state(sender, instance, **kwargs):
+    """
+    Запоминаем загруженные значения: от них считается дельта счетчиков, а на
+    SQLite блокирующий UPDATE в pre_save проверяет по ним, что строку никто не
+    менял - тогда перечитывать ее не нужно. Если часть полей отложена
+    (.only/.defer), ключ не запоминаем: обращение к ним загружало бы объект
+    заново (pre_save перечитает строку).
+    """
+    loaded = instance.__dict__
+    if all(name in loaded for name in _ROLLUP_FIELDS):
+        instance._rollup_key = _rollup_key(instance)
+    else:
+        instance._rollup_key = None
+
+
+@receiver(pre_save, sender=Vulnerability)
+def lock_rollup_state(sender, instance, raw=False, **kwargs):
+    """
+    Перед изменением берем блокировку строки: если ее успел изменить другой
+    запрос, дельта считается от актуального состояния, а не от загруженного.
+    Vulnerability.save() открывает транзакцию, так что блокировка держится до
+    записи счетчиков. Запросов - один: SELECT ... FOR UPDATE, а на SQLite
+    пустой UPDATE с условием на загруженные значения; строка перечитывается,
+    только если она изменилась (или значения не были загружены).
+    """
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    using = router.db_for_write(sender, instance=instance)
+    current = sender._default_manager.using(using).filter(pk=instance.pk)
+    if not connections[using].features.has_select_for_update:
+        # SQLite: UPDATE берет блокировку записи на всю базу, даже если ни одна строка не подошла
+        loaded = instance._rollup_key
+        unchanged = current.filter(**dict(zip(_ROLLUP_FIELDS, loaded))) if loaded is not None else current
+        if unchanged.update(status=F('status')) and loaded is not None:
+            return
+    row = current.select_for_update().values_list(*_ROLLUP_FIELDS).first()
+    if row is not None:
+        instance._rollup_key = row
+
+
+@receiver(post_save, sender=Vulnerability)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_key = _rollup_key(instance)
+    if created:
+        rollups.apply_rollup_deltas({new_key: 1})
+    elif new_key != instance._rollup_key:
+        rollups.apply_rollup_deltas({instance._rollup_key: -1, new_key: 1})
+    instance._rollup_key = new_key
+    invalidate_dashboard(_vulnerability_owner_id(instance))
+
+
+@receiver(post_delete, sender=Vulnerability)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    # При удалении процесса целиком его вклад уже вычтен в subtract_process
+    if instance.business_process_id in rollups.deleting_processes():
+        return
+    rollups.apply_rollup_deltas({instance._rollup_key or _rollup_key(instance): -1})
+    invalidate_dashboard(_vulnerability_owner_id(instance))
+
+
+@receiver(pre_delete, sender=BusinessProcess)
+def subtract_process_rollups(sender, instance, **kwargs):
+    # Отмечает процесс как удаляемый (см. rollups.mark_deleting): кеш сбросим
+    # один раз после удаления, каскад не пишем в журнал и поиск по одному объекту
+    rollups.subtract_process(instance)
+
+
+@receiver(post_delete, sender=BusinessProcess)
+def forget_deleted_process(sender, instance, **kwargs):
+    rollups.unmark_deleting(instance)
+    invalidate_dashboard(instance.owner_id)
+
+
+@receiver(post_save, sender=BusinessProcess)
+def invalidate_on_process_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_dashboard(instance.owner_id)
+
+
+@receiver(post_save, sender=Recommendation)
+@receiver(post_delete, sender=Recommendation)
+def invalidate_on_recommendation_change(sender, instance, raw=False, **kwargs):
+    if raw or rollups.deleting_processes():
+        return
+    owner_id = (
+        Vulnerability.objects.filter(pk=instance.vulnerability_id)
+        .values_list('business_process__owner_id', flat=True)
+        .first()
+    )
+    invalidate_dashboard(owner_id)
+
+
+# Полнотекстовый индекс: переиндексируем, только если изменился текст
+SEARCH_FIELDS = {
+    Vulnerability: ('vulnerability', ('title', 'description')),
+    Recommendation: ('recommendation', ('title', 'content')),
+    VulnerabilityTemplate: ('template', ('title', 'description', 'mitigation', 'keywords')),
+}
+
+
+def _search_text(instance):
+    """
+    Индексируемый текст объекта. None, если часть полей отложена (.only/.defer):
+    обращение к ним загружало бы объект заново одним запросом на строку.
+    """
+    _, fields = SEARCH_FIELDS[type(instance)]
+    loaded = instance.__dict__
+    if any(name not in loaded for name in fields):
+        return None
+    return tuple(loaded[name] for name in fields)
+
+
+@receiver(post_init, sender=Vulnerability)
+@receiver(post_init, sender=Recommendation)
+@receiver(post_init, sender=VulnerabilityTemplate)
+def remember_search_text(sender, instance, **kwargs):
+    instance._search_text = _search_text(instance)
+
+
+@receiver(post_save, sender=Vulnerability)
+@receiver(post_save, sender=Recommendation)
+@receiver(post_save, sender=VulnerabilityTemplate)
+def update_search_index(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    text = _search_text(instance)
+    if created or text is None or text != instance._search_text:
+        search.index_objects(SEARCH_FIELDS[sender][0], [instance.pk])
+        instance._search_text = text
+
+
+@receiver(post_delete, sender=Vulnerability)
+@receiver(post_delete, sender=Recommendation)
+@receiver(post_delete, sender=VulnerabilityTemplate)
+def remove_from_search_index(sender, instance, **kwargs):
+    # При удалении процесса его документы уже удалены одним запросом
+    if rollups.deleting_processes() and sender is not VulnerabilityTemplate:
+        return
+    search.remove_objects(SEARCH_FIELDS[sender][0], [instance.pk])
+
+
+@receiver(pre_delete, sender=BusinessProcess)
+def remove_process_from_search_index(sender, instance, **kwargs):
+    search.remove_process(instance)
+
+
+# Любое изменение банка шаблонов меняет его версию (загрузчик увеличивает ее сам, один раз)
+@receiver(post_save, sender=VulnerabilityTemplate)
+@receiver(post_delete, sender=VulnerabilityTemplate)
+def bump_template_bank_version(sender, raw=False, **kwargs):
+    if raw or bank_loading.get():
+        return
+    TemplateBank.bump()
+
+
+# Журнал изменений: разница считается по снимку загруженных значений (см. audit.py)
+@receiver(post_init, sender=BusinessProcess)
+@receiver(post_init, sender=ProcessStep)
+@receiver(post_init, sender=Vulnerability)
+@receiver(post_init, sender=Recommendation)
+def remember_audit_snapshot(sender, instance, **kwargs):
+    audit.snapshot(instance)
+
+
+@receiver(post_save, sender=BusinessProcess)
+@receiver(post_save, sender=ProcessStep)
+@receiver(post_save, sender=Vulnerability)
+@receiver(post_save, sender=Recommendation)
+def audit_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        audit.saved(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=ProcessStep)
+@receiver(post_delete, sender=Vulnerability)
+@receiver(post_delete, sender=Recommendation)
+def audit_on_delete(sender, instance, **kwargs):
+    # Журнал удаляемого процесса удаляется вместе с ним - каскад не записываем
+    if not rollups.deleting_processes():
+        audit.record(audit.deleted_entries([instance]))
+
+
+# Удаление шага обнуляет step у его уязвимостей запросом UPDATE в обход save() -
+# версию строк (ETag в API) меняем сами
+@receiver(pre_delete, sender=ProcessStep)
+def touch_step_vulnerabilities(sender, instance, **kwargs):
+    if not rollups.deleting_processes():
+        Vulnerability.objects.filter(step=instance).update(updated_at=timezone.now())
@@ -0,0 +1,149 @@
+"""
+Стеммер русского языка по алгоритму Snowball (Porter, snowballstem.org/algorithms/russian).
+Используется полнотекстовым поиском: в индекс и в запрос попадают основы слов,
+поэтому "уязвимости" находит "уязвимость", а "загрузки" - "загрузка".
+"""
+import functools
+import re
+
+VOWELS = set('аеиоуыэюя')
+
+
+def _compile(groups):
+    """Группа окончаний -> ({окончание: нужна ли перед ним "а"/"я"}, длина самого длинного)"""
+    endings = {ending: after_a for group, after_a in groups for ending in group}
+    return endings, max(map(len, endings))
+
+
+# Окончания каждой группы: (окончания, требуют ли перед собой "а"/"я")
+PERFECTIVE_GERUND = _compile([
+    (('в', 'вши', 'вшись'), True),
+    (('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'), False),
+])
+ADJECTIVE = _compile([(
+    ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+     'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'),
+    False,
+)])
+PARTICIPLE = _compile([
+    (('ем', 'нн', 'вш', 'ющ', 'щ'), True),
+    (('ивш', 'ывш', 'ующ'), False),
+])
+REFLEXIVE = _compile([(('ся', 'сь'), False)])
+VERB = _compile([
+    (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны',
+      'ть', 'ешь', 'нно'), True),
+    (('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им',
+      'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть',
+      'ишь', 'ую', 'ю'), False),
+])
+NOUN = _compile([(
+    ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой',
+     'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь',
+     'ию', 'ью', 'ю', 'ия', 'ья', 'я'),
+    False,
+)])
+SUPERLATIVE = _compile([(('ейш', 'ейше'), False)])
+DERIVATIONAL = _compile([(('ост', 'ость'), False)])
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_CYRILLIC = re.compile(r'^[а-я]+$')
+
+
+def _regions(word):
+    """Позиции RV, R1 и R2 (см. описание алгоритма)"""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r1, r2
+
+
+def _strip(word, start, groups):
+    """
+    Отрезает самое длинное подходящее окончание из groups, если оно целиком
+    лежит не левее start. None - окончание не найдено.
+    """
+    endings, longest = groups
+    for length in range(min(longest, len(word)), 0, -1):
+        ending = word[-length:]
+        if ending in endings:
+            after_a = endings[ending]
+            break
+    else:
+        return None
+
+    cut = len(word) - length
+    if cut < start:
+        return None
+    if after_a and (cut - 1 < start or word[cut - 1] not in 'ая'):
+        return None
+    return word[:cut]
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    """Основа одного слова; нерусские слова возвращаются в нижнем регистре без изменений"""
+    word = word.lower().replace('ё', 'е')
+    if not _CYRILLIC.match(word):
+        return word
+
+    rv, _, r2 = _regions(word)
+
+    # Шаг 1
+    stripped = _strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = _strip(word, rv, ADJECTIVE)
+        if stripped is not None:
+            # ADJECTIVAL: причастие перед окончанием прилагательного
+            word = _strip(stripped, rv, PARTICIPLE) or stripped
+        else:
+            stripped = _strip(word, rv, VERB)
+            if stripped is None:
+                stripped = _strip(word, rv, NOUN)
+            if stripped is not None:
+                word = stripped
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        word = word[:-1]
+    else:
+        stripped = _strip(word, rv, SUPERLATIVE)
+        if stripped is not None:
+            word = stripped
+            if word.endswith('нн') and len(word) - 1 >= rv:
+                word = word[:-1]
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+
+    return word
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре"""
+    return WORD_RE.findall(text.lower())
+
+
+def stem_text(text):
+    """Текст, в котором каждое слово заменено основой (для записи в индекс)"""
+    return ' '.join(stem(token) for token in tokenize(text or ''))
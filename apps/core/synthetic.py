@@ -0,0 +1,153 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    AuditLog, BusinessProcess, ProcessStep, Recommendation, TemplateBank, Vulnerability,
+    VulnerabilityTemplate,
+)
+from .rollups import rebuild_rollups
+from . import search
+
+# Словарь для названий шагов и ключевых слов шаблонов: автоскан находит совпадения
+VOCABULARY = [
+    'вход', 'регистрация', 'email', 'загрузка', 'файл', 'оплата', 'подтверждение',
+    'ссылка', 'пароль', 'админка', 'отчет', 'экспорт', 'api', 'токен', 'оператор',
+    'документы', 'аккаунт', 'профиль', 'поиск', 'уведомление', 'договор', 'карта',
+    'перевод', 'анкета', 'скан', 'проверка', 'выгрузка', 'интеграция', 'сессия', 'кошелек',
+]
+
+SYNTHETIC_PREFIX = 'synthetic_'
+SYNTHETIC_PASSWORD = 'synthetic-pass'
+BATCH_SIZE = 2000
+
+
+def generate(users=2, processes=5, steps=10, vulnerabilities=20, recommendations=1,
+             audit_logs=2, templates=50, seed=42):
+    """
+    Создает детерминированный синтетический набор данных.
+    Количества процессов - на пользователя, шагов и уязвимостей - на процесс,
+    рекомендаций и записей аудита - на уязвимость.
+    Возвращает словарь с числом созданных объектов.
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+    password = make_password(SYNTHETIC_PASSWORD)
+    counts = {}
+    today = timezone.localdate()
+
+    with transaction.atomic():
+        start = User.objects.filter(username__startswith=SYNTHETIC_PREFIX).count()
+        user_objs = User.objects.bulk_create([
+            User(
+                username=f'{SYNTHETIC_PREFIX}{start + i}',
+                email=f'{SYNTHETIC_PREFIX}{start + i}@example.com',
+                password=password,
+            )
+            for i in range(users)
+        ])
+        counts['users'] = len(user_objs)
+
+        template_start = VulnerabilityTemplate.objects.filter(key__startswith='synthetic-').count()
+        template_objs = VulnerabilityTemplate.objects.bulk_create([
+            VulnerabilityTemplate(
+                key=f'synthetic-{template_start + i}',
+                title=f'Synthetic threat {i}',
+                description=f'Синтетическая угроза {i}: ' + ' '.join(rng.sample(VOCABULARY, 5)),
+                severity=rng.randint(1, 5),
+                keywords=', '.join(rng.sample(VOCABULARY, 2) + [f'маркер{i}']),
+                mitigation=f'Синтетическая мера защиты {i}',
+            )
+            for i in range(templates)
+        ], batch_size=BATCH_SIZE)
+        counts['templates'] = len(template_objs)
+
+        process_objs = BusinessProcess.objects.bulk_create([
+            BusinessProcess(
+                name=f'Процесс {user.username}-{i}',
+                description=' '.join(rng.sample(VOCABULARY, 6)),
+                owner=user,
+                criticality=rng.choice(['low', 'medium', 'high', 'critical']),
+            )
+            for user in user_objs
+            for i in range(processes)
+        ], batch_size=BATCH_SIZE)
+        counts['processes'] = len(process_objs)
+
+        step_objs = ProcessStep.objects.bulk_create([
+            ProcessStep(
+                business_process=process,
+                name=' '.join(rng.sample(VOCABULARY, 2)).capitalize(),
+                description=' '.join(rng.sample(VOCABULARY, 4)),
+                order=i,
+            )
+            for process in process_objs
+            for i in range(steps)
+        ], batch_size=BATCH_SIZE)
+        counts['steps'] = len(step_objs)
+
+        steps_by_process = {}
+        for step in step_objs:
+            steps_by_process.setdefault(step.business_process_id, []).append(step)
+
+        statuses = [status for status, _ in Vulnerability.STATUS_CHOICES]
+        vuln_objs = []
+        for process in process_objs:
+            process_steps = steps_by_process.get(process.pk, [None])
+            for i in range(vulnerabilities):
+                status = rng.choice(statuses)
+                vuln_objs.append(Vulnerability(
+                    business_process=process,
+                    step=rng.choice(process_steps),
+                    # Номер в названии сохраняет уникальность (процесс, шаг, название)
+                    title=f'Synthetic finding {i}',
+                    description=' '.join(rng.sample(VOCABULARY, 8)),
+                    severity=rng.randint(1, 5),
+                    status=status,
+                    resolved_date=today if status in ('resolved', 'closed') else None,
+                ))
+        vuln_objs = Vulnerability.objects.bulk_create(vuln_objs, batch_size=BATCH_SIZE)
+        counts['vulnerabilities'] = len(vuln_objs)
+
+        rec_objs = Recommendation.objects.bulk_create([
+            Recommendation(
+                vulnerability=vuln,
+                title=f'Мера {i} для {vuln.title}',
+                content=' '.join(rng.sample(VOCABULARY, 10)),
+                priority=rng.randint(1, 3),
+                is_implemented=rng.random() < 0.3,
+            )
+            for vuln in vuln_objs
+            for i in range(recommendations)
+        ], batch_size=BATCH_SIZE)
+        counts['recommendations'] = len(rec_objs)
+
+        counts['audit_logs'] = len(AuditLog.objects.bulk_create([
+            AuditLog(
+                object_type='vulnerability',
+                object_id=vuln.pk,
+                object_repr=vuln.title,
+                business_process=vuln.business_process,
+                vulnerability=vuln,
+                user=vuln.business_process.owner,
+                action='status_changed',
+                old_value='open',
+                new_value=vuln.status,
+            )
+            for vuln in vuln_objs
+            for _ in range(audit_logs)
+        ], batch_size=BATCH_SIZE))
+
+        # Массовая вставка обходит сигналы - сводные счетчики и поиск обновляем сами
+        for user in user_objs:
+            rebuild_rollups(owner=user)
+        search.index_objects('template', [template.pk for template in template_objs])
+        if template_objs:
+            TemplateBank.bump()
+        search.index_objects('vulnerability', [vuln.pk for vuln in vuln_objs])
+        search.index_objects('recommendation', [rec.pk for rec in rec_objs])
+
+    return counts
@@ -0,0 +1,216 @@
+"""
+Загрузка банка шаблонов уязвимостей из файлов (JSON, YAML, CSV).
+
+Банк - файл или каталог с файлами. Файл JSON/YAML - список шаблонов или
+объект {"version": "...", "templates": [...]}; CSV - колонки
+key, title, description, severity, keywords, mitigation.
+
+Шаблоны сопоставляются по постоянному ключу (key): новые добавляются,
+измененные обновляются одним bulk_create(update_conflicts=True), отсутствующие
+в файлах удаляются - все в одной транзакции, так что банк ни на момент
+не остается пустым. Если что-то изменилось, версия банка (TemplateBank)
+увеличивается: по ней автоскан пересобирает матчер и пересканирует шаги.
+"""
+import csv
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import search
+from .models import TemplateBank, Vulnerability, VulnerabilityTemplate
+
+BANK_EXTENSIONS = ('.json', '.yaml', '.yml', '.csv')
+DEFAULT_BANK_PATH = Path(__file__).resolve().parent / 'bank'
+
+# Поля шаблона, которые задаются файлами банка
+TEMPLATE_FIELDS = ('title', 'description', 'severity', 'keywords', 'mitigation')
+
+# Загрузчик сам увеличивает версию один раз на загрузку (см. signals.py)
+bank_loading = ContextVar('bank_loading', default=False)
+
+
+class BankError(Exception):
+    """Файлы банка некорректны - банк не загружается вовсе"""
+
+
+class BankTemplate:
+    """Шаблон, прочитанный из файла"""
+
+    def __init__(self, key, source, **fields):
+        self.key = key
+        self.source = source
+        self.fields = fields
+
+    def values(self):
+        return tuple(self.fields[name] for name in TEMPLATE_FIELDS)
+
+
+def read_bank(path):
+    """
+    Читает банк из файла или каталога. Возвращает (шаблоны, версия источника).
+    Все ошибки собираются и выбрасываются одним BankError.
+    """
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(p for p in path.rglob('*') if p.suffix.lower() in BANK_EXTENSIONS)
+        if not files:
+            raise BankError(f'В каталоге {path} нет файлов банка ({", ".join(BANK_EXTENSIONS)})')
+    elif path.is_file():
+        files = [path]
+    else:
+        raise BankError(f'{path} не найден')
+
+    templates, versions, errors = {}, [], []
+    for file in files:
+        try:
+            items, version = _read_file(file)
+        except (OSError, ValueError) as exc:
+            errors.append(f'{file.name}: {exc}')
+            continue
+        if version:
+            versions.append(str(version))
+        for index, item in enumerate(items, start=1):
+            source = f'{file.name}#{index}'
+            try:
+                template = _clean_template(item, source)
+            except ValueError as exc:
+                errors.append(f'{source}: {exc}')
+                continue
+            if template.key in templates:
+                errors.append(f'{source}: ключ "{template.key}" уже есть в {templates[template.key].source}')
+                continue
+            templates[template.key] = template
+
+    if errors:
+        raise BankError('\n'.join(errors))
+    return list(templates.values()), ', '.join(versions)
+
+
+def _read_file(file):
+    suffix = file.suffix.lower()
+    if suffix == '.csv':
+        with open(file, encoding='utf-8-sig', newline='') as source:
+            return list(csv.DictReader(source)), ''
+
+    with open(file, encoding='utf-8-sig') as source:
+        if suffix == '.json':
+            data = json.load(source)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError('для файлов YAML нужен пакет PyYAML')
+            data = yaml.safe_load(source)
+
+    if isinstance(data, dict):
+        return data.get('templates') or [], data.get('version', '')
+    if isinstance(data, list):
+        return data, ''
+    raise ValueError('ожидался список шаблонов или объект с ключом "templates"')
+
+
+def _clean_template(item, source):
+    if not isinstance(item, dict):
+        raise ValueError('ожидался объект шаблона')
+
+    def text(name):
+        value = item.get(name)
+        return '' if value is None else str(value).strip()
+
+    title = text('title')
+    if not title:
+        raise ValueError('не указано название (title)')
+    if len(title) > 255:
+        raise ValueError('название длиннее 255 символов')
+
+    key = text('key') or slugify(title, allow_unicode=True)
+    if not key or len(key) > 100 or slugify(key, allow_unicode=True) != key:
+        raise ValueError(f'некорректный ключ "{key}" (латиница/кириллица, цифры, "-" и "_")')
+
+    keywords = item.get('keywords')
+    if isinstance(keywords, (list, tuple)):
+        keywords = ', '.join(str(keyword).strip() for keyword in keywords)
+    keywords = '' if keywords is None else str(keywords).strip()
+    if not keywords:
+        raise ValueError('не указаны ключевые слова (keywords) - шаблон не найдется автосканом')
+
+    severity = text('severity') or '3'
+    labels = {label.lower(): code for code, label in Vulnerability.SEVERITY_CHOICES}
+    if severity.isdecimal() and int(severity) in dict(Vulnerability.SEVERITY_CHOICES):
+        severity = int(severity)
+    elif severity.lower() in labels:
+        severity = labels[severity.lower()]
+    else:
+        raise ValueError(f'недопустимая серьезность "{severity}"')
+
+    return BankTemplate(
+        key, source,
+        title=title,
+        description=text('description'),
+        severity=severity,
+        keywords=keywords,
+        mitigation=text('mitigation'),
+    )
+
+
+@contextmanager
+def _loading():
+    token = bank_loading.set(True)
+    try:
+        yield
+    finally:
+        bank_loading.reset(token)
+
+
+def sync_bank(templates, source_version='', remove_missing=True, dry_run=False):
+    """
+    Приводит таблицу шаблонов к содержимому банка. Возвращает счетчики
+    added, updated, removed, unchanged и версию банка после загрузки.
+    """
+    existing = {
+        row[0]: row[1:]
+        for row in VulnerabilityTemplate.objects.values_list('key', *TEMPLATE_FIELDS)
+    }
+    keys = {template.key for template in templates}
+    added = [template for template in templates if template.key not in existing]
+    updated = [
+        template for template in templates
+        if template.key in existing and existing[template.key] != template.values()
+    ]
+    removed = [key for key in existing if key not in keys] if remove_missing else []
+    counts = {
+        'added': len(added),
+        'updated': len(updated),
+        'removed': len(removed),
+        'unchanged': len(templates) - len(added) - len(updated),
+    }
+    changed = added or updated or removed
+    if dry_run or not changed:
+        counts['version'] = TemplateBank.current_version()
+        return counts
+
+    with transaction.atomic(), _loading():
+        VulnerabilityTemplate.objects.bulk_create(
+            [VulnerabilityTemplate(key=template.key, **template.fields) for template in added + updated],
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=[*TEMPLATE_FIELDS, 'updated_at'],
+        )
+        if removed:
+            VulnerabilityTemplate.objects.filter(key__in=removed).delete()
+        TemplateBank.bump(source_version=source_version[:100], loaded_at=timezone.now())
+
+        # bulk_create не отправляет сигналы - поисковый индекс обновляем сами
+        search.index_objects('template', list(
+            VulnerabilityTemplate.objects.filter(
+                key__in=[template.key for template in added + updated]
+            ).values_list('pk', flat=True)
+        ))
+
+    counts['version'] = TemplateBank.current_version()
+    return counts
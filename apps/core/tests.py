@@ -0,0 +1,469 @@
+import base64
+import io
+import json
+import tempfile
+import random
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import audit, importer, rollups, routers, search
+from .caching import dashboard_version, get_dashboard_context
+from .conditional import page_condition
+from .db import is_locked_error, lock_retry_count
+from .filters import int_param
+from .forms import VulnerabilityBulkForm
+from .jobs import claim_job, enqueue_autoscan, run_job
+from .management.commands.explain_hot_queries import hot_queries
+from .models import AuditLog, BusinessProcess, Job, Vulnerability
+from .pagination import InvalidCursor
+from .rollups import rebuild_rollups
+from .routers import use_replica
+from .services import bulk_update_vulnerabilities
+from .synthetic import generate
+
+
+def _other_process():
+    """Изменения внутри блока видят только отдельный кеш - как в другом воркере"""
+    return mock.patch('apps.core.caching.cache', LocMemCache('other-process', {}))
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        generate(users=1, processes=2, steps=3, vulnerabilities=5, templates=5)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return {'builds': self.builds}
+
+    def _change_status(self):
+        vulnerability = Vulnerability.objects.filter(business_process__owner=self.user).exclude(status='closed').first()
+        vulnerability.status = 'closed'
+        vulnerability.save()
+
+    def test_cached_until_data_changes(self):
+        get_dashboard_context(self.user, self.build)
+        get_dashboard_context(self.user, self.build)
+        self.assertEqual(self.builds, 1)
+
+        self._change_status()
+        self.assertEqual(get_dashboard_context(self.user, self.build), {'builds': 2})
+
+    def test_change_in_another_process_invalidates_cache(self):
+        get_dashboard_context(self.user, self.build)
+        with _other_process():
+            self._change_status()
+        self.assertEqual(get_dashboard_context(self.user, self.build), {'builds': 2})
+
+    def test_page_etag_changes_after_change_in_another_process(self):
+        self.client.force_login(self.user)
+        process = BusinessProcess.objects.filter(owner=self.user).first()
+        urls = [reverse('core:dashboard'), reverse('core:vulnerability_list') + f'?process={process.pk}']
+        # Страница с формой выставляет CSRF-cookie, от которой зависит ETag
+        for url in urls:
+            self.client.get(url)
+        etags = {}
+        for url in urls:
+            etags[url] = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code, 304)
+
+        with _other_process():
+            self._change_status()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code, 200)
+
+    def test_rolled_back_change_keeps_version(self):
+        version = dashboard_version(self.user.pk)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self._change_status()
+                raise RuntimeError
+        self.assertEqual(dashboard_version(self.user.pk), version)
+
+
+class ProcessDeletionTests(TestCase):
+    def setUp(self):
+        generate(users=1, processes=2, steps=3, vulnerabilities=5, templates=5)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+        self.process = BusinessProcess.objects.filter(owner=self.user).first()
+
+    def test_failed_delete_does_not_leave_process_marked(self):
+        with mock.patch.object(search, 'remove_process', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    self.process.delete()
+        self.assertEqual(rollups.deleting_processes(), set())
+
+        # Процесс остался - его изменения снова учитываются в сводке и журнале
+        vulnerability = Vulnerability.objects.filter(business_process=self.process).first()
+        vulnerability_id = vulnerability.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            vulnerability.delete()
+        self.assertEqual(rebuild_rollups(owner=self.user), 0)
+        self.assertTrue(AuditLog.objects.filter(
+            object_type='vulnerability', object_id=vulnerability_id, action='deleted').exists())
+
+    def test_delete_keeps_rollups_consistent(self):
+        self.process.delete()
+        self.assertEqual(rollups.deleting_processes(), set())
+        self.assertEqual(rebuild_rollups(owner=self.user), 0)
+
+
+class HistoryCursorTests(TestCase):
+    def setUp(self):
+        generate(users=1, processes=1, steps=2, vulnerabilities=3, templates=3)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+        self.vulnerability = Vulnerability.objects.filter(business_process__owner=self.user).first()
+
+    def _cursor(self, state):
+        return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii').rstrip('=')
+
+    def test_malformed_cursor_is_invalid(self):
+        states = [
+            {}, [], {'month': '2024-01'}, {'offset': 0}, {'live': 5},
+            {'month': 202401, 'offset': 0}, {'month': '2024-01', 'offset': '0'},
+            {'month': '2024-01', 'offset': -1}, {'month': '2024-01', 'offset': True},
+            {'month': '2024-01', 'offset': 0, 'before': ['вчера', 1]},
+            {'month': '2024-01', 'offset': 0, 'before': ['2024-01-01T00:00:00+00:00', '1']},
+        ]
+        for state in states:
+            with self.subTest(state=state), self.assertRaises(InvalidCursor):
+                audit.history(self.vulnerability.pk, self._cursor(state))
+
+    def test_interrupted_archive_does_not_repeat_entries(self):
+        AuditLog.objects.filter(vulnerability=self.vulnerability).delete()
+        start = timezone.now() - timedelta(days=400)
+        for i in range(9):
+            entry = AuditLog.objects.create(
+                object_id=self.vulnerability.pk, vulnerability=self.vulnerability,
+                business_process_id=self.vulnerability.business_process_id,
+                user=self.user, action='updated', comment=str(i),
+            )
+            AuditLog.objects.filter(pk=entry.pk).update(timestamp=start + timedelta(hours=i))
+
+        with tempfile.TemporaryDirectory() as root, override_settings(AUDIT_ARCHIVE_ROOT=Path(root)):
+            audit.archive_before(start + timedelta(hours=4), chunk_size=2)
+            # Сбой после записи в архив: порция осталась и в таблице
+            with mock.patch('apps.core.audit._delete_archived'):
+                audit.archive_before(start + timedelta(hours=7), chunk_size=2)
+
+            seen, cursor = [], None
+            while True:
+                page = audit.history(self.vulnerability.pk, cursor, per_page=2)
+                seen.extend(entry.pk for entry in page)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 9)
+
+    def test_history_page_ignores_malformed_cursor(self):
+        self.client.force_login(self.user)
+        url = reverse('core:vulnerability_history', args=[self.vulnerability.pk])
+        response = self.client.get(url, {'cursor': self._cursor({})})
+        self.assertEqual(response.status_code, 200)
+
+
+class VulnerabilityBulkFormTests(TestCase):
+    def setUp(self):
+        generate(users=1, processes=1, steps=2, vulnerabilities=3, templates=3)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+
+    def _form(self, step):
+        return VulnerabilityBulkForm({'action': 'step', 'step': step, 'ids': ['1']}, user=self.user)
+
+    def test_step_must_be_chosen(self):
+        form = self._form('')
+        self.assertFalse(form.is_valid())
+        self.assertIn('step', form.errors)
+
+    def test_explicit_no_step(self):
+        form = self._form('none')
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.changes(), {'step': None})
+
+
+class DecompositionQueriesTests(TestCase):
+    def _open(self, steps):
+        generate(users=1, processes=1, steps=steps, vulnerabilities=steps * 2, templates=5)
+        user = get_user_model().objects.order_by('-pk').first()
+        process = BusinessProcess.objects.get(owner=user)
+        self.client.force_login(user)
+        return reverse('core:process_decomposition', args=[process.pk])
+
+    def test_query_count_does_not_depend_on_process_size(self):
+        small = self._open(steps=2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(small).status_code, 200)
+
+        large = self._open(steps=40)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(large)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['steps']), 40)
+
+
+class ConcurrentWritesTests(TransactionTestCase):
+    """
+    Короткий вариант manage.py stress_db: потоки пишут, пока другой поток
+    держит транзакцию записи дольше busy_timeout.
+    """
+    THREADS = 4
+    WRITES = 10
+    HOLD_SECONDS = 0.3
+
+    def setUp(self):
+        generate(users=1, processes=2, steps=3, vulnerabilities=10, templates=20)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+        self.vulnerability_ids = list(Vulnerability.objects.values_list('pk', flat=True))
+
+    def _write(self, seed, started):
+        rng = random.Random(seed)
+        statuses = [status for status, _ in Vulnerability.STATUS_CHOICES]
+        started.wait()
+        for _ in range(self.WRITES):
+            vulnerability = Vulnerability.objects.get(pk=rng.choice(self.vulnerability_ids))
+            vulnerability.status = rng.choice(statuses)
+            vulnerability.save()
+            bulk_update_vulnerabilities(self.user, rng.sample(self.vulnerability_ids, 3), {'severity': rng.randint(1, 5)})
+
+    def _hold_lock(self, started):
+        with transaction.atomic():
+            Vulnerability.objects.filter(pk=self.vulnerability_ids[0]).update(title=F('title'))
+            started.set()
+            time.sleep(self.HOLD_SECONDS)
+
+    def _run_writers(self):
+        errors = []
+        started = threading.Event()
+
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as exc:
+                errors.append(exc)
+                started.set()
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(self._hold_lock, started))]
+        threads += [threading.Thread(target=run, args=(self._write, seed, started)) for seed in range(self.THREADS)]
+        # Короткий busy_timeout: писатели упираются в блокировку, не дождавшись ее снятия
+        with override_settings(SQLITE_PRAGMAS={**settings.SQLITE_PRAGMAS, 'busy_timeout': 20}):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return errors
+
+    @override_settings(DB_LOCK_RETRY_ATTEMPTS=10)
+    def test_parallel_writes_retry_on_locked(self):
+        retries = lock_retry_count()
+        self.assertEqual(self._run_writers(), [])
+        self.assertGreater(lock_retry_count(), retries)
+        self.assertEqual(rebuild_rollups(), 0)
+
+    @override_settings(DB_LOCK_RETRY_ATTEMPTS=1)
+    def test_parallel_writes_fail_without_retry(self):
+        errors = self._run_writers()
+        self.assertTrue(errors)
+        self.assertTrue(all(is_locked_error(exc) for exc in errors))
+
+
+class HotQueryPlanTests(TestCase):
+    """Короткий вариант manage.py explain_hot_queries: запросы горячих путей идут по индексам"""
+
+    def setUp(self):
+        generate(users=2, processes=5, steps=5, vulnerabilities=40, recommendations=1, audit_logs=1, templates=10)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_hot_queries_use_indexes(self):
+        process = BusinessProcess.objects.select_related('owner').order_by('pk').first()
+        for label, queryset, table in hot_queries(process):
+            model = queryset.model
+            indexes = {index.name for index in model._meta.indexes}
+            with self.subTest(label):
+                lines = [line for line in queryset.explain().splitlines() if f' {table} ' in line]
+                self.assertTrue(lines)
+                for line in lines:
+                    self.assertIn('INDEX', line)
+                    self.assertTrue(any(f'INDEX {name} ' in line for name in indexes), line)
+
+
+class JsonImportReaderTests(TestCase):
+    """JSON читается по элементам: результат не зависит от размера порции чтения"""
+    DOCUMENT = {
+        'source': {'ignored': [1, 2.5e3, None]},
+        'processes': [
+            {
+                'name': 'Закупки', 'criticality': 4,
+                'vulnerabilities': [{'title': 'Без шага', 'severity': -12500.0}],
+                'steps': [{'name': 'Заявка', 'order': 1, 'vulnerabilities': [{'title': 'Подмена "заявки"'}]}, 'шаг'],
+            },
+        ],
+    }
+
+    def _rows(self, data, read_size):
+        with mock.patch.object(importer, 'JSON_READ_SIZE', read_size):
+            return [
+                (ref, str(row) if isinstance(row, importer.RowError) else row)
+                for ref, row in importer.read_rows(io.BytesIO(data), 'json')
+            ]
+
+    def test_rows_do_not_depend_on_read_size(self):
+        for document in (self.DOCUMENT, [{'process': 'А', 'severity': 12345}, 'строка', {}]):
+            data = json.dumps(document, ensure_ascii=False, indent=2).encode('utf-8')
+            expected = self._rows(data, 64 * 1024)
+            self.assertTrue(expected)
+            for read_size in (1, 3, 7):
+                with self.subTest(read_size=read_size):
+                    self.assertEqual(self._rows(data, read_size), expected)
+
+    def test_malformed_json(self):
+        for data in (b'', b'[{"process": "a"} {"process": "b"}]', b'[{"process": "a"}', b'[{}] []', b'{"processes": 1}', b'5'):
+            with self.subTest(data=data), self.assertRaises(importer.ImportFileError):
+                self._rows(data, 4)
+
+
+class PageConditionTests(TestCase):
+    def setUp(self):
+        generate(users=1, processes=1, steps=1, vulnerabilities=1, templates=1)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+
+    def _reads(self, version):
+        """С какой базы (реплика ли) читали версию и страницу"""
+        reads = []
+
+        def version_func(request):
+            reads.append(routers._read_from_replica.get())
+            return version
+
+        @use_replica
+        @page_condition(version_func)
+        def view(request):
+            reads.append(routers._read_from_replica.get())
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view(request)
+        return reads
+
+    def test_versioned_page_is_read_from_primary(self):
+        self.assertEqual(self._reads((1, None)), [False, False])
+
+    def test_page_without_version_may_use_replica(self):
+        self.assertEqual(self._reads(None), [False, True])
+
+
+@override_settings(JOBS_WORKER_THREADS=0)
+class JobDedupeTests(TestCase):
+    def setUp(self):
+        generate(users=1, processes=1, steps=2, vulnerabilities=2, templates=2)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+        self.process = BusinessProcess.objects.get(owner=self.user)
+
+    def test_active_job_is_reused(self):
+        job, created = enqueue_autoscan(self.process, self.user)
+        self.assertTrue(created)
+        self.assertEqual(enqueue_autoscan(self.process, self.user), (job, False))
+
+    def test_lost_queued_job_does_not_block_new_ones(self):
+        job, _ = enqueue_autoscan(self.process, self.user)
+        Job.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        new_job, created = enqueue_autoscan(self.process, self.user)
+        self.assertTrue(created)
+        self.assertNotEqual(new_job.pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def _running_job(self, started, heartbeat):
+        job, _ = enqueue_autoscan(self.process, self.user)
+        claim_job(job.pk)
+        now = timezone.now()
+        Job.objects.filter(pk=job.pk).update(started_at=now - started, heartbeat_at=now - heartbeat)
+        return job
+
+    def test_long_running_job_with_heartbeat_is_not_stale(self):
+        job = self._running_job(started=timedelta(hours=2), heartbeat=timedelta(seconds=10))
+        self.assertEqual(enqueue_autoscan(self.process, self.user), (job, False))
+
+    def test_job_without_heartbeat_is_stale(self):
+        job = self._running_job(started=timedelta(hours=2), heartbeat=timedelta(hours=1))
+        new_job, created = enqueue_autoscan(self.process, self.user)
+        self.assertTrue(created)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_outcome_does_not_overwrite_stale_job(self):
+        job, _ = enqueue_autoscan(self.process, self.user)
+        job = claim_job(job.pk)
+        Job.objects.filter(pk=job.pk).update(status='failed', error='Задача прервана')
+        self.assertEqual(run_job(job=job).status, 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Задача прервана'))
+
+
+class RollupLockTests(TestCase):
+    def setUp(self):
+        generate(users=1, processes=1, steps=2, vulnerabilities=5, templates=5)
+        self.user = get_user_model().objects.get(username='synthetic_0')
+        self.vulnerability = Vulnerability.objects.exclude(status='closed').first()
+
+    def _vulnerability_selects(self, queries):
+        return [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and 'FROM "core_vulnerability"' in query['sql']
+        ]
+
+    def test_unchanged_row_is_not_read_again(self):
+        self.vulnerability.status = 'closed'
+        with CaptureQueriesContext(connection) as queries:
+            self.vulnerability.save()
+        self.assertEqual(self._vulnerability_selects(queries), [])
+        self.assertEqual(rebuild_rollups(owner=self.user), 0)
+
+    def test_row_changed_by_another_request_is_read_again(self):
+        other = Vulnerability.objects.get(pk=self.vulnerability.pk)
+        other.severity = other.severity % 5 + 1
+        other.save()
+        self.vulnerability.status = 'closed'
+        with CaptureQueriesContext(connection) as queries:
+            self.vulnerability.save()
+        self.assertEqual(len(self._vulnerability_selects(queries)), 1)
+        self.assertEqual(rebuild_rollups(owner=self.user), 0)
+
+
+class FilterParamsTests(TestCase):
+    def test_int_param(self):
+        cases = {'12': 12, '0': 0, '': None, '²': None, '-1': None, '1.5': None, ' 1': None, str(2 ** 63): None}
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(int_param({'process': value}, 'process'), expected)
+
+    def test_list_ignores_malformed_process(self):
+        generate(users=1, processes=1, steps=1, vulnerabilities=1, templates=1)
+        self.client.force_login(get_user_model().objects.get(username='synthetic_0'))
+        response = self.client.get(reverse('core:vulnerability_list'), {'process': '²'})
+        self.assertEqual(response.status_code, 200)
@@ -21,7 +21,9 @@ urlpatterns = [
 
     # Уязвимости (список и детали)
     path('vulnerabilities/', views.vulnerability_list, name='vulnerability_list'),
+    path('vulnerabilities/bulk/', views.vulnerability_bulk_update, name='vulnerability_bulk'),
     path('vulnerabilities/<int:pk>/', views.vulnerability_detail, name='vulnerability_detail'),
+    path('vulnerabilities/<int:pk>/history/', views.vulnerability_history, name='vulnerability_history'),
     
     # === ВАЖНО: Маршруты для создания/редактирования/удаления уязвимостей ===
     # Обрати внимание: create принимает process_pk!
@@ -29,6 +31,9 @@ urlpatterns = [
     path('vulnerability/<int:pk>/edit/', views.vulnerability_edit, name='vulnerability_edit'),
     path('vulnerabilities/<int:pk>/delete/', views.vulnerability_delete, name='vulnerability_delete'),
 
+    # Поиск
+    path('search/', views.search_view, name='search'),
+
     # Рекомендации и профиль
     path('recommendations/', views.recommendations_view, name='recommendations'),
     path('vulnerabilities/<int:vulnerability_pk>/recommendation/add/', views.add_recommendation, name='add_recommendation'),
@@ -36,4 +41,14 @@ urlpatterns = [
      
     # Автоскан
     path('processes/<int:pk>/autoscan/', views.process_auto_scan, name='process_autoscan'),
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
+
+    # Импорт
+    path('import/', views.import_view, name='import'),
+
+    # Выгрузки
+    path('exports/', views.exports_view, name='exports'),
+    path('exports/start/', views.export_start, name='export_start'),
+    path('exports/<int:pk>/download/', views.export_download, name='export_download'),
+    path('exports/<slug:dataset>/', views.export_view, name='export'),
 ]
\ No newline at end of file
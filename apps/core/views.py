@@ -1,26 +1,89 @@
-﻿from django.shortcuts import render, redirect, get_object_or_404
+﻿import uuid
+from collections import Counter
+
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Count
+from django.db import router
+from django.db.models import Count, F, Max, OuterRef, Subquery
 from django.forms import modelformset_factory
-from .models import BusinessProcess, Vulnerability, Recommendation, AuditLog, ProcessStep
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme, urlencode
+from django.views.decorators.http import require_POST
+from .models import BusinessProcess, Vulnerability, Recommendation, AuditLog, ProcessStep, Job
 from .forms import (
     BusinessProcessForm,
     VulnerabilityForm,
     VulnerabilityStatusForm,
     RecommendationForm,
     ProcessStepForm,
+    ImportForm,
+    VulnerabilityBulkForm,
 )
-from .services import auto_scan_process
+from .jobs import enqueue_autoscan, enqueue_export, enqueue_import, export_path
+from .rollups import rollup_stats, top_risk_processes
+from .caching import dashboard_version, get_dashboard_context
+from .conditional import last_change, page_condition, row_versions
+from .services import BULK_UPDATE_MAX, BulkActionError, bulk_update_vulnerabilities
+from .pagination import InvalidCursor, KeysetPaginator
+from .filters import apply_vulnerability_filters, parse_vulnerability_filters
+from .routers import use_primary, use_replica
+from . import audit, exports, importer, search
+
+
+# Версии страниц для условных GET (см. conditional.py). Изменения процессов,
+# уязвимостей и рекомендаций увеличивают счетчик владельца в БД (OwnerVersion,
+# он же версия кеша дашборда); шаги его не меняют, поэтому страницы с шагами
+# учитывают их отдельно. Страница с версией читается с основной базы, use_replica
+# действует только для ответов без версии.
+
+def _owner_version(request):
+    return dashboard_version(request.user.pk), None
+
+
+def _owner_and_steps_version(request):
+    steps = ProcessStep.objects.filter(business_process__owner=request.user).aggregate(
+        changed=Max('updated_at'), count=Count('pk'))
+    return (dashboard_version(request.user.pk), steps), None
+
+
+def _process_versions(request, pk, **related):
+    return row_versions(
+        BusinessProcess.objects.filter(pk=pk, owner=request.user),
+        vulnerabilities=Vulnerability.objects.filter(business_process=OuterRef('pk')),
+        steps=ProcessStep.objects.filter(business_process=OuterRef('pk')),
+        **related,
+    )
 
 
+def _process_version(request, pk):
+    versions = _process_versions(request, pk)
+    # Нет процесса - представление само ответит 404
+    return versions and (versions, last_change(versions))
 
 
-from .models import BusinessProcess, Vulnerability, Recommendation, AuditLog
-from .forms import (
-    BusinessProcessForm, VulnerabilityForm,
-    VulnerabilityStatusForm, RecommendationForm
-)
+def _decomposition_version(request, pk):
+    # Результат завершенной задачи показывается сообщением - такую страницу рендерим
+    if request.GET.get('job'):
+        return None
+    versions = _process_versions(
+        request, pk,
+        active_job=Subquery(Job.objects.filter(
+            business_process=OuterRef('pk'), kind='autoscan', status__in=Job.ACTIVE_STATUSES
+        ).values('pk')[:1]),
+    )
+    return versions and (versions, last_change(versions))
+
+
+def _vulnerability_version(request, pk):
+    versions = row_versions(
+        Vulnerability.objects.filter(pk=pk, business_process__owner=request.user),
+        process_changed=F('business_process__updated_at'),
+        recommendations=Recommendation.objects.filter(vulnerability=OuterRef('pk')),
+    )
+    return versions and (versions, last_change(versions))
 
 
 def home_view(request):
@@ -31,50 +94,69 @@ def home_view(request):
 
 
 @login_required
+@use_replica
+@page_condition(_owner_version)
 def dashboard_view(request):
     """Главный дашборд с аналитикой"""
     processes = BusinessProcess.objects.filter(owner=request.user)
-    vulnerabilities = Vulnerability.objects.filter(business_process__owner=request.user)
     
+    # Вычисленная часть контекста кешируется на пользователя и сбрасывается
+    # сигналами при изменении процессов, уязвимостей и рекомендаций.
+    # Кешируемое считаем по основной базе: отставшая реплика не должна
+    # попасть в кеш под новой версией
+    def build():
+        with use_primary():
+            return _build_dashboard_context(request.user, processes)
+
+    context = dict(get_dashboard_context(request.user, build))
+    context['recent_processes'] = processes[:5]
+    return render(request, 'core/dashboard.html', context)
+
+
+def _build_dashboard_context(user, processes):
+    # Все счетчики по серьезности и статусам - из сводной таблицы (не более 20 строк)
+    all_stats = rollup_stats(owner=user)
     stats = {
-        'total': vulnerabilities.count(),
-        'high': vulnerabilities.filter(severity__gte=4).count(),
-        'medium': vulnerabilities.filter(severity=3).count(),
-        'resolved': vulnerabilities.filter(status='resolved').count(),
+        'total': all_stats['total'],
+        'high': all_stats['critical'] + all_stats['high'],
+        'medium': all_stats['medium'],
+        'resolved': all_stats['resolved'],
     }
-
-    status_counts = vulnerabilities.values('status').annotate(count=Count('id'))
-    status_dict = {item['status']: item['count'] for item in status_counts}
     
-    sorted_processes = sorted(processes, key=lambda p: p.risk_score, reverse=True)[:5]
-    risk_chart_labels = [p.name for p in sorted_processes]
-    risk_chart_data = [p.risk_score for p in sorted_processes]
+    top_processes = top_risk_processes(user, limit=5)
+    risk_chart_labels = [name for name, _ in top_processes]
+    risk_chart_data = [risk for _, risk in top_processes]
 
-    context = {
+    return {
         'stats': stats,
         'processes_count': processes.count(),
-        'recent_processes': processes[:5],
         'risk_chart_labels': risk_chart_labels,
         'risk_chart_data': risk_chart_data,
-        'status_chart_open': status_dict.get('open', 0),
-        'status_chart_in_progress': status_dict.get('in_progress', 0),
-        'status_chart_resolved': status_dict.get('resolved', 0),
-        'status_chart_closed': status_dict.get('closed', 0),
+        'status_chart_open': all_stats['open'],
+        'status_chart_in_progress': all_stats['in_progress'],
+        'status_chart_resolved': all_stats['resolved'],
+        'status_chart_closed': all_stats['closed'],
     }
-    return render(request, 'core/dashboard.html', context)
 
 @login_required
+@use_replica
+@page_condition(_owner_version)
 def business_process_list(request):
     """Список всех процессов пользователя"""
-    processes = BusinessProcess.objects.filter(owner=request.user)
+    processes = BusinessProcess.objects.filter(owner=request.user).with_risk()
     
     show_inactive = request.GET.get('show_inactive') == 'true'
     if not show_inactive:
         processes = processes.filter(is_active=True)
     
+    sort = request.GET.get('sort')
+    if sort == 'risk':
+        processes = processes.order_by_risk()
+    
     context = {
         'processes': processes,
         'show_inactive': show_inactive,
+        'sort': sort,
     }
     return render(request, 'core/business_process_list.html', context)
 
@@ -97,28 +179,6 @@ def business_process_create(request):
     return render(request, 'core/business_process_form.html', context)
 
 
-@login_required
-def business_process_detail(request, pk):
-    """Детали процесса с его уязвимостями"""
-    process = get_object_or_404(BusinessProcess, pk=pk, owner=request.user)
-    vulnerabilities = process.vulnerabilities.all()
-    
-    stats = {
-        'total': vulnerabilities.count(),
-        'critical': vulnerabilities.filter(severity=5).count(),
-        'high': vulnerabilities.filter(severity=4).count(),
-        'open': vulnerabilities.filter(status='open').count(),
-        'resolved': vulnerabilities.filter(status='resolved').count(),
-    }
-
-    context = {
-        'process': process,
-        'vulnerabilities': vulnerabilities,
-        'stats': stats,
-    }
-    return render(request, 'core/business_process_detail.html', context)
-
-
 @login_required
 def business_process_edit(request, pk):
     """Редактирование процесса"""
@@ -153,73 +213,100 @@ def business_process_delete(request, pk):
 
 
 @login_required
+@use_replica
+@page_condition(_owner_and_steps_version)
 def vulnerability_list(request):
-    """Список всех уязвимостей пользователя"""
+    """Список всех уязвимостей пользователя (постранично, по курсору)"""
     vulnerabilities = Vulnerability.objects.filter(
         business_process__owner=request.user
+    ).select_related('business_process', 'step').annotate(
+        recommendation_count=Count('recommendations')
     )
     
-    status_filter = request.GET.get('status')
-    if status_filter:
-        vulnerabilities = vulnerabilities.filter(status=status_filter)
+    filters = parse_vulnerability_filters(request.GET)
+    vulnerabilities = apply_vulnerability_filters(vulnerabilities, filters)
+    
+    paginator = KeysetPaginator(vulnerabilities, Vulnerability._meta.ordering, per_page=PAGE_SIZE)
+    page = _keyset_page(paginator, request)
     
     context = {
-        'vulnerabilities': vulnerabilities,
-        'status_filter': status_filter,
+        'vulnerabilities': page,
+        'page': page,
+        'status_filter': filters['status'],
+        'filters': filters,
+        'filter_query': _filter_query(filters),
+        **_filter_choices(request.user, filters),
     }
     return render(request, 'core/vulnerability_list.html', context)
 
 
 @login_required
-def vulnerability_detail(request, pk):
-    """Детали уязвимости с историей и рекомендациями"""
-    vulnerability = get_object_or_404(
-        Vulnerability,
-        pk=pk,
-        business_process__owner=request.user
-    )
-    recommendations = vulnerability.recommendations.all()
-    audit_logs = vulnerability.audit_logs.all()
-
-    if request.method == 'POST':
-        form = VulnerabilityStatusForm(request.POST, instance=vulnerability)
-        if form.is_valid():
-            old_status = vulnerability.status
-            old_assigned = vulnerability.assigned_to
-            
-            vulnerability = form.save()
-            
-            if old_status != vulnerability.status:
-                AuditLog.objects.create(
-                    vulnerability=vulnerability,
-                    user=request.user,
-                    action='status_changed',
-                    old_value=old_status,
-                    new_value=vulnerability.status
-                )
-                messages.success(request, f"Статус изменен на '{vulnerability.get_status_display()}'")
-            
-            if old_assigned != vulnerability.assigned_to:
-                AuditLog.objects.create(
-                    vulnerability=vulnerability,
-                    user=request.user,
-                    action='assigned',
-                    old_value=str(old_assigned),
-                    new_value=str(vulnerability.assigned_to)
-                )
-                messages.success(request, "Назначение обновлено")
-            
-            return redirect('core:vulnerability_detail', pk=pk)
+@require_POST
+def vulnerability_bulk_update(request):
+    """Массовая смена статуса, серьезности или шага у выбранных уязвимостей"""
+    # Префикс: поля формы не пересекаются с параметрами фильтра списка (status, severity, step)
+    form = VulnerabilityBulkForm(request.POST, user=request.user, prefix='bulk')
+    next_url = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse('core:vulnerability_list')
+
+    if not form.is_valid():
+        errors = [error for field_errors in form.errors.values() for error in field_errors]
+        messages.error(request, ' '.join(errors))
+        return redirect(next_url)
+
+    ids = form.cleaned_data['ids']
+    if form.cleaned_data['select_all']:
+        # Все уязвимости под текущим фильтром списка, а не только видимые на странице
+        vulnerabilities = apply_vulnerability_filters(
+            Vulnerability.objects.filter(business_process__owner=request.user),
+            parse_vulnerability_filters(request.POST),
+        )
+        ids = list(vulnerabilities.order_by('pk').values_list('pk', flat=True)[:BULK_UPDATE_MAX + 1])
+
+    try:
+        changed = bulk_update_vulnerabilities(request.user, ids, form.changes())
+    except BulkActionError as exc:
+        messages.error(request, str(exc))
     else:
-        form = VulnerabilityStatusForm(instance=vulnerability)
-
-    context = {
-        'vulnerability': vulnerability,
-        'recommendations': recommendations,
-        'audit_logs': audit_logs,
-        'form': form,
+        messages.success(request, f'Изменено уязвимостей: {changed} из {len(ids)}')
+    return redirect(next_url)
+
+
+# Размер страницы в списках уязвимостей и рекомендаций
+PAGE_SIZE = 50
+# Сколько записей истории показывать на странице уязвимости
+VULNERABILITY_HISTORY_PREVIEW = 20
+
+
+def _filter_query(filters, **extra):
+    """Строка GET-параметров фильтров (без курсора) для ссылок страниц"""
+    params = {key: value for key, value in {**filters, **extra}.items() if value not in (None, '', False)}
+    return urlencode(params)
+
+
+def _filter_choices(user, filters):
+    """Варианты для выпадающих списков фильтров"""
+    processes = BusinessProcess.objects.filter(owner=user).only('pk', 'name').order_by('name')
+    steps = ProcessStep.objects.none()
+    if filters['process']:
+        steps = ProcessStep.objects.filter(
+            business_process_id=filters['process'],
+            business_process__owner=user
+        ).only('pk', 'name')
+    return {
+        'filter_processes': processes,
+        'filter_steps': steps,
+        'severity_choices': Vulnerability.SEVERITY_CHOICES,
+        'status_choices': Vulnerability.STATUS_CHOICES,
     }
-    return render(request, 'core/vulnerability_detail.html', context)
+
+
+def _keyset_page(paginator, request):
+    try:
+        return paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return paginator.page()
 
 
 @login_required
@@ -250,19 +337,31 @@ def add_recommendation(request, vulnerability_pk):
 
 
 @login_required
+@use_replica
+@page_condition(_owner_and_steps_version)
 def recommendations_view(request):
-    """Список всех рекомендаций"""
+    """Список всех рекомендаций (постранично, по курсору)"""
     recommendations = Recommendation.objects.filter(
         vulnerability__business_process__owner=request.user
-    )
+    ).select_related('vulnerability')
     
     show_implemented = request.GET.get('show_implemented') == 'true'
     if not show_implemented:
         recommendations = recommendations.filter(is_implemented=False)
     
+    filters = parse_vulnerability_filters(request.GET)
+    recommendations = apply_vulnerability_filters(recommendations, filters, prefix='vulnerability__')
+    
+    paginator = KeysetPaginator(recommendations, Recommendation._meta.ordering, per_page=PAGE_SIZE)
+    page = _keyset_page(paginator, request)
+    
     context = {
-        'recommendations': recommendations,
+        'recommendations': page,
+        'page': page,
         'show_implemented': show_implemented,
+        'filters': filters,
+        'filter_query': _filter_query(filters, show_implemented='true' if show_implemented else ''),
+        **_filter_choices(request.user, filters),
     }
     return render(request, 'core/recommendations.html', context)
 
@@ -300,22 +399,50 @@ def vulnerability_create(request, process_pk):
     })
 
 @login_required
+@page_condition(_decomposition_version)
 def process_decomposition(request, pk):
     """Декомпозиция процесса с визуализацией уязвимостей и шагов"""
     process = get_object_or_404(BusinessProcess, pk=pk, owner=request.user)
-    vulnerabilities = Vulnerability.objects.filter(business_process=process)
-    steps = process.steps.all().order_by('order')  # Загружаем шаги
+    steps = list(process.steps.all().order_by('order'))  # Загружаем шаги
+    vulnerabilities = list(Vulnerability.objects.filter(business_process=process))
+    
+    # Раскладываем уязвимости по шагам и считаем статистику в памяти:
+    # шаблон не делает запросов на каждый шаг и каждую строку
+    steps_by_id = {step.pk: step for step in steps}
+    for step in steps:
+        step.step_vulnerabilities = []
+    severity_counts = Counter()
+    for vuln in vulnerabilities:
+        step = steps_by_id.get(vuln.step_id)
+        Vulnerability.step.field.set_cached_value(vuln, step)
+        if step is not None:
+            step.step_vulnerabilities.append(vuln)
+        severity_counts[vuln.severity] += 1
     
     # Статистика
-    critical_count = vulnerabilities.filter(severity=5).count()
-    high_count = vulnerabilities.filter(severity=4).count()
-    medium_count = vulnerabilities.filter(severity=3).count()
-    low_count = vulnerabilities.filter(severity__lte=2).count()
+    critical_count = severity_counts[5]
+    high_count = severity_counts[4]
+    medium_count = severity_counts[3]
+    low_count = severity_counts[2] + severity_counts[1]
+    
+    # Фоновый автоскан: активная задача опрашивается со страницы,
+    # по завершении показываем ее результат
+    active_job = process.jobs.filter(kind='autoscan', status__in=Job.ACTIVE_STATUSES).first()
+    finished_job_id = request.GET.get('job')
+    if not active_job and finished_job_id and finished_job_id.isdecimal():
+        finished_job = process.jobs.filter(pk=finished_job_id, owner=request.user, status__in=['done', 'failed']).first()
+        if finished_job and finished_job.status == 'failed':
+            messages.error(request, 'Автоматический поиск завершился с ошибкой.')
+        elif finished_job and finished_job.result.get('created'):
+            messages.success(request, f"Найдено и добавлено {finished_job.result['created']} уязвимостей!")
+        elif finished_job:
+            messages.info(request, 'Автоматический поиск не нашел новых совпадений для текущих шагов.')
     
     context = {
         'process': process,
         'vulnerabilities': vulnerabilities,
         'steps': steps,  # Передаем шаги в шаблон
+        'active_job': active_job,
         'critical_count': critical_count,
         'high_count': high_count,
         'medium_count': medium_count,
@@ -352,19 +479,14 @@ def manage_process_steps(request, pk):
     })
 
 @login_required
+@page_condition(_process_version)
 def business_process_detail(request, pk):
     """Детали процесса с его уязвимостями"""
     process = get_object_or_404(BusinessProcess, pk=pk, owner=request.user)
     vulnerabilities = process.vulnerabilities.all()
     steps = process.steps.all()  
     
-    stats = {
-        'total': vulnerabilities.count(),
-        'critical': vulnerabilities.filter(severity=5).count(),
-        'high': vulnerabilities.filter(severity=4).count(),
-        'open': vulnerabilities.filter(status='open').count(),
-        'resolved': vulnerabilities.filter(status='resolved').count(),
-    }
+    stats = rollup_stats(process=process)
 
     context = {
         'process': process,
@@ -375,6 +497,7 @@ def business_process_detail(request, pk):
     return render(request, 'core/business_process_detail.html', context)
 
 @login_required
+@page_condition(_vulnerability_version)
 def vulnerability_detail(request, pk):
     """Детали уязвимости + смена статуса"""
     vulnerability = get_object_or_404(
@@ -385,33 +508,49 @@ def vulnerability_detail(request, pk):
     
     # Обработка смены статуса
     if request.method == 'POST':
+        # is_valid() уже переносит новые значения в instance - старый статус запоминаем до него
+        old_status = vulnerability.status
         form = VulnerabilityStatusForm(request.POST, instance=vulnerability)
         if form.is_valid():
-            old_status = vulnerability.status
+            # Запись в журнал делает сигнал post_save (см. audit.py)
             vulnerability = form.save()
-            
-            # Пишем лог, если статус изменился
             if old_status != vulnerability.status:
-                AuditLog.objects.create(
-                    vulnerability=vulnerability,
-                    user=request.user,
-                    action='status_changed',
-                    old_value=old_status,
-                    new_value=vulnerability.status
-                )
                 messages.success(request, f"Статус обновлен на '{vulnerability.get_status_display()}'")
             return redirect('core:vulnerability_detail', pk=pk)
     else:
         form = VulnerabilityStatusForm(instance=vulnerability)
 
+    # На странице - только последние записи, полная история (с архивом) - отдельно
+    history = audit.history(vulnerability.pk, per_page=VULNERABILITY_HISTORY_PREVIEW)
     context = {
         'vulnerability': vulnerability,
         'form': form, # Передаем форму в шаблон
         'recommendations': vulnerability.recommendations.all(),
-        'audit_logs': vulnerability.audit_logs.all(),
+        'audit_logs': history,
     }
     return render(request, 'core/vulnerability_detail.html', context)
 
+
+@login_required
+@use_replica
+def vulnerability_history(request, pk):
+    """Полная история изменений уязвимости: живой журнал и архив, страницами по курсору"""
+    vulnerability = get_object_or_404(
+        Vulnerability.objects.select_related('business_process'),
+        pk=pk,
+        business_process__owner=request.user
+    )
+    try:
+        page = audit.history(vulnerability.pk, request.GET.get('cursor'))
+    except InvalidCursor:
+        page = audit.history(vulnerability.pk)
+
+    context = {
+        'vulnerability': vulnerability,
+        'page': page,
+    }
+    return render(request, 'core/vulnerability_history.html', context)
+
 @login_required
 def vulnerability_delete(request, pk):
     """Удаление уязвимости"""
@@ -445,20 +584,195 @@ def vulnerability_edit(request, pk):
     })
 
 @login_required
+@require_POST
 def process_auto_scan(request, pk):
+    """Ставит автоскан процесса в фоновую очередь"""
     process = get_object_or_404(BusinessProcess, pk=pk, owner=request.user)
     
-    # Запускаем сканер
-    new_vulns = auto_scan_process(process)
+    # full=1 - пересканировать все шаги, а не только измененные
+    full = request.POST.get('full') == '1'
+    job, created = enqueue_autoscan(process, request.user, full=full)
+    
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse(_job_payload(job), status=202)
     
-    if new_vulns:
-        messages.success(request, f'Найдено и добавлено {len(new_vulns)} уязвимостей!')
+    if created:
+        messages.info(request, 'Автоматический поиск уязвимостей запущен.')
     else:
-        messages.info(request, 'Автоматический поиск не нашел новых совпадений для текущих шагов.')
-        
-    return redirect('core:process_decomposition', pk=pk)
+        messages.info(request, 'Автоматический поиск для этого процесса уже выполняется.')
+    
+    return redirect(f"{reverse('core:process_decomposition', args=[pk])}?job={job.pk}")
+
+
+@login_required
+def job_status(request, pk):
+    """Состояние фоновой задачи (для опроса со страницы)"""
+    job = get_object_or_404(Job, pk=pk, owner=request.user)
+    return JsonResponse(_job_payload(job))
+
+
+def _job_payload(job):
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'progress_percent': job.progress_percent,
+        'result': job.result,
+        'error': job.error,
+        'status_url': reverse('core:job_status', args=[job.pk]),
+        'download_url': (
+            reverse('core:export_download', args=[job.pk])
+            if job.kind == 'export' and job.status == 'done' else None
+        ),
+    }
+
+
+def _export_request(request, params):
+    """Набор данных, формат и фильтры выгрузки из параметров запроса"""
+    dataset = params.get('dataset', '')
+    if dataset not in exports.DATASETS:
+        raise Http404('Неизвестный набор данных')
+    fmt = params.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        fmt = 'csv'
+    filters = parse_vulnerability_filters(params)
+    if dataset == 'recommendations':
+        filters['show_implemented'] = params.get('show_implemented') == 'true'
+    return dataset, fmt, filters
+
+
+@login_required
+@use_replica
+def export_view(request, dataset):
+    """
+    Потоковая выгрузка с фильтрами списков. Слишком большие выгрузки
+    не отдаются сразу, а предлагаются к подготовке фоновой задачей.
+    """
+    dataset, fmt, filters = _export_request(request, {**request.GET.dict(), 'dataset': dataset})
+    # База выбирается здесь: генератор дочитывает строки уже после выхода из представления
+    using = router.db_for_read(Vulnerability)
+    total = exports.export_queryset(dataset, request.user, filters, using=using).count()
+    if total > settings.EXPORT_STREAM_MAX_ROWS:
+        messages.warning(
+            request,
+            f'В выгрузке {total} строк - она будет подготовлена в фоне, файл появится в списке выгрузок.'
+        )
+        pending = {
+            'dataset': dataset,
+            'format': fmt,
+            'fields': [(key, value) for key, value in request.GET.items() if key not in ('dataset', 'format')],
+        }
+        return exports_view(request, pending=pending)
+
+    response = StreamingHttpResponse(
+        exports.stream_export(dataset, fmt, request.user, filters, using=using),
+        content_type=exports.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.export_filename(dataset, fmt)}"'
+    return response
+
+
+@login_required
+@require_POST
+def export_start(request):
+    """Ставит выгрузку в файл в очередь фоновых задач"""
+    dataset, fmt, filters = _export_request(request, request.POST)
+    job, created = enqueue_export(request.user, dataset, fmt, filters)
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse(_job_payload(job), status=202)
+    if created:
+        messages.info(request, 'Выгрузка поставлена в очередь.')
+    else:
+        messages.info(request, 'Такая выгрузка уже готовится.')
+    return redirect('core:exports')
+
+
+@login_required
+def exports_view(request, pending=None):
+    """Фоновые выгрузки пользователя"""
+    jobs = Job.objects.filter(owner=request.user, kind='export')[:20]
+    context = {
+        'jobs': jobs,
+        'pending': pending,
+        'has_active': any(job.is_active for job in jobs),
+    }
+    return render(request, 'core/exports.html', context)
+
+
+@login_required
+def export_download(request, pk):
+    """Скачивание файла, подготовленного фоновой выгрузкой"""
+    job = get_object_or_404(Job, pk=pk, owner=request.user, kind='export', status='done')
+    path = export_path(job)
+    if not path.exists():
+        raise Http404('Файл выгрузки удален по сроку хранения')
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=job.result.get('filename', path.name),
+        content_type=exports.FORMATS[job.params['format']],
+    )
+
+
+@login_required
+def import_view(request):
+    """Загрузка файла для массового импорта; сам импорт выполняется фоновой задачей"""
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            settings.IMPORTS_ROOT.mkdir(parents=True, exist_ok=True)
+            path = settings.IMPORTS_ROOT / f'{uuid.uuid4().hex}.{form.format}'
+            with open(path, 'wb') as destination:
+                for chunk in form.cleaned_data['file'].chunks():
+                    destination.write(chunk)
+            enqueue_import(request.user, path, form.format, autoscan=form.cleaned_data['autoscan'])
+            messages.info(request, 'Файл загружен, импорт выполняется в фоне.')
+            return redirect('core:import')
+    else:
+        form = ImportForm()
 
+    jobs = Job.objects.filter(owner=request.user, kind='import')[:10]
+    context = {
+        'form': form,
+        'jobs': jobs,
+        'columns': importer.COLUMNS,
+        'has_active': any(job.is_active for job in jobs),
+    }
+    return render(request, 'core/import.html', context)
 
 
+# Поиск: результатов на странице и предел глубины выдачи
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50
 
 
+@login_required
+@use_replica
+def search_view(request):
+    """Полнотекстовый поиск по уязвимостям, рекомендациям и банку шаблонов"""
+    query = request.GET.get('q', '').strip()[:200]
+    kind = request.GET.get('kind', '')
+    kinds = [kind] if kind in search.KIND_CODES else None
+    try:
+        page_number = min(max(int(request.GET.get('page', 1)), 1), SEARCH_MAX_PAGE)
+    except ValueError:
+        page_number = 1
+
+    page = search.search(request.user, query, kinds=kinds, page=page_number, per_page=SEARCH_PAGE_SIZE) if query else None
+
+    context = {
+        'query': query,
+        'kind': kind if kinds else '',
+        'kind_choices': [
+            ('vulnerability', 'Уязвимости'),
+            ('recommendation', 'Рекомендации'),
+            ('template', 'Банк шаблонов'),
+        ],
+        'page': page,
+        'filter_query': urlencode({'q': query, 'kind': kind if kinds else ''}),
+        'has_more_pages': page is not None and page.has_next and page_number < SEARCH_MAX_PAGE,
+    }
+    return render(request, 'core/search.html', context)
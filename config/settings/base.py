@@ -1,6 +1,9 @@
 from pathlib import Path
 from decouple import config
 import os
+import tempfile
+
+from config.database import parse_database_url
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
@@ -20,6 +23,7 @@ INSTALLED_APPS = [
     'apps.core',
     'apps.authentication',
     'apps.admin_panel',
+    'apps.api',
 ]
 
 
@@ -32,6 +36,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.core.audit.AuditBufferMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -54,14 +59,57 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
-# Database - используем SQLite вместо PostgreSQL
+# Database - по умолчанию SQLite; в production - DATABASE_URL=postgres://...
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+    'default': parse_database_url(config('DATABASE_URL', default='sqlite:///db.sqlite3'), BASE_DIR),
+}
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Тестовая база SQLite - файловая, а не in-memory: блокировки при
+    # параллельной записи (WAL, busy_timeout) такие же, как в рабочем режиме.
+    # PID в имени: параллельные запуски тестов и файл после упавшего запуска не мешают друг другу
+    DATABASES['default']['TEST'] = {
+        'NAME': config(
+            'TEST_DATABASE_NAME',
+            default=os.path.join(tempfile.gettempdir(), f'riskmap-test-{os.getpid()}.sqlite3'),
+        ),
     }
+
+# Реплика только для чтения: тяжелые страницы отчетов (дашборд, списки) читают с нее.
+# Локально можно проверить на двух файлах SQLite (см. manage.py sync_replica)
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = parse_database_url(DATABASE_REPLICA_URL, BASE_DIR)
+    # В тестах реплика - та же база, что и основная
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['apps.core.routers.ReplicaRouter']
+    MIDDLEWARE.append('apps.core.middleware.ReplicaPinningMiddleware')
+
+for _database in DATABASES.values():
+    # Соединение живет между запросами; перед повторным использованием проверяется
+    _database['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+    _database['CONN_HEALTH_CHECKS'] = True
+
+# Сколько секунд после изменяющего запроса (POST и т.п.) пользователь читает
+# только с основной базы: после редиректа он видит свои изменения
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# PRAGMA для каждого нового соединения с SQLite (apps.core.db).
+# WAL позволяет читать во время записи; synchronous=NORMAL в режиме WAL
+# не рискует целостностью базы, но быстрее FULL.
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='normal'),
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),  # мс
+    'cache_size': config('SQLITE_CACHE_SIZE', default=-20000, cast=int),  # отрицательное значение - в КиБ
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=128 * 1024 * 1024, cast=int),
+    'temp_store': config('SQLITE_TEMP_STORE', default='memory'),
 }
 
+# Повтор записи при "database is locked": число попыток и пауза в секундах
+DB_LOCK_RETRY_ATTEMPTS = config('DB_LOCK_RETRY_ATTEMPTS', default=5, cast=int)
+DB_LOCK_RETRY_BASE_DELAY = config('DB_LOCK_RETRY_BASE_DELAY', default=0.05, cast=float)
+DB_LOCK_RETRY_MAX_DELAY = config('DB_LOCK_RETRY_MAX_DELAY', default=1.0, cast=float)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -114,6 +162,70 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@riskmap.com')
 
+# Кеш (дашборд и др.): locmem - в памяти процесса, file - общий для всех воркеров.
+# Сброс кеша дашборда работает и с locmem: версия данных владельца хранится
+# в БД (OwnerVersion), общий кеш лишь уменьшает число промахов
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'riskmap',
+        }
+    }
+
+# Кеш дашборда сбрасывается сигналами; TTL - лишь страховка, сек.
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=600, cast=int)
+
+# Входит в ETag страниц (apps.core.conditional): меняйте при выкладке новых
+# шаблонов, иначе браузер получит 304 и покажет старую разметку
+PAGE_VERSION = config('PAGE_VERSION', default='')
+
+# Фоновые задачи (автоскан): число потоков встроенного исполнителя.
+# 0 - задачи только ставятся в очередь и выполняются командой `manage.py run_jobs`
+JOBS_WORKER_THREADS = config('JOBS_WORKER_THREADS', default=2, cast=int)
+# Через сколько секунд задача считается зависшей: в очереди - с постановки,
+# в работе - с последнего отчета о ходе работы
+JOBS_STALE_SECONDS = config('JOBS_STALE_SECONDS', default=1800, cast=int)
+
+# Выгрузки: до скольких строк отдавать файл потоком сразу, а больше - фоновой задачей
+EXPORT_STREAM_MAX_ROWS = config('EXPORT_STREAM_MAX_ROWS', default=200000, cast=int)
+# Каталог файлов, подготовленных фоновыми выгрузками, и срок их хранения, ч.
+EXPORTS_ROOT = Path(config('EXPORTS_ROOT', default=str(BASE_DIR / 'exports')))
+EXPORT_FILE_TTL_HOURS = config('EXPORT_FILE_TTL_HOURS', default=24, cast=int)
+
+# Импорт процессов из файлов: каталог загруженных файлов (удаляются после импорта)
+# и предельный размер файла, МБ
+IMPORTS_ROOT = Path(config('IMPORTS_ROOT', default=str(BASE_DIR / 'imports')))
+IMPORT_MAX_UPLOAD_MB = config('IMPORT_MAX_UPLOAD_MB', default=50, cast=int)
+
+# Журнал аудита: сколько дней записи хранятся в таблице (старше - в архив командой
+# `manage.py archive_audit_logs`), где лежат архивы и сколько дней их хранить (0 - всегда)
+AUDIT_LOG_RETENTION_DAYS = config('AUDIT_LOG_RETENTION_DAYS', default=365, cast=int)
+AUDIT_ARCHIVE_ROOT = Path(config('AUDIT_ARCHIVE_ROOT', default=str(BASE_DIR / 'audit_archive')))
+AUDIT_ARCHIVE_RETENTION_DAYS = config('AUDIT_ARCHIVE_RETENTION_DAYS', default=0, cast=int)
+
+# Профилирование запросов: число SQL, время SQL/шаблонов/ответа по именам URL.
+# Статистика - в админ-панели (admin-panel/performance/)
+RISKMAP_PROFILING = config('RISKMAP_PROFILING', default=False, cast=bool)
+# Бюджет SQL-запросов на ответ; превышение пишется в лог apps.core.profiling
+PROFILING_QUERY_BUDGET = config('PROFILING_QUERY_BUDGET', default=30, cast=int)
+# Индивидуальные бюджеты: {'core:dashboard': 10, ...}
+PROFILING_VIEW_BUDGETS = {}
+# Сколько одинаковых запросов за ответ считать признаком N+1
+PROFILING_DUPLICATE_THRESHOLD = config('PROFILING_DUPLICATE_THRESHOLD', default=5, cast=int)
+
+if RISKMAP_PROFILING:
+    MIDDLEWARE.insert(0, 'apps.core.middleware.QueryProfilingMiddleware')
+    TEMPLATES[0]['BACKEND'] = 'apps.core.profiling.ProfilingDjangoTemplates'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -8,6 +8,7 @@ urlpatterns = [
     path('', include('apps.core.urls', namespace='core')),
     path('auth/', include('apps.authentication.urls', namespace='authentication')),
     path('admin-panel/', include('apps.admin_panel.urls', namespace='admin_panel')),
+    path('api/v1/', include('apps.api.urls', namespace='api')),
 ]
 
 if settings.DEBUG: